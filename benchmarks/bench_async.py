@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_async.py: Compares pluck-to-MIDI latency of LightInstrument.run() and run_async(), with the simulated backend
+
+The same script of strums is played through both loops, in virtual time:
+* run(): one step() per virtual millisecond (a generous loop rate for the Pico)
+* run_async(): one round of tasks per virtual millisecond, polling every poll_ms
+
+Latency is measured by LoopStats, from each string's keypad release timestamp to the MIDI write carrying its note.
+
+Usage (from the repository root):
+    python benchmarks/bench_async.py
+
+Created for the Twang library.
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from twang import LightString, LightInstrument, ChordButton
+from twang.sim import SimBackend
+
+NUM_STRINGS = 6
+DURATION_MS = 5000
+
+def build(sim):
+    strings = [LightString(pin="S{}".format(i), note=40 + 5 * i) for i in range(NUM_STRINGS)]
+    chord_btns = [ChordButton(pin="B0", notes=[41 + 5 * i for i in range(NUM_STRINGS)])]
+    return LightInstrument(strings, chord_btns=chord_btns, backend=sim, stats=True)
+
+def script(sim, instrument):
+    """ A strum every 97 ms, alternating direction, with chord changes in between """
+    pins = [string.pin for string in instrument.strings]
+    start = sim.ticks_ms() + 10
+    for ix, at_ms in enumerate(range(start, start + DURATION_MS - 200, 97)):
+        sim.strum(pins if ix % 2 else pins[::-1], at_ms, spacing_ms=3 + ix % 5, duration_ms=8 + ix % 30)
+        if ix % 4 == 0:
+            sim.press("B0", at_ms + 50, duration_ms=40)
+
+def run_sync():
+    sim = SimBackend()
+    instrument = build(sim)
+    instrument.start()
+    script(sim, instrument)
+    for ms in range(DURATION_MS):
+        sim.advance(1)
+        instrument.step()
+    return instrument.stats, len(sim.midi.messages())
+
+def run_async(poll_ms):
+    sim = SimBackend()
+    instrument = build(sim)
+    script(sim, instrument)
+
+    async def main():
+        task = asyncio.create_task(instrument.run_async(poll_ms=poll_ms))
+        await sim.run_clock(DURATION_MS)
+        task.cancel()
+
+    asyncio.run(main())
+    return instrument.stats, len(sim.midi.messages())
+
+def mean_latency(stats):
+    hist = stats.latency_hist
+    total = sum(hist)
+    return sum(ms * count for ms, count in enumerate(hist)) / total if total else 0
+
+def main():
+    print("{:<20}{:>10}{:>14}{:>14}".format("loop", "messages", "mean (ms)", "max (ms)"))
+    results = [("run()", run_sync())]
+    for poll_ms in (0, 1, 2):
+        results.append(("run_async({})".format(poll_ms), run_async(poll_ms)))
+    for name, (stats, messages) in results:
+        print("{:<20}{:>10}{:>14.2f}{:>14}".format(name, messages, mean_latency(stats), stats.max_latency_ms))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_instrument.py: Benchmarks for the LightInstrument loop, run on a regular computer with the simulated backend
+
+Measures the main pieces of the instrument loop at several string counts:
+* check_and_play: handling one pluck (a press event and a release event) on a string
+* check_for_chord_change: one call with no change, and one call where a chord button changed
+* update_notes: applying a new chord to every string
+* step: a full pass of the instrument loop, while idle and while strumming every string (only step() itself is timed,
+  not the simulator queueing the strum)
+
+Usage (from the repository root):
+    python benchmarks/bench_instrument.py [repeats]
+
+Times are in microseconds per call, on this computer. They are useful for comparing changes to the code,
+not as a prediction of how fast the Pico will be.
+
+Created for the Twang library.
+"""
+
+import os
+import sys
+from time import perf_counter_ns
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from twang import LightString, LightInstrument, ChordButton
+from twang.sim import SimBackend, SimEvent
+
+STRING_COUNTS = (6, 10, 32, 64)
+NUM_CHORDS = 8
+
+def build_instrument(num_strings, sim):
+    """ An instrument with num_strings strings and NUM_CHORDS chord buttons, on the simulated backend """
+    strings = [LightString(pin="S{}".format(i), note=40 + i % 48) for i in range(num_strings)]
+    chord_btns = [ChordButton(pin="B{}".format(j), notes=[40 + (i + j + 1) % 48 for i in range(num_strings)]) for j in range(NUM_CHORDS)]
+    return LightInstrument(strings, chord_btns=chord_btns, beam_pin="BEAM", backend=sim)
+
+def time_us(fn, repeats):
+    """ Mean time of fn(), in microseconds """
+    start = perf_counter_ns()
+    for i in range(repeats):
+        fn()
+    return (perf_counter_ns() - start) / repeats / 1000
+
+def bench_check_and_play(instrument, sim, repeats):
+    string = instrument.strings[0]
+    press = SimEvent(0, pressed=True, timestamp=1000)
+    release = SimEvent(0, pressed=False, timestamp=1025)
+    def pluck():
+        string.check_and_play(press)
+        string.check_and_play(release)
+        instrument.midi.length = 0 # Discard the queued notes rather than timing the MIDI writes
+    return time_us(pluck, repeats)
+
+def bench_chord_idle(instrument, sim, repeats):
+    return time_us(instrument.check_for_chord_change, repeats)
+
+def bench_chord_change(instrument, sim, repeats):
+    pin = instrument.chord_btns[0].pin
+    state = [False]
+    def toggle():
+        state[0] = not state[0]
+        sim.set_pin(pin, state[0], sim.ticks_ms())
+        instrument.check_for_chord_change()
+    return time_us(toggle, repeats)
+
+def bench_update_notes(instrument, sim, repeats):
+    chords = instrument.chord_table.voicings[:2] # The open chord and the first button's chord, as compiled by the instrument
+    count = [0]
+    def update():
+        count[0] += 1
+        instrument.update_notes(chords[count[0] & 1])
+    return time_us(update, repeats)
+
+def bench_step_idle(instrument, sim, repeats):
+    return time_us(instrument.step, repeats)
+
+def bench_step_strum(instrument, sim, repeats):
+    """ Only step() is timed: the strum's events are queued by the simulator beforehand """
+    pins = [string.pin for string in instrument.strings]
+    elapsed_ns = 0
+    for i in range(repeats):
+        now = sim.ticks_ms()
+        for pin in pins:
+            sim.set_pin(pin, True, now)
+        for pin in pins:
+            sim.set_pin(pin, False, now + 20)
+        start = perf_counter_ns()
+        instrument.step()
+        elapsed_ns += perf_counter_ns() - start
+        sim.midi.clear()
+    return elapsed_ns / repeats / 1000
+
+BENCHMARKS = (
+    ("check_and_play", bench_check_and_play),
+    ("chord (idle)", bench_chord_idle),
+    ("chord (change)", bench_chord_change),
+    ("update_notes", bench_update_notes),
+    ("step (idle)", bench_step_idle),
+    ("step (strum)", bench_step_strum),
+)
+
+def main(repeats=2000):
+    print("Microseconds per call ({} repeats)".format(repeats))
+    print("{:<16}".format("strings") + "".join("{:>10}".format(n) for n in STRING_COUNTS))
+    results = {}
+    for num_strings in STRING_COUNTS:
+        for name, bench in BENCHMARKS:
+            sim = SimBackend()
+            instrument = build_instrument(num_strings, sim)
+            sim.midi.clear()
+            results[(name, num_strings)] = bench(instrument, sim, repeats)
+    for name, bench in BENCHMARKS:
+        print("{:<16}".format(name) + "".join("{:>10.2f}".format(results[(name, n)]) for n in STRING_COUNTS))
+    return results
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
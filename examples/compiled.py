@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+compiled.py: Run an instrument compiled from a JSON description, with no chord arithmetic at boot
+
+On the computer, compile a description (e.g. guitar_modifiers.json) and copy the result to the Pico:
+    python -m twang.config guitar_modifiers.json guitar_modifiers.twang
+The same code.py runs any compiled instrument; change INSTRUMENT to switch between them.
+"""
+
+from twang import LightInstrument
+
+INSTRUMENT = "guitar_modifiers.twang"
+
+if __name__ == "__main__":
+    myinstrument = LightInstrument.load(INSTRUMENT, debug=True)
+    myinstrument.run()
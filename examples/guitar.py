@@ -7,7 +7,7 @@ Updated March 6 2025 by Scott Feister
 """
 
 from twang import LightString, LightInstrument, ChordButton, getnote
-import ulab.numpy as np
+from twang.fretboard import Fretboard
 import board
 
 # Standard guitar tuning: E2–A2–D3–G3–B3–E4
@@ -49,15 +49,13 @@ Gm = [3,5,5,3,3,3]
 # More major chords
 B = [x,2,4,4,4,2]
 
-def shift_notes(notes, shifts):
-    """ Shift a list of notes by a number of half-steps """
-    # TODO: Check assertions
-    shifted_notes = np.array(notes, dtype=np.int16) + np.array(shifts, dtype=np.int16) # Add the shift in note onto the note itself
-    return shifted_notes
-
 if __name__ == "__main__":
     print("OPEN_NOTES (midi numbers for an open chord): {}".format(OPEN_NOTES))
 
+    # Every chord's notes, from one matrix of chord shapes (see twang/fretboard.py); myguitar.set_capo(2) moves them all up two frets
+    FRETBOARD = Fretboard(OPEN_NOTES, [Am, G, F, Em, E, Dm, D, C])
+    Am_NOTES, G_NOTES, F_NOTES, Em_NOTES, E_NOTES, Dm_NOTES, D_NOTES, C_NOTES = FRETBOARD.chords()
+
     # Phototransistor pins for strings (low-note strings first)
     STRINGS = [
         LightString(pin=board.GP16, note=OPEN_NOTES[0]),
@@ -70,16 +68,16 @@ if __name__ == "__main__":
 
     # Button pins for chords, and their associated notes
     CHORD_BTNS = [
-        ChordButton(pin=board.GP8, notes=shift_notes(OPEN_NOTES, Am)),
-        ChordButton(pin=board.GP9, notes=shift_notes(OPEN_NOTES, G)),
-        ChordButton(pin=board.GP10, notes=shift_notes(OPEN_NOTES, F)),
-        ChordButton(pin=board.GP11, notes=shift_notes(OPEN_NOTES, Em)),
-        ChordButton(pin=board.GP12, notes=shift_notes(OPEN_NOTES, E)),
-        ChordButton(pin=board.GP13, notes=shift_notes(OPEN_NOTES, Dm)),
-        ChordButton(pin=board.GP14, notes=shift_notes(OPEN_NOTES, D)),
-        ChordButton(pin=board.GP15, notes=shift_notes(OPEN_NOTES, C)),
+        ChordButton(pin=board.GP8, notes=Am_NOTES),
+        ChordButton(pin=board.GP9, notes=G_NOTES),
+        ChordButton(pin=board.GP10, notes=F_NOTES),
+        ChordButton(pin=board.GP11, notes=Em_NOTES),
+        ChordButton(pin=board.GP12, notes=E_NOTES),
+        ChordButton(pin=board.GP13, notes=Dm_NOTES),
+        ChordButton(pin=board.GP14, notes=D_NOTES),
+        ChordButton(pin=board.GP15, notes=C_NOTES),
     ]
 
     # Combine the buttons and strings together into an instrument!
-    myguitar = LightInstrument(strings=STRINGS, chord_btns=CHORD_BTNS, midi_program=46, debug=True)
+    myguitar = LightInstrument(strings=STRINGS, chord_btns=CHORD_BTNS, fretboard=FRETBOARD, midi_program=46, debug=True)
     myguitar.run()
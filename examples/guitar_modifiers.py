@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+guitar_modifiers.py: Standard-tuning six-string laser guitar with six root-chord buttons and two modifier buttons
+
+Hold a root button (C, D, E, F, G or A) for a major chord.
+Hold the "minor" and/or "7th" modifier button along with a root button for minor, dominant 7th or minor 7th chords.
+Hold a root button together with the next root button up (A wraps around to C) for a major 7th chord, e.g. C + D for Cmaj7.
+Eight buttons play 30 different chords (31 voicings, with the open strings).
+
+Same wiring as guitar.py.
+"""
+
+from twang import LightString, LightInstrument, ChordButton, getnote
+from twang.fretboard import Fretboard
+import board
+
+# Standard guitar tuning: E2–A2–D3–G3–B3–E4
+OPEN_NAMES = ["E2","A2","D3","G3","B3","E4"]
+OPEN_NOTES = [getnote(name) for name in OPEN_NAMES]
+
+
+### RELATIVE CHORDS (based on frets)
+x = -9999
+
+# Major chords
+C = [x,3,2,0,1,0] # Note that numbers denote fret #, not finger #
+D = [x,x,0,2,3,2]
+E = [0,2,2,1,0,0]
+F = [x,3,3,2,1,x]
+G = [3,2,0,0,3,3]
+A = [x,0,2,2,2,0]
+
+# Minor chords
+Cm = [x,3,5,5,4,3]
+Dm = [x,x,0,2,3,1]
+Em = [0,2,2,0,0,0]
+Fm = [1,3,3,1,1,1]
+Gm = [3,5,5,3,3,3]
+Am = [x,0,2,2,1,0]
+
+# Dominant 7 chords
+C7 = [x,3,2,3,1,0]
+D7 = [x,x,0,2,1,2]
+E7 = [0,2,2,1,3,0]
+F7 = [1,3,1,2,1,1]
+G7 = [3,2,0,0,0,1]
+A7 = [x,0,2,2,2,3]
+
+# Minor 7 chords
+Cm7 = [x,3,5,3,4,3]
+Dm7 = [x,x,0,2,1,1]
+Em7 = [0,2,0,0,0,0]
+Fm7 = [1,3,1,1,1,1]
+Gm7 = [3,5,3,3,3,3]
+Am7 = [x,0,2,0,1,0]
+
+# Major 7 chords
+Cmaj7 = [x,3,2,0,0,0]
+Dmaj7 = [x,x,0,2,2,2]
+Emaj7 = [0,2,1,1,0,0]
+Fmaj7 = [x,x,3,2,1,0]
+Gmaj7 = [3,2,0,0,0,2]
+Amaj7 = [x,0,2,1,2,0]
+
+# No chord of its own (for the modifier buttons)
+MODIFIER = [x,x,x,x,x,x]
+
+ROOTS = [C, D, E, F, G, A]
+MINORS = [Cm, Dm, Em, Fm, Gm, Am]
+SEVENTHS = [C7, D7, E7, F7, G7, A7]
+MINOR_SEVENTHS = [Cm7, Dm7, Em7, Fm7, Gm7, Am7]
+MAJOR_SEVENTHS = [Cmaj7, Dmaj7, Emaj7, Fmaj7, Gmaj7, Amaj7]
+
+if __name__ == "__main__":
+    # Every chord's notes, from one matrix of chord shapes (see twang/fretboard.py), in the order of the instrument's chord table:
+    # the eight buttons, then each root's minor, 7th, minor 7th and major 7th combinations. myguitar.set_capo(2) moves them all up two frets.
+    SHAPES = ROOTS + [MODIFIER, MODIFIER]
+    for ix in range(len(ROOTS)):
+        SHAPES += [MINORS[ix], SEVENTHS[ix], MINOR_SEVENTHS[ix], MAJOR_SEVENTHS[ix]]
+    FRETBOARD = Fretboard(OPEN_NOTES, SHAPES)
+    CHORDS = FRETBOARD.chords()
+
+    # Phototransistor pins for strings (low-note strings first)
+    STRINGS = [
+        LightString(pin=board.GP16, note=OPEN_NOTES[0]),
+        LightString(pin=board.GP17, note=OPEN_NOTES[1]),
+        LightString(pin=board.GP18, note=OPEN_NOTES[2]),
+        LightString(pin=board.GP19, note=OPEN_NOTES[3]),
+        LightString(pin=board.GP20, note=OPEN_NOTES[4]),
+        LightString(pin=board.GP21, note=OPEN_NOTES[5]),
+    ]
+
+    # Root-chord buttons, and the two modifier buttons (no chord of their own)
+    C_BTN = ChordButton(pin=board.GP8, notes=CHORDS[0])
+    D_BTN = ChordButton(pin=board.GP9, notes=CHORDS[1])
+    E_BTN = ChordButton(pin=board.GP10, notes=CHORDS[2])
+    F_BTN = ChordButton(pin=board.GP11, notes=CHORDS[3])
+    G_BTN = ChordButton(pin=board.GP12, notes=CHORDS[4])
+    A_BTN = ChordButton(pin=board.GP13, notes=CHORDS[5])
+    MINOR_BTN = ChordButton(pin=board.GP14)
+    SEVENTH_BTN = ChordButton(pin=board.GP15)
+
+    # Which chord to play when a root button is held together with modifier buttons (in the same order as SHAPES)
+    COMBOS = {}
+    ROOT_BTNS = [C_BTN, D_BTN, E_BTN, F_BTN, G_BTN, A_BTN]
+    for ix, root_btn in enumerate(ROOT_BTNS):
+        minor, seventh, minor_seventh, major_seventh = CHORDS[8 + 4 * ix:12 + 4 * ix]
+        COMBOS[(root_btn, MINOR_BTN)] = minor
+        COMBOS[(root_btn, SEVENTH_BTN)] = seventh
+        COMBOS[(root_btn, MINOR_BTN, SEVENTH_BTN)] = minor_seventh
+        COMBOS[(root_btn, ROOT_BTNS[(ix + 1) % len(ROOT_BTNS)])] = major_seventh
+
+    CHORD_BTNS = [C_BTN, D_BTN, E_BTN, F_BTN, G_BTN, A_BTN, MINOR_BTN, SEVENTH_BTN]
+
+    # Combine the buttons and strings together into an instrument!
+    myguitar = LightInstrument(strings=STRINGS, chord_btns=CHORD_BTNS, chord_combos=COMBOS, fretboard=FRETBOARD, midi_program=46)
+    myguitar.run()
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+keyboard88.py: 88-key optical keyboard, with phototransistors read through eleven 74HC165 shift registers
+
+The shift register chain needs only three pins on the Pico: clock, data and latch.
+"""
+
+from twang import LightInstrument, StringBank, getnote
+import board
+
+if __name__ == "__main__":
+    ## One string per piano key, from A0 (lowest) to C8 (highest)
+    KEYS = StringBank(notes=range(getnote("A0"), getnote("C8") + 1), clock=board.GP2, data=board.GP3, latch=board.GP4)
+    print("Worst-case scan period (ms): {}".format(KEYS.worst_case_scan_ms))
+
+    ## Combine the strings together into a playable instrument!
+    mykeyboard = LightInstrument(KEYS, beam_pin=board.GP5, midi_program=0)
+    mykeyboard.run()
@@ -7,7 +7,7 @@ Created by Scott Feister, circa Feb 2025
 """
 
 from twang import LightString, LightInstrument, ChordButton, getnote
-import ulab.numpy as np
+from twang.fretboard import Fretboard
 import board
 
 # High ukelele tuning: G4-C4-E4-A4
@@ -29,15 +29,13 @@ Em = [0,4,3,2]
 E = [1,4,0,2]
 
 
-def shift_notes(notes, shifts):
-    """ Shift a list of notes by a number of half-steps """
-    # TODO: Check assertions
-    shifted_notes = np.array(notes, dtype=np.int16) + np.array(shifts, dtype=np.int16) # Add the shift in note onto the note itself
-    return shifted_notes
-
 if __name__ == "__main__":
     print("OPEN_NOTES (midi numbers for an open chord): {}".format(OPEN_NOTES))
 
+    # Every chord's notes, from one matrix of chord shapes (see twang/fretboard.py); my_ukelele.set_capo(2) moves them all up two frets
+    FRETBOARD = Fretboard(OPEN_NOTES, [C, G, Am, F, Em])
+    C_NOTES, G_NOTES, Am_NOTES, F_NOTES, Em_NOTES = FRETBOARD.chords()
+
     # Phototransistor pins for strings (low-note strings first)
     STRINGS = [
         LightString(pin=board.GP15, note=OPEN_NOTES[0]),
@@ -48,13 +46,13 @@ if __name__ == "__main__":
 
     # Button pins for chords, and their associated notes
     CHORD_BTNS = [
-        ChordButton(pin=board.GP16, notes=shift_notes(OPEN_NOTES, C)),
-        ChordButton(pin=board.GP17, notes=shift_notes(OPEN_NOTES, G)),
-        ChordButton(pin=board.GP18, notes=shift_notes(OPEN_NOTES, Am)),
-        ChordButton(pin=board.GP19, notes=shift_notes(OPEN_NOTES, F)),
-        ChordButton(pin=board.GP20, notes=shift_notes(OPEN_NOTES, Em)),
+        ChordButton(pin=board.GP16, notes=C_NOTES),
+        ChordButton(pin=board.GP17, notes=G_NOTES),
+        ChordButton(pin=board.GP18, notes=Am_NOTES),
+        ChordButton(pin=board.GP19, notes=F_NOTES),
+        ChordButton(pin=board.GP20, notes=Em_NOTES),
     ]
 
     # Combine the buttons and strings together into an instrument!
-    my_ukelele = LightInstrument(strings=STRINGS, chord_btns=CHORD_BTNS, beam_pin=board.GP14, midi_program=0, debug=False)
+    my_ukelele = LightInstrument(strings=STRINGS, chord_btns=CHORD_BTNS, fretboard=FRETBOARD, beam_pin=board.GP14, midi_program=0, debug=False)
     my_ukelele.run()
@@ -0,0 +1,51 @@
+# Simulated check that a string recovering from a stuck beam plays its very next pluck
+# Runs on a computer, without a Pico: python troubleshoot/test_stuck_sim.py (or with pytest)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from twang import LightString, LightInstrument
+from twang.capture import BeamCapture
+from twang.sim import SimBackend
+
+NOTE_ON = 0x90
+
+def note_ons(sim):
+    return [msg for msg in sim.midi.messages() if msg[0] & 0xF0 == NOTE_ON and msg[2] > 0]
+
+def run(sim, instrument, ms):
+    for i in range(ms):
+        sim.advance(1)
+        instrument.step()
+
+def check_recover_then_pluck(capture):
+    sim = SimBackend()
+    strings = [LightString(pin="GP16", note=40), LightString(pin="GP17", note=45)]
+    instrument = LightInstrument(BeamCapture(strings) if capture else strings, backend=sim, stuck_s=1)
+    instrument.start()
+    sim.midi.clear()
+
+    # Block the first string's beam for 3 s, so that it is quarantined, then clear it and pluck it 150 ms later,
+    # with a health check (every 200 ms) while the pluck is under way
+    now = sim.ticks_ms()
+    sim.press("GP16", at_ms=now + 10, duration_ms=3000)
+    run(sim, instrument, 2000)
+    assert instrument.health.report()["stuck"] == [0]
+    sim.pluck("GP16", at_ms=now + 3160, duration_ms=100)
+    run(sim, instrument, 1400)
+    assert instrument.health.report()["stuck"] == []
+    assert instrument.health.recoveries == 1
+    assert [msg[1] for msg in note_ons(sim)] == [40] # The stuck press itself didn't play, and the pluck did
+
+def test_recover_then_pluck():
+    check_recover_then_pluck(capture=False)
+
+def test_recover_then_pluck_capture():
+    check_recover_then_pluck(capture=True)
+
+if __name__ == "__main__":
+    test_recover_then_pluck()
+    test_recover_then_pluck_capture()
+    print("Stuck strings recover and play their next pluck.")
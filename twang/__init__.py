@@ -1,4 +1,8 @@
 """ Twang Python Library """
 
-from .instrument import LightInstrument, ChordButton, LightString
-from .midinotes import getnote
\ No newline at end of file
+# Optional parts (e.g. twang.capture, twang.analog, twang.strum, twang.fretboard, twang.ensemble) are imported from their own modules,
+# so that they only take up memory on the Pico when they're used
+from .instrument import LightInstrument, ChordButton, ChordMatrix, LightString, StringBank
+from .midiout import MidiOutput
+from .velocity import VelocityCurve
+from .midinotes import getnote, getnotes
\ No newline at end of file
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+_compat.py: Helpers for code that runs both on CircuitPython and on a regular computer
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+def numpy():
+    """ ulab's numpy on CircuitPython, or numpy on a regular computer; only imported by the modules that use it """
+    try:
+        from ulab import numpy as np
+    except ImportError:
+        import numpy as np
+    return np
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+analog.py: Analog photodetector sensing with adaptive thresholds
+
+Read as digital pins, a beam is "broken" whenever its phototransistor crosses the pin's fixed logic threshold,
+so bright room light or a laser that dims as it warms up causes missed or phantom plucks. With AnalogStrings,
+every phototransistor is instead read through the ADC (analogio), and the readings are filtered as one block with ulab:
+* A moving baseline follows each intact beam's light level, so slow drift in ambient light or laser power is tracked
+* A string is pressed when its reading drops more than press_depth of the way from the baseline to dark,
+  and released when it comes back within release_depth (hysteresis, so a noisy reading doesn't chatter)
+* The deepest point of each beam break is kept, so that with depth_velocity=True, a beam broken all the way plays
+  louder than one only grazed
+
+The result is the same press and release events that keypad makes, which LightString.check_and_play() consumes.
+
+Sampling rate: one sweep reads every string once. Sweeps run from the instrument loop, at most once every interval_ms
+(1 ms by default, so 1000 sweeps per second, with each string sampled at 1 kHz). A CircuitPython ADC read takes roughly 20 us,
+so a 6-string sweep takes about 0.15 ms of each loop pass. If the loop is slower than interval_ms, sweeps happen once per pass
+instead; sweeps_per_second (counted over one-second windows) gives the rate actually achieved.
+
+The Pico only has three ADC pins (A0-A2). For more strings, wire the phototransistors to an analog multiplexer
+(e.g. a 16-channel CD74HC4067): give select_pins (least significant first) and common_pin, and the strings are read from
+channels 0, 1, 2, ... in order.
+
+The filter math makes small ulab arrays on every sweep, so analog sensing doesn't fit with LightInstrument(zero_alloc=True).
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+from ._compat import numpy
+from .stats import ticks_diff
+
+FULL_SCALE = 65535 # analogio readings are always 16 bits
+FULL_VELOCITY_SCALE = 128 # Velocity scale of a full-depth beam break (the velocity is multiplied by scale / 128)
+
+class AnalogEvent:
+    """ A keypad.Event-like beam change, with the velocity scale from the depth of the beam break """
+
+    def __init__(self, key_number=0, pressed=True, timestamp=0, scale=FULL_VELOCITY_SCALE):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+        self.scale = scale # On a release: velocity scale (0-128) from the deepest point of the beam break
+
+    @property
+    def released(self):
+        return not self.pressed
+
+class AnalogEventQueue:
+    """ keypad.EventQueue-like queue of beam changes, which sweeps the ADC whenever it's checked and a sweep is due """
+
+    def __init__(self, scanner, max_events=64):
+        self.scanner = scanner
+        self.key_numbers = array("H", [0] * max_events)
+        self.pressed = bytearray(max_events)
+        self.timestamps = array("l", [0] * max_events)
+        self.scales = array("H", [0] * max_events)
+        self.start = 0 # Ring buffer of events
+        self.length = 0
+        self.overflowed = False
+
+    def put(self, key_number, pressed, timestamp, scale):
+        max_events = len(self.key_numbers)
+        if self.length >= max_events:
+            self.overflowed = True
+            return
+        ix = (self.start + self.length) % max_events
+        self.key_numbers[ix] = key_number
+        self.pressed[ix] = pressed
+        self.timestamps[ix] = timestamp
+        self.scales[ix] = scale
+        self.length += 1
+
+    def get_into(self, event):
+        if not self.length:
+            self.scanner.poll()
+            if not self.length:
+                return False
+        ix = self.start
+        event.key_number = self.key_numbers[ix]
+        event.pressed = bool(self.pressed[ix])
+        event.timestamp = self.timestamps[ix]
+        event.scale = self.scales[ix]
+        self.start = (ix + 1) % len(self.key_numbers)
+        self.length -= 1
+        return True
+
+    def get(self):
+        event = AnalogEvent()
+        return event if self.get_into(event) else None
+
+    def clear(self):
+        self.start = 0
+        self.length = 0
+        self.overflowed = False
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        if not self.length:
+            self.scanner.poll()
+        return self.length > 0
+
+class AnalogScanner:
+    """ keypad.Keys-like scanner that sweeps the ADC and filters the readings into press and release events """
+
+    def __init__(self, config, backend):
+        np = self.np = numpy()
+        self.config = config
+        self.backend = backend
+        n = self.key_count = len(config.strings)
+        if config.common_pin is not None:
+            self.inputs = [backend.analog_input(config.common_pin)]
+            self.selects = [backend.output_pin(pin) for pin in config.select_pins]
+        else:
+            self.inputs = [backend.analog_input(string.pin) for string in config.strings]
+            self.selects = None
+        self.events = AnalogEventQueue(self, max_events=max(64, 2 * n))
+
+        self.raw = np.zeros(n) # Latest reading of every string
+        self.pressed = np.zeros(n) # 1.0 while a string is pressed
+        self.peak = np.zeros(n) # Deepest point of each string's current beam break
+        self.sweep()
+        if config.baseline is not None:
+            self.baseline = config.baseline # Carry on from the last scanner (e.g. after the instrument slept)
+        else:
+            self.baseline = self.raw * 1.0 # Assume every beam is intact to start with
+        self.sweeps = 0 # Sweeps since the scanner started
+        self.sweeps_per_second = 0 # Sweeps in the last complete one-second window
+        self.window_sweeps = 0
+        self.last_sweep_ms = self.window_start_ms = backend.ticks_ms()
+
+    def sweep(self):
+        """ Read every string into self.raw """
+        raw = self.raw
+        if self.selects is None:
+            ix = 0
+            for analog in self.inputs:
+                raw[ix] = analog.value
+                ix += 1
+        else:
+            common = self.inputs[0]
+            selects = self.selects
+            for ix in range(self.key_count):
+                for bit in range(len(selects)):
+                    selects[bit].value = bool((ix >> bit) & 1)
+                raw[ix] = common.value
+
+    def poll(self):
+        """ Sweep and filter the readings, if a sweep is due; queues an event for every string that changed """
+        now = self.backend.ticks_ms()
+        if ticks_diff(now, self.last_sweep_ms) < self.config.interval_ms:
+            return
+        self.last_sweep_ms = now
+        self.sweeps += 1
+        self.window_sweeps += 1
+        elapsed = ticks_diff(now, self.window_start_ms)
+        if elapsed >= 1000:
+            self.sweeps_per_second = self.window_sweeps * 1000 // elapsed
+            self.window_sweeps = 0
+            self.window_start_ms = now
+
+        np = self.np
+        config = self.config
+        self.sweep()
+
+        # How far each reading has gone from its baseline toward dark (0 for an intact beam, 1 for no light at all)
+        baseline = self.baseline
+        if config.broken_low:
+            depth = (baseline - self.raw) / (baseline + 1)
+        else:
+            depth = (self.raw - baseline) / (FULL_SCALE + 1 - baseline)
+        peak = np.maximum(self.peak, depth)
+
+        # Hysteresis: press past press_depth, and stay pressed until back within release_depth
+        pressed = np.maximum((depth > config.press_depth) * 1.0, self.pressed * (depth >= config.release_depth))
+        if np.any(pressed != self.pressed):
+            for ix in range(self.key_count):
+                if pressed[ix] != self.pressed[ix]:
+                    if pressed[ix]:
+                        self.events.put(ix, True, now, FULL_VELOCITY_SCALE)
+                    else:
+                        self.events.put(ix, False, now, config.velocity_scale(peak[ix]))
+        self.pressed = pressed
+        self.peak = peak * pressed # Forget the peaks of strings that aren't pressed
+
+        # Intact beams pull their baseline toward the latest reading; pressed strings hold theirs
+        self.baseline = baseline + config.baseline_rate * (self.raw - baseline) * (1 - pressed)
+
+    def reset(self):
+        """ Assume every string is released; strings held down report a new press on the next sweep """
+        self.pressed = self.np.zeros(self.key_count)
+        self.peak = self.np.zeros(self.key_count)
+
+    def deinit(self):
+        self.config.baseline = self.baseline
+        for analog in self.inputs:
+            analog.deinit()
+        if self.selects is not None:
+            for select in self.selects:
+                select.deinit()
+
+class AnalogStrings:
+    """
+    A set of LightStrings read through the ADC, with adaptive thresholds.
+    Use in place of a list of LightStrings.
+
+    Each LightString's pin is an analog pin (e.g. board.A0), unless the strings are read through a multiplexer
+    on common_pin, selected by select_pins.
+    broken_low is True if a reading drops when the beam is broken, and False if it rises.
+    baseline_rate is the fraction of the way each sweep moves an intact beam's baseline toward its reading
+    (0.002 at 1000 sweeps per second follows drift over about half a second, but not a pluck).
+    With depth_velocity, a release's velocity is scaled by how deep the beam break went, reaching full velocity at full_depth.
+    """
+    source = "analog" # Recognized by the LightInstrument without importing this module
+
+    def __init__(self, strings, select_pins=None, common_pin=None, broken_low=True, interval_ms=1,
+                 press_depth=0.5, release_depth=0.3, baseline_rate=0.002, depth_velocity=False, full_depth=0.9, debug=False):
+        if not 0 < release_depth < press_depth < 1:
+            raise Exception("AnalogStrings needs 0 < release_depth < press_depth < 1.")
+        if common_pin is not None and (not select_pins or len(strings) > 1 << len(select_pins)):
+            raise Exception("A multiplexer with {} select pins can't read {} strings.".format(len(select_pins or ()), len(strings)))
+        self.debug = debug
+        self.strings = strings
+        self.select_pins = select_pins
+        self.common_pin = common_pin
+        self.broken_low = broken_low
+        self.interval_ms = interval_ms # Time between sweeps
+        self.press_depth = press_depth
+        self.release_depth = release_depth
+        self.baseline_rate = baseline_rate
+        self.depth_velocity = depth_velocity
+        self.full_depth = full_depth
+        self.baseline = None # Each string's baseline reading, kept while the scanner is stopped
+
+    def velocity_scale(self, depth):
+        """ Velocity scale (out of 128) for a beam break that went depth of the way to dark """
+        if not self.depth_velocity:
+            return FULL_VELOCITY_SCALE
+        return max(1, min(FULL_VELOCITY_SCALE, int(depth * FULL_VELOCITY_SCALE / self.full_depth)))
+
+    def scanner(self, backend):
+        """ Create the scanner for these strings, using the LightInstrument's hardware backend """
+        return AnalogScanner(self, backend)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, ix):
+        return self.strings[ix]
+
+if __name__ == "__main__":
+    pass
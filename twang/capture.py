@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+capture.py: Microsecond beam-break timing with the RP2040's PIO
+
+keypad timestamps its events in milliseconds, and only after debouncing over a 10 ms scan interval, so plucks
+quicker than about 10 ms all sound the same. With a BeamCapture, the strings are instead watched by a PIO state
+machine, which samples every string pin at once, once per microsecond, and pushes each change into its FIFO
+along with a microsecond counter. DMA copies every change out of the FIFO as soon as it's pushed, into a ring buffer
+(StateMachine.background_read), and the instrument reads the changes out of the ring whenever it gets to them,
+so pluck timing no longer depends on how often the Python loop comes around.
+
+Usage:
+    from twang.capture import BeamCapture
+    strings = [LightString(pin=board.GP16, note=40), LightString(pin=board.GP17, note=45), ...]
+    guitar = LightInstrument(BeamCapture(strings), chord_btns=...)
+
+Requirements and limits:
+* The string pins must be consecutive GPIOs (e.g. GP16, GP17, ..., GP21), in string order, and there can be at most 30
+* The "adafruit_pioasm" library from the CircuitPython Bundle must be in CIRCUITPY/lib
+* background_read needs CircuitPython 9.1 or later
+* There is no debouncing: every change of a beam is reported
+* The ring holds RING_CHANGES (64) changes: the presses and releases of five strums across six strings.
+  If the instrument loop falls further behind than that, the oldest changes are overwritten, which is counted and
+  reported by overflowed (and in the LightInstrument's stats and telemetry)
+
+The microsecond counter is 30 bits wide, so it wraps around every 17.9 minutes; ticks_diff_us() handles this.
+Each event's timestamp (in ticks_ms, like keypad's) is when the event was read from the ring, for the loop's bookkeeping;
+timestamp_us is when the beam actually changed.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+
+COUNTER_BITS = 30 # Counter values fit in a CircuitPython small int, so reading them doesn't allocate
+COUNTER_MASK = (1 << COUNTER_BITS) - 1
+COUNTER_HALFPERIOD = 1 << (COUNTER_BITS - 1)
+CYCLES_PER_SAMPLE = 14 # Every pass of the program takes 14 cycles, whether or not a pin changed
+PIO_FREQUENCY = CYCLES_PER_SAMPLE * 1000000 # One sample (and one counter tick) per microsecond
+MAX_PINS = 30
+RING_CHANGES = 64 # Changes held by the ring buffer, two words each
+EMPTY = -1 # Ring words that have been read (or never written); no counter or sample is negative
+
+# The counter counts down in y. While a new sample (in x) is compared with the previous one (kept in osr),
+# the counter waits in isr. A change pushes two words: the counter, then the new sample.
+PROGRAM = """
+.program beam_capture
+    mov osr, ~null          ; No previous sample, so the first sample is always pushed
+    mov y, ~null
+    jmp sample
+changed:
+    mov osr, x              ; Remember the new sample
+    mov y, isr
+    mov isr, null
+    in y, 30
+    push block              ; Counter
+    in x, {count}
+    push block              ; Sample
+    jmp y-- sample          ; Falls through to sample when the counter wraps around
+.wrap_target
+sample:
+    mov isr, null
+    in pins, {count}        ; Every string pin at once
+    mov x, isr
+    mov isr, y
+    mov y, osr
+    jmp x!=y changed
+    mov y, isr [6]          ; Pad to the same number of cycles as a change
+    jmp y-- sample
+.wrap
+"""
+
+def capture_program(count):
+    """ PIO assembly for capturing count consecutive pins """
+    if not 0 < count <= MAX_PINS:
+        raise Exception("A BeamCapture can watch between 1 and {} pins, not {}.".format(MAX_PINS, count))
+    return PROGRAM.format(count=count)
+
+def ticks_diff_us(end, start):
+    """ Microsecond difference end - start, correct across a wraparound of the capture counter """
+    diff = (end - start) & COUNTER_MASK
+    if diff >= COUNTER_HALFPERIOD:
+        diff -= COUNTER_MASK + 1 # end is before start
+    return diff
+
+class CaptureEvent:
+    """ A keypad.Event-like beam change, with the microsecond timestamp_us it happened at """
+
+    def __init__(self, key_number=0, pressed=True, timestamp=0, timestamp_us=0):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+        self.timestamp_us = timestamp_us
+
+    @property
+    def released(self):
+        return not self.pressed
+
+class CaptureEventQueue:
+    """ keypad.EventQueue-like view of the ring buffer the state machine's changes are copied into,
+    turning each changed sample into one event per changed pin """
+
+    def __init__(self, sm, key_count, value_when_pressed=False, ticks_ms=None, ring_changes=RING_CHANGES):
+        self.sm = sm # An rp2pio.StateMachine running PROGRAM (or a stand-in, see sim.py)
+        self.key_count = key_count
+        self.intact = 0 if value_when_pressed else (1 << key_count) - 1 # Sample with every beam intact; XORed with a sample, gives a 1 for every pressed pin
+        self.ticks_ms = ticks_ms
+        self.ring = array("l", [EMPTY] * (2 * ring_changes)) # Counter and sample of each change; signed, so that reading it doesn't allocate
+        self.read_ix = 0 # Counter word of the next change to read
+        self.overruns = 0 # Times the ring was found to have been written over before it was read
+        self.last = self.intact
+        self.sample = self.last
+        self.changed = 0 # Bits of the latest sample not yet handed out as events
+        self.ticks_us = 0
+        self.timestamp = 0
+        sm.background_read(loop=self.ring) # DMA copies the FIFO into the ring from now on, wrapping around at its end
+
+    def _read(self):
+        """ Take the next change out of the ring; returns False if there isn't one """
+        ring, ix = self.ring, self.read_ix
+        if ring[ix + 1] == EMPTY: # The sample is copied after the counter, so the change is complete once it's there
+            return False
+        self.ticks_us = COUNTER_MASK - ring[ix] # The state machine counts down
+        self.sample = ring[ix + 1]
+        ring[ix] = EMPTY
+        ring[ix + 1] = EMPTY
+        ix += 2
+        if ix == len(ring):
+            ix = 0
+        self.read_ix = ix
+        if ring[ix + 1] != EMPTY and ticks_diff_us(COUNTER_MASK - ring[ix], self.ticks_us) < 0:
+            self.overruns += 1 # The next change is older than this one, so the ring has wrapped around past the reader
+        self.changed = self.sample ^ self.last
+        self.last = self.sample
+        self.timestamp = self.ticks_ms() if self.ticks_ms else 0
+        return True
+
+    def get_into(self, event):
+        """ Fill in event with the next change, lowest pin first; returns False if there are none """
+        while not self.changed:
+            if not self._read():
+                return False
+        changed = self.changed
+        ix = 0
+        while not (changed >> ix) & 1:
+            ix += 1
+        self.changed = changed & ~(1 << ix)
+        event.key_number = ix
+        event.pressed = bool(((self.sample ^ self.intact) >> ix) & 1)
+        event.timestamp = self.timestamp
+        event.timestamp_us = self.ticks_us
+        return True
+
+    def get(self):
+        event = CaptureEvent()
+        return event if self.get_into(event) else None
+
+    def clear(self):
+        while self._read(): # The DMA keeps its place in the ring, so the reader catches up rather than starting over
+            pass
+        self.changed = 0
+        self.overruns = 0
+        self.sm.clear_rxfifo()
+
+    @property
+    def overflowed(self):
+        """ True if changes were written over before they were read, or the state machine has had to wait for its FIFO (its counter lost time) """
+        return self.overruns > 0 or self.sm.rxstall
+
+    def __bool__(self):
+        return bool(self.changed) or self.ring[self.read_ix + 1] != EMPTY
+
+class CaptureKeys:
+    """ keypad.Keys-like scanner for a running capture state machine """
+
+    def __init__(self, sm, key_count, value_when_pressed=False, ticks_ms=None):
+        self.sm = sm
+        self.key_count = key_count
+        self.events = CaptureEventQueue(sm, key_count, value_when_pressed=value_when_pressed, ticks_ms=ticks_ms)
+
+    def deinit(self):
+        self.sm.deinit()
+
+class BeamCapture:
+    """
+    A set of LightStrings on consecutive pins, timed to the microsecond by a PIO state machine.
+    Use in place of a list of LightStrings.
+
+    resolution_us is the step size of the velocity table: pluck durations are rounded down to a multiple of it.
+    min_ms is the quickest pluck that still gets louder as it gets quicker (see velocity.py).
+    """
+    source = "capture" # Recognized by the LightInstrument without importing this module
+
+    def __init__(self, strings, resolution_us=100, min_ms=2, value_when_pressed=False):
+        if resolution_us < 1:
+            raise Exception("BeamCapture resolution must be at least 1 microsecond.")
+        capture_program(len(strings)) # Checks the number of strings
+        self.strings = strings
+        self.resolution_us = resolution_us
+        self.min_ms = min_ms
+        self.value_when_pressed = value_when_pressed # Pin value while a beam is broken
+
+    def scanner(self, backend):
+        """ Start the capture state machine, using the LightInstrument's hardware backend """
+        return backend.beam_capture([string.pin for string in self.strings], value_when_pressed=self.value_when_pressed)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, ix):
+        return self.strings[ix]
+
+if __name__ == "__main__":
+    pass
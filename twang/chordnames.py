@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+chordnames.py: Chord symbols (e.g. "Am7", "G/B", "Dsus4") to notes for every string of an instrument
+
+A chord symbol is a root (a letter with any sharps or flats, as in midinotes.py), a quality (see QUALITIES),
+and optionally a slash and a bass note: "C", "F#m", "Bb7", "Cmaj7", "Dsus4", "G/B", "Am7/G".
+
+chords(symbols, tuning) voices a whole list of chords for an instrument in one call, returning the notes for every string
+of each one, ready for ChordButtons (or the "chord" of a compiled instrument, see config.py):
+    from twang.chordnames import chords
+    AM, G, C = chords(["Am", "G", "C"], "E2 A2 D3 G3 B3 E4")
+Each string plays the lowest fret (up to max_fret) that sounds a note of the chord. The lowest string that can reach
+the bass note (the root, or the note after the slash) plays it, and any strings below that are muted.
+So a guitar gets the usual open chords: "Am" is [x, 0, 2, 2, 1, 0] in frets, "C" is [x, 3, 2, 0, 1, 0].
+With max_fret=0 (e.g. a harp), the strings that are already in the chord play, and the rest are muted.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+from .midinotes import pitch, getnotes
+from .state import MUTED
+
+# Half-steps above the root of the notes in each chord quality
+MAJOR = (0, 4, 7)
+MINOR = (0, 3, 7)
+QUALITIES = {
+    "": MAJOR, "M": MAJOR, "maj": MAJOR,
+    "m": MINOR, "min": MINOR, "-": MINOR,
+    "dim": (0, 3, 6), "o": (0, 3, 6),
+    "aug": (0, 4, 8), "+": (0, 4, 8),
+    "sus2": (0, 2, 7), "sus4": (0, 5, 7), "sus": (0, 5, 7),
+    "5": (0, 7),
+    "6": (0, 4, 7, 9), "m6": (0, 3, 7, 9),
+    "7": (0, 4, 7, 10), "maj7": (0, 4, 7, 11), "M7": (0, 4, 7, 11),
+    "m7": (0, 3, 7, 10), "min7": (0, 3, 7, 10), "-7": (0, 3, 7, 10),
+    "mmaj7": (0, 3, 7, 11), "mM7": (0, 3, 7, 11),
+    "m7b5": (0, 3, 6, 10), "dim7": (0, 3, 6, 9), "o7": (0, 3, 6, 9),
+    "7sus4": (0, 5, 7, 10), "7sus2": (0, 2, 7, 10),
+    "add9": (0, 2, 4, 7), "madd9": (0, 2, 3, 7),
+    "9": (0, 2, 4, 7, 10), "maj9": (0, 2, 4, 7, 11), "m9": (0, 2, 3, 7, 10),
+    "11": (0, 2, 4, 5, 7, 10), "13": (0, 2, 4, 7, 9, 10),
+}
+
+def parse_chord(symbol):
+    """ Returns (pitch classes in the chord, as a 12-bit mask with bit n set for n half-steps above C; pitch class of the bass note) """
+    root, ix = pitch(symbol)
+    slash = symbol.find("/", ix)
+    quality = symbol[ix:slash] if slash >= 0 else symbol[ix:]
+    if quality not in QUALITIES:
+        raise Exception("Unknown chord quality '{}' in chord {}. Known qualities (after the root, or none for a major chord): {}.".format(
+            quality, symbol, ", ".join(sorted(name for name in QUALITIES if name))))
+    classes = 0
+    for step in QUALITIES[quality]:
+        classes |= 1 << ((root + step) % 12)
+    bass = root % 12
+    if slash >= 0:
+        bass, end = pitch(symbol, slash + 1)
+        if end != len(symbol):
+            raise Exception("{} is not a valid chord: put just a note name (with no octave) after the slash, e.g. G/B.".format(symbol))
+        bass %= 12
+        classes |= 1 << bass # The bass note is part of the chord, even when the quality doesn't have it (e.g. C/D)
+    return classes, bass
+
+def voice(classes, bass, tuning, max_fret=4):
+    """ Notes for every string of an instrument with this tuning, for a chord from parse_chord(); MUTED strings don't play """
+    notes = array("h", [MUTED] * len(tuning))
+    bass_string = -1
+    for string in range(len(tuning)):
+        open_note = tuning[string]
+        if open_note < 0:
+            continue # A string that never plays
+        for fret in range(max_fret + 1):
+            note = open_note + fret
+            if note > 127:
+                break
+            if bass_string < 0:
+                if note % 12 == bass:
+                    bass_string = string # The lowest string that can play the bass note; any strings below stay muted
+                    notes[string] = note
+                    break
+            elif classes & (1 << (note % 12)):
+                notes[string] = note
+                break
+    if bass_string < 0: # No string can reach the bass note, so every string plays whatever chord note it can
+        for string in range(len(tuning)):
+            for fret in range(max_fret + 1):
+                note = tuning[string] + fret
+                if tuning[string] >= 0 and note <= 127 and classes & (1 << (note % 12)):
+                    notes[string] = note
+                    break
+    return notes
+
+def chord_notes(symbol, tuning, max_fret=4):
+    """ Notes for every string of an instrument with this tuning, for one chord symbol """
+    classes, bass = parse_chord(symbol)
+    return voice(classes, bass, getnotes(tuning), max_fret)
+
+def chords(symbols, tuning, max_fret=4):
+    """ Notes for every string of an instrument with this tuning, for each of a list of chord symbols """
+    tuning = getnotes(tuning)
+    voicings = []
+    for symbol in symbols:
+        classes, bass = parse_chord(symbol)
+        voicings.append(voice(classes, bass, tuning, max_fret))
+    return voicings
+
+if __name__ == "__main__":
+    pass
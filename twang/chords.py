@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+chords.py: Precompiled chord lookup for LightInstruments
+
+Which chord buttons are held down is kept as an integer bitmask: bit i is set while chord button i is pressed.
+A ChordTable is built once, at boot, and maps every bitmask straight to a voicing (the notes for every string).
+Changing chords is then a single table fetch.
+
+Voicing 0 is always the open chord (no buttons pressed). Voicing i + 1 belongs to chord button i.
+Chord combinations (e.g. a root button held together with a "minor" or "7th" modifier button) get voicings of their own,
+keyed on the bitmask of the buttons in the combination. They are compiled into the same table, so looking one up costs
+the same as looking up a single button, however many combinations there are.
+
+When several buttons are held and they don't form a combination, the lowest-numbered button wins.
+Modifier buttons (with no chord of their own) are skipped when picking that button, and do nothing when held alone.
+
+CircuitPython keeps integers of up to 30 bits in place ("small ints"); anything bigger is a long int, allocated on the heap.
+With up to SMALL_INT_BUTTONS chord buttons, every bitmask is a small int, so a chord change allocates nothing.
+Bigger banks (e.g. a 64-button ChordMatrix) work the same way, but each chord event allocates its bitmask,
+so they can't be used with LightInstrument(zero_alloc=True).
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+
+DENSE_MAX_BUTTONS = 10 # Up to this many buttons, every possible bitmask gets its own table entry (1 KB at 10 buttons)
+SMALL_INT_BUTTONS = 30 # Up to this many buttons, bitmasks fit in CircuitPython's small ints and don't allocate
+
+def lowest_button(mask):
+    """ Index of the lowest set bit in mask (the lowest-numbered pressed button), or -1 if mask is zero """
+    if not mask:
+        return -1
+    ix = 0
+    while not mask & 1:
+        mask >>= 1
+        ix += 1
+    return ix
+
+def check_notes(notes):
+    """ Raises an Exception unless every note is a valid midi note (0 to 127) or negative (an unpluckable string) """
+    notes_set = set([x for x in notes if x > -1]) # Exclude negative numbers, as these are assumed to be unusable later in the code
+        
+    if not notes_set.issubset(set(range(128))): # Check that notes list contains only valid midi notes
+        raise Exception("Invalid notes. All midi notes must be integers the range of 0 to 127.")
+
+def button_mask(buttons):
+    """ Bitmask with a bit set for each button index in buttons """
+    mask = 0
+    for ix in buttons:
+        mask |= 1 << ix
+    return mask
+
+class ChordTable:
+    """ Maps a bitmask of pressed chord buttons to the notes for every string """
+
+    def __init__(self, open_chord, chords, combos=None):
+        """ chords has one entry per button: its notes, or None for a modifier button.
+        combos is an optional dictionary of {bitmask of buttons: notes}. """
+        self.num_buttons = len(chords)
+        self.num_combos = len(combos) if combos else 0
+        self.voicings = [array("h", open_chord)] + [array("h", notes) if notes is not None else None for notes in chords] # Notes for every string; -9999 is a muted string
+        self.modifier_mask = button_mask([ix for ix in range(self.num_buttons) if chords[ix] is None]) # Buttons that don't have a chord of their own
+
+        combo_index = {}
+        if combos:
+            for mask, notes in combos.items():
+                if mask & ~button_mask(range(self.num_buttons)) or mask & (mask - 1) == 0:
+                    raise Exception("A chord combination must use two or more of the instrument's chord buttons.")
+                combo_index[mask] = len(self.voicings)
+                self.voicings.append(array("h", notes))
+
+        self.dense = self.num_buttons <= DENSE_MAX_BUTTONS
+        if self.dense:
+            # One entry per bitmask
+            size = 1 << self.num_buttons
+            self.index = bytearray(size) if len(self.voicings) <= 256 else array("H", [0] * size)
+            for mask in range(1, size):
+                self.index[mask] = combo_index[mask] if mask in combo_index else self._resolve(mask)
+        else:
+            # Too many buttons to list every combination; list single buttons and combinations, and resolve anything else when it happens
+            self.index = {1 << ix: self._resolve(1 << ix) for ix in range(self.num_buttons)}
+            self.index.update(combo_index)
+            self.index[0] = 0
+
+    def _resolve(self, mask):
+        """ Voicing for a bitmask that isn't a combination: the lowest-numbered pressed button that has a chord """
+        return lowest_button(mask & ~self.modifier_mask) + 1 # 0 (the open chord) if only modifiers are pressed
+
+    def lookup(self, mask):
+        """ Index into self.voicings of the chord for this bitmask of pressed buttons """
+        if self.dense:
+            return self.index[mask]
+        ix = self.index.get(mask)
+        if ix is None:
+            ix = self._resolve(mask)
+        return ix
+
+    def notes(self, mask):
+        """ Notes for every string, for this bitmask of pressed buttons """
+        return self.voicings[self.lookup(mask)]
+
+class CompiledChordTable(ChordTable):
+    """ A ChordTable read back from a compiled instrument (see config.py), so that nothing is resolved at boot """
+
+    def __init__(self, voicings, index, num_buttons, modifier_mask, num_combos=0):
+        """ voicings is a list of note arrays, and index is the table from a ChordTable: a bytearray or array
+        with one entry per bitmask for up to DENSE_MAX_BUTTONS buttons, or else a dictionary of {bitmask: voicing} """
+        self.num_buttons = num_buttons
+        self.num_combos = num_combos
+        self.voicings = voicings
+        self.modifier_mask = modifier_mask
+        self.index = index
+        self.dense = not isinstance(index, dict)
+
+if __name__ == "__main__":
+    pass
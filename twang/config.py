@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+config.py: Declarative instrument descriptions, compiled on the computer into compact files for the Pico
+
+An instrument script (like examples/guitar.py) builds its chords with fret arithmetic and compiles its chord table
+and velocity curve every time the Pico powers up. Instead, an instrument can be described once, as JSON:
+    {
+        "name": "guitar",
+        "strings": ["GP16", "GP17", "GP18", "GP19", "GP20", "GP21"],
+        "tuning": ["E2", "A2", "D3", "G3", "B3", "E4"],
+        "midi_program": 46,
+        "shapes": {"F": ["x", 3, 3, 2, 1, "x"]},
+        "chords": [{"pin": "GP8", "chord": "Am"}, {"pin": "GP9", "chord": "C"}, {"pin": "GP10", "chord": "F"}, {"pin": "GP11"}],
+        "combos": [{"buttons": ["GP9", "GP11"], "chord": "Cm"}],
+        "velocity": {"shape": "log", "sensitivity": 1.0}
+    }
+and compiled on the computer with:
+    python -m twang.config guitar.json guitar.twang
+Copy guitar.twang to the Pico, and in code.py:
+    from twang import LightInstrument
+    LightInstrument.load("guitar.twang").run()
+
+Description keys:
+* strings: board pin names of the strings' phototransistors, low-note strings first
+* tuning: the open chord, one note per string; a note name (e.g. "E2"), a MIDI note number, or "x" for a muted string
+* chords: chord buttons, each with its board pin, and either "chord" (a shape name or chord symbol) or "notes"; with neither, it's a modifier button
+* shapes: chords by name, as frets above the tuning (e.g. [0, 2, 2, 1, 0, 0]), "x" for a muted string
+  A "chord" that isn't one of the shapes is a chord symbol (e.g. "Am7" or "G/B"), voiced within max_fret frets (see chordnames.py)
+* combos: chord combinations, each with "buttons" held together (pin names or indices into chords) and "chord" or "notes"
+* velocity: keyword arguments for the VelocityCurve (see velocity.py)
+* name, beam_pin, midi_program, midi_channel, max_fret (all optional)
+
+Loading a compiled file only reads tables: the chord table comes straight from the file, already resolved for every
+combination of buttons, and so does the velocity lookup table. A guitar with eight chord buttons compiles to under 1 KB.
+One firmware can run any number of instruments, by loading a different file.
+
+File layout (little-endian, like the Pico):
+    header:     HEADER_FORMAT (see below)
+    pin names:  name, string pins, chord button pins, beam pin; each as a length byte and ASCII (length 0 for none)
+    voicings:   int16 notes, num_voicings rows of num_strings; row 0 is the open chord, row i + 1 belongs to chord button i
+    index:      dense: one entry per bitmask of pressed buttons (bytes, or uint16 with FLAG_WIDE_INDEX)
+                sparse (more than DENSE_MAX_BUTTONS buttons): index_length (uint32 bitmask, uint16 voicing) pairs
+    velocities: velocity_length bytes, one velocity per tick of tick_us
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+import struct
+from array import array
+from .chords import ChordTable, CompiledChordTable, button_mask, check_notes, DENSE_MAX_BUTTONS
+from .midinotes import getnote
+from .state import MUTED
+from .velocity import VelocityCurve
+
+MAGIC = b"TWNG"
+VERSION = 1
+HEADER_FORMAT = "<4sBBBBHBBHHIHB" # magic, version, num_strings, num_buttons, flags, num_voicings, midi_program, midi_channel,
+                                   # tick_us, velocity_length, modifier_mask, index_length, num_combos
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SPARSE_ENTRY_FORMAT = "<IH"
+SPARSE_ENTRY_SIZE = struct.calcsize(SPARSE_ENTRY_FORMAT)
+
+FLAG_DENSE = 1 # The index has one entry per bitmask
+FLAG_WIDE_INDEX = 2 # Dense index entries are uint16 (more than 256 voicings)
+
+NO_PROGRAM = 255 # midi_program isn't set
+MAX_BUTTONS = 32
+
+DESCRIPTION_KEYS = ("name", "strings", "tuning", "beam_pin", "midi_program", "midi_channel", "shapes", "chords", "combos", "velocity", "max_fret")
+
+class CompiledInstrument:
+    """ The tables of a compiled instrument, as read from its file """
+
+    def __init__(self, name, string_pins, button_pins, beam_pin, open_chord, chord_table, velocity_table, tick_us, midi_program, midi_channel):
+        self.name = name
+        self.string_pins = string_pins # Board pin names
+        self.button_pins = button_pins
+        self.beam_pin = beam_pin # None if there's no beam pin
+        self.open_chord = open_chord
+        self.chord_table = chord_table # CompiledChordTable, or None if there are no chord buttons
+        self.velocity_table = velocity_table
+        self.tick_us = tick_us
+        self.midi_program = midi_program
+        self.midi_channel = midi_channel
+
+def _array(typecode, data, start, count, size):
+    """ Array of count entries of size bytes, copied from data at start (data must be bytes; a bytearray would be read per byte) """
+    return array(typecode, bytes(data[start:start + count * size]))
+
+def read_compiled(data):
+    """ Read the bytes of a compiled instrument file into a CompiledInstrument """
+    if len(data) < HEADER_SIZE or data[:4] != MAGIC:
+        raise Exception("Not a compiled Twang instrument.")
+    (magic, version, num_strings, num_buttons, flags, num_voicings, midi_program, midi_channel,
+     tick_us, velocity_length, modifier_mask, index_length, num_combos) = struct.unpack_from(HEADER_FORMAT, data, 0)
+    if version != VERSION:
+        raise Exception("Compiled instrument is version {}, but this version of Twang reads version {}. Compile it again.".format(version, VERSION))
+
+    pos = HEADER_SIZE
+    names = []
+    for ix in range(1 + num_strings + num_buttons + 1):
+        length = data[pos]
+        names.append(bytes(data[pos + 1:pos + 1 + length]).decode() if length else None)
+        pos += 1 + length
+    name = names[0]
+    string_pins = names[1:1 + num_strings]
+    button_pins = names[1 + num_strings:1 + num_strings + num_buttons]
+    beam_pin = names[-1]
+
+    voicings = []
+    for ix in range(num_voicings):
+        voicings.append(_array("h", data, pos, num_strings, 2))
+        pos += 2 * num_strings
+
+    chord_table = None
+    if num_buttons:
+        if flags & FLAG_DENSE:
+            if flags & FLAG_WIDE_INDEX:
+                index = _array("H", data, pos, index_length, 2)
+                pos += 2 * index_length
+            else:
+                index = bytearray(data[pos:pos + index_length])
+                pos += index_length
+        else:
+            index = {}
+            for ix in range(index_length):
+                mask, voicing = struct.unpack_from(SPARSE_ENTRY_FORMAT, data, pos)
+                index[mask] = voicing
+                pos += SPARSE_ENTRY_SIZE
+        chord_table = CompiledChordTable(voicings, index, num_buttons, modifier_mask, num_combos)
+
+    velocity_table = bytearray(data[pos:pos + velocity_length])
+    if len(velocity_table) != velocity_length:
+        raise Exception("Compiled instrument is cut short.")
+    return CompiledInstrument(name, string_pins, button_pins, beam_pin, voicings[0], chord_table, velocity_table, tick_us,
+                              None if midi_program == NO_PROGRAM else midi_program, midi_channel)
+
+### Compiling, on the computer
+
+def note_number(note):
+    """ MIDI note for a note name (e.g. "C#4") or number; "x" (or None) is a muted string """
+    if note is None or note == "x":
+        return MUTED
+    if isinstance(note, str):
+        return getnote(note)
+    return int(note)
+
+def entry_notes(entry, tuning, shapes, max_fret=4):
+    """ Notes for every string of a chord or combo entry, from its "notes" or its "chord" shape; None for a modifier button """
+    if "notes" in entry:
+        notes = [note_number(note) for note in entry["notes"]]
+    elif "chord" in entry:
+        if entry["chord"] not in shapes:
+            from .chordnames import chord_notes # Only needed when compiling, so it isn't loaded on the Pico with the rest of this module
+            return list(chord_notes(entry["chord"], tuning, max_fret)) # A chord symbol
+        frets = shapes[entry["chord"]]
+        if len(frets) != len(tuning):
+            raise Exception("Chord shape '{}' has {} frets, but the instrument has {} strings.".format(entry["chord"], len(frets), len(tuning)))
+        notes = [MUTED if fret is None or fret == "x" or open_note < 0 else open_note + fret for open_note, fret in zip(tuning, frets)]
+    else:
+        return None
+    if len(notes) != len(tuning):
+        raise Exception("A chord has {} notes, but the instrument has {} strings.".format(len(notes), len(tuning)))
+    check_notes(notes)
+    return notes
+
+def _pin_name(pin):
+    """ Length-prefixed ASCII for a pin name (or None) """
+    name = pin.encode() if pin else b""
+    if len(name) > 255:
+        raise Exception("Pin name '{}' is too long.".format(pin))
+    return bytes([len(name)]) + name
+
+def compile_instrument(description):
+    """ Compile an instrument description (a dictionary, see above) into the bytes of a compiled instrument file """
+    for key in description:
+        if key not in DESCRIPTION_KEYS:
+            raise Exception("Unknown instrument description key '{}'. Valid keys are: {}.".format(key, ", ".join(DESCRIPTION_KEYS)))
+    string_pins = description["strings"]
+    tuning = [note_number(note) for note in description["tuning"]]
+    if len(tuning) != len(string_pins):
+        raise Exception("The tuning has {} notes, but there are {} strings.".format(len(tuning), len(string_pins)))
+    check_notes(tuning)
+    shapes = description.get("shapes", {})
+    buttons = description.get("chords", [])
+    if len(buttons) > MAX_BUTTONS:
+        raise Exception("Compiled instruments can have up to {} chord buttons.".format(MAX_BUTTONS))
+    button_pins = [button["pin"] for button in buttons]
+
+    velocity = VelocityCurve(**description.get("velocity", {}))
+    if len(velocity.table) > 0xFFFF:
+        raise Exception("The velocity table is too long to compile; use a longer tick_us.")
+    midi_program = description.get("midi_program")
+    midi_channel = description.get("midi_channel", 0)
+
+    voicings = [tuning]
+    index = b""
+    flags = 0
+    modifier_mask = 0
+    index_length = 0
+    num_combos = 0
+    if buttons:
+        max_fret = description.get("max_fret", 4)
+        chords = [entry_notes(button, tuning, shapes, max_fret) for button in buttons]
+        combos = {}
+        for combo in description.get("combos", []):
+            ixs = [button if isinstance(button, int) else button_pins.index(button) for button in combo["buttons"]]
+            notes = entry_notes(combo, tuning, shapes, max_fret)
+            if notes is None:
+                raise Exception("A chord combination needs a chord or notes.")
+            combos[button_mask(ixs)] = notes
+
+        table = ChordTable(tuning, chords, combos)
+        modifier_mask = table.modifier_mask
+        num_combos = table.num_combos
+        voicings = [list(notes) if notes is not None else [MUTED] * len(tuning) for notes in table.voicings] # Modifier buttons have no chord of their own
+        if table.dense:
+            flags |= FLAG_DENSE
+            index_length = len(table.index)
+            if isinstance(table.index, bytearray):
+                index = bytes(table.index)
+            else:
+                flags |= FLAG_WIDE_INDEX
+                index = struct.pack("<{}H".format(index_length), *table.index)
+        else:
+            index_length = len(table.index)
+            index = b"".join(struct.pack(SPARSE_ENTRY_FORMAT, mask, voicing) for mask, voicing in sorted(table.index.items()))
+    if len(voicings) > 0xFFFF:
+        raise Exception("Too many chords to compile.")
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(string_pins), len(buttons), flags, len(voicings),
+                         NO_PROGRAM if midi_program is None else midi_program, midi_channel,
+                         velocity.tick_us, len(velocity.table), modifier_mask, index_length, num_combos)
+    names = b"".join(_pin_name(pin) for pin in [description.get("name")] + list(string_pins) + button_pins + [description.get("beam_pin")])
+    notes = b"".join(struct.pack("<{}h".format(len(tuning)), *row) for row in voicings)
+    return header + names + notes + index + bytes(velocity.table)
+
+if __name__ == "__main__":
+    # Compile a JSON instrument description
+    import sys
+    import json
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m twang.config <description.json> [compiled.twang]")
+        sys.exit(1)
+    with open(sys.argv[1]) as file:
+        description = json.load(file)
+    data = compile_instrument(description)
+    out = sys.argv[2] if len(sys.argv) == 3 else sys.argv[1].rsplit(".", 1)[0] + ".twang"
+    with open(out, "wb") as file:
+        file.write(data)
+    compiled = read_compiled(data)
+    print("Compiled {} ({} strings, {} chord buttons) into {}: {} bytes".format(
+        compiled.name or sys.argv[1], len(compiled.string_pins), len(compiled.button_pins), out, len(data)))
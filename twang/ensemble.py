@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ensemble.py: Several LightInstruments played from one Pico, in one scan loop, through one MIDI port
+
+A Pico has pins to spare for more than one instrument: e.g. a bass-string section on MIDI channel 1 and a melody
+section on channel 2, each with its own strings, chord buttons, tuning and synthesizer program. Build each one as a
+LightInstrument, with its own midi_channel and midi_program, and run them together:
+    from twang.ensemble import Ensemble
+    bass = LightInstrument(BASS_STRINGS, midi_channel=0, midi_program=33)
+    melody = LightInstrument(MELODY_STRINGS, chord_btns=CHORD_BTNS, midi_channel=1, midi_program=46)
+    Ensemble([bass, melody]).run()
+
+The Ensemble:
+* Gives every instrument a MidiChannel of one shared MidiOutput (see midiout.py), so that all of them queue their notes
+  into the same preallocated buffer, on their own channels
+* Writes the notes of every instrument to the USB MIDI port in one write per round, instead of one per instrument
+* Steps every instrument once per round, starting with a different one each round, so that no instrument is always
+  scanned first (or always last, after a long strum on another one)
+* With stats=True, counts the time spent stepping each instrument, to check that the scan cost is spread fairly
+
+Each instrument must have a MIDI channel of its own. Light sleep (idle_s) would put every instrument to sleep when one of
+them is idle, and zero_alloc would collect garbage while another instrument is being played, so neither can be used
+in an Ensemble. At most one instrument can read MIDI input (midi_in), since they would share the one input port.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from .midiout import MidiOutput, MidiChannel
+
+class Ensemble:
+    """ Runs several LightInstruments in one cooperative scan loop, sharing one MIDI output """
+
+    def __init__(self, instruments, stats=False):
+        if not instruments:
+            raise Exception("An Ensemble needs at least one LightInstrument.")
+        self.instruments = instruments
+        self.backend = instruments[0].backend
+        channels = []
+        for instrument in instruments:
+            if instrument.backend is not self.backend:
+                raise Exception("Every instrument in an Ensemble must use the same backend.")
+            if instrument.idle_policy or instrument.gc_policy:
+                raise Exception("Instruments in an Ensemble can't use idle_s or zero_alloc; one instrument would sleep or collect garbage while another is played.")
+            if instrument.midi.channel in channels:
+                raise Exception("Two instruments in an Ensemble are on MIDI channel {}; give each one a midi_channel of its own.".format(instrument.midi.channel))
+            channels.append(instrument.midi.channel)
+        if sum(1 for instrument in instruments if instrument.midi_in) > 1:
+            raise Exception("Only one instrument in an Ensemble can read MIDI input.")
+
+        # One output stage for every instrument; each queues its notes on its own channel
+        self.midi = MidiOutput(self.backend.midi_port(), size=96 * len(instruments))
+        self.channels = [MidiChannel(self.midi, instrument.midi.channel) for instrument in instruments]
+        for instrument, channel in zip(instruments, self.channels):
+            instrument.use_midi(channel)
+
+        self.first = 0 # Instrument stepped first in the next round
+        self.stats = stats
+        self.step_us = [0] * len(instruments) # Time spent stepping each instrument, in microseconds (with stats=True)
+        self.max_step_us = [0] * len(instruments) # Longest single step of each instrument
+        self.rounds = 0
+
+    def start(self):
+        """ Start every instrument (each plays its intro), ready for step() to be called in a loop """
+        for instrument in self.instruments:
+            instrument.start()
+        for channel in self.channels:
+            channel.deferred = True # From now on, step() writes every instrument's notes at once
+
+    def step(self):
+        """ One round of the ensemble loop: a pass of every instrument, starting from a different one each round """
+        instruments = self.instruments
+        count = len(instruments)
+        ix = self.first
+        for n in range(count):
+            if self.stats:
+                start_ns = self.backend.monotonic_ns()
+                instruments[ix].step()
+                step_us = (self.backend.monotonic_ns() - start_ns) // 1000
+                self.step_us[ix] += step_us
+                if step_us > self.max_step_us[ix]:
+                    self.max_step_us[ix] = step_us
+            else:
+                instruments[ix].step()
+            ix += 1
+            if ix == count:
+                ix = 0
+        self.midi.flush() # Every instrument's notes from this round, in one write
+        for instrument in instruments:
+            if instrument.stats:
+                instrument.stats.flushed() # Pluck-to-MIDI latency runs to this write, not to the instrument's own (deferred) flush
+        self.first += 1
+        if self.first == count:
+            self.first = 0
+        self.rounds += 1
+
+    def run(self):
+        """ Begins endless loop of the ensemble """
+        self.start()
+        while True:
+            self.step()
+
+    async def run_async(self, poll_ms=1):
+        """ Run every instrument's asyncio tasks together (see LightInstrument.run_async); asyncio shares the time between them.
+        Each instrument's MIDI task writes its own notes as soon as they're queued. """
+        import asyncio
+        for channel in self.channels:
+            channel.deferred = False
+        await asyncio.gather(*[instrument.run_async(poll_ms) for instrument in self.instruments])
+
+    def report(self):
+        """ Returns a dictionary of the ensemble counters """
+        return {
+            "rounds": self.rounds,
+            "step_us": list(self.step_us),
+            "max_step_us": list(self.max_step_us),
+        }
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fretboard.py: Chord shapes on a fretted instrument, with a capo and transposition that can change while playing
+
+A Fretboard holds every chord shape as one matrix of frets (one row per chord, one column per string, int8) and the open
+tuning as one row of notes. The notes of every chord are the whole matrix plus the tuning, as a single vectorized
+add with ulab, so moving the capo or transposing regenerates the whole chord table in one array operation:
+    from twang.fretboard import Fretboard
+    fretboard = Fretboard("E2 A2 D3 G3 B3 E4", [Am, G, F, C])
+    CHORD_BTNS = [ChordButton(pin, notes) for pin, notes in zip(PINS, fretboard.chords())]
+    myguitar = LightInstrument(strings=STRINGS, chord_btns=CHORD_BTNS, fretboard=fretboard)
+    myguitar.set_capo(2) # Every chord, and the open strings, two half-steps up
+The ChordButtons and the instrument's chord table are not rebuilt: their notes are rewritten in place (see LightInstrument.set_capo).
+
+Row 0 is always the open chord, and row i + 1 is shapes[i], in the order of the instrument's chord table voicings:
+list the chord buttons' shapes first, then the shapes of any chord combinations, so that they all follow the capo.
+
+In a shape, a muted string is x (-9999, as in the examples), None or "x"; it is stored as MUTED_FRET and always
+comes out as a muted note (-9999), wherever the capo is.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+from ._compat import numpy
+from .midinotes import getnotes
+from .state import MUTED
+
+MUTED_FRET = -1 # A muted string, in the fret matrix
+
+class Fretboard:
+    """ Matrix of chord shapes (chords x strings, in frets) over an open tuning, with a capo and transposition """
+
+    def __init__(self, tuning, shapes, capo=0, transpose=0):
+        """ tuning is a list of notes (midi numbers or names), or a string of note names separated by spaces (e.g. "G4 C4 E4 A4").
+        shapes is a list of chord shapes, each a list of frets, one per string. """
+        np = self.np = numpy()
+        tuning = getnotes(tuning)
+        for shape in shapes:
+            if len(shape) != len(tuning):
+                raise Exception("A chord shape has {} frets, but the tuning has {} strings.".format(len(shape), len(tuning)))
+        self.tuning = np.array(tuning, dtype=np.int16)
+        rows = [[0] * len(tuning)] + [[MUTED_FRET if fret is None or fret == "x" or fret < 0 else fret for fret in shape] for shape in shapes]
+        self.frets = np.array(rows, dtype=np.int8)
+        live = np.array([[0 if fret == MUTED_FRET else 1 for fret in row] for row in rows], dtype=np.int16)
+        self.live = live # 1 where a string plays, 0 where it's muted
+        self.muted = (1 - live) * MUTED # MUTED where a string is muted, 0 where it plays
+        self.num_strings = len(tuning)
+        self.capo = 0
+        self.transpose = 0
+        self.notes = None # Notes of every chord (chords x strings, int16)
+        self.voicings = [array("h", [MUTED] * self.num_strings) for row in rows] # The same notes, one array per chord, rewritten in place
+        self.update(capo, transpose)
+
+    def update(self, capo=None, transpose=None):
+        """ Regenerate the notes of every chord for a new capo fret and/or transposition (in half-steps) """
+        capo = self.capo if capo is None else capo
+        transpose = self.transpose if transpose is None else transpose
+        if capo < 0:
+            raise Exception("The capo can't go below the nut.")
+        np = self.np
+        notes = (self.frets + (self.tuning + (capo + transpose))) * self.live # Muted strings are 0 here...
+        if np.min(notes) < 0 or np.max(notes) > 127:
+            raise Exception("With the capo at {} and transposed by {}, some notes are out of the MIDI range (0 to 127).".format(capo, transpose))
+        self.notes = notes + self.muted # ...and MUTED here
+        self.capo = capo
+        self.transpose = transpose
+
+        flat = array("h", bytes(self.notes.tobytes())) # bytes, not the bytearray from ulab, so that array copies it whole
+        n = self.num_strings
+        for row in range(len(self.voicings)):
+            self.voicings[row][:] = flat[row * n:(row + 1) * n]
+
+    @property
+    def open_chord(self):
+        """ Notes of the open strings """
+        return self.voicings[0]
+
+    def chords(self):
+        """ Notes of every chord shape, in order (e.g. for ChordButtons) """
+        return self.voicings[1:]
+
+if __name__ == "__main__":
+    pass
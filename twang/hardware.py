@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+hardware.py: Hardware backend for LightInstruments running on a Pi Pico with CircuitPython
+
+Everything in Twang that touches pins, keypad scanners, the USB MIDI port or the clock goes through a "backend" object.
+On the Pico this is a CircuitPythonBackend (the default). On a regular computer, a SimBackend (see sim.py) can be passed
+to LightInstrument instead, so that instruments can be tested and benchmarked without any hardware.
+
+A backend provides:
+* keys(pins, value_when_pressed, pull, interval, max_events): a keypad.Keys-like scanner with an "events" queue
+* key_matrix(row_pins, column_pins, columns_to_anodes, interval, max_events): a keypad.KeyMatrix-like scanner
+* shift_register_keys(clock, data, latch, key_count, value_to_latch, value_when_pressed, interval, max_events): a keypad.ShiftRegisterKeys-like scanner
+* beam_capture(pins, value_when_pressed): a keypad.Keys-like scanner with microsecond timestamps, for a BeamCapture (see capture.py)
+* analog_input(pin): an analogio.AnalogIn-like object with a 16-bit "value", for AnalogStrings (see analog.py)
+* telemetry_port(): a serial port for binary telemetry frames (see telemetry.py)
+* event(): an empty keypad.Event-like object, for reuse with events.get_into()
+* output_pin(pin), input_pin(pin): DigitalInOut-like objects with a "value"
+* pin(name): the pin with that name (e.g. "GP16"), for instruments loaded from a compiled file (see config.py)
+* midi_port(): an object with a write(buffer) method
+* midi_in_port(): an object with a readinto(buffer, nbytes) method that returns at once with whatever has arrived, for MidiInput (see midiin.py)
+* ticks_ms(): millisecond clock, matching keypad event timestamps
+* monotonic_ns(): nanosecond clock, for timing short stretches of code
+* mem_alloc(): bytes of heap currently allocated, for counting allocations
+* sleep(seconds)
+* async_sleep(seconds): a coroutine that sleeps, for LightInstrument.run_async()
+* light_sleep(seconds, wake_pins): light sleep for up to seconds; returns True if woken early by one of wake_pins going low
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+class CircuitPythonBackend:
+    """ Backend that uses the real CircuitPython hardware modules """
+
+    def __init__(self):
+        # Imported here rather than at the top, so that twang can be imported on computers without these modules
+        import keypad
+        import digitalio
+        import usb_midi
+        import supervisor
+        import time
+        import gc
+        self._keypad = keypad
+        self._digitalio = digitalio
+        self._usb_midi = usb_midi
+        self._time = time
+        self._asyncio = None # Imported by async_sleep() on first use
+        self.ticks_ms = supervisor.ticks_ms
+        self.monotonic_ns = time.monotonic_ns
+        self.mem_alloc = gc.mem_alloc
+
+    def keys(self, pins, value_when_pressed=False, pull=True, interval=0.01, max_events=64):
+        return self._keypad.Keys(tuple(pins), value_when_pressed=value_when_pressed, pull=pull, interval=interval, max_events=max_events)
+
+    def key_matrix(self, row_pins, column_pins, columns_to_anodes=True, interval=0.01, max_events=64):
+        return self._keypad.KeyMatrix(tuple(row_pins), tuple(column_pins), columns_to_anodes=columns_to_anodes, interval=interval, max_events=max_events)
+
+    def shift_register_keys(self, clock, data, latch, key_count, value_to_latch=True, value_when_pressed=False, interval=0.01, max_events=64):
+        return self._keypad.ShiftRegisterKeys(clock=clock, data=data, latch=latch, key_count=key_count, value_to_latch=value_to_latch,
+                                              value_when_pressed=value_when_pressed, interval=interval, max_events=max_events)
+
+    def beam_capture(self, pins, value_when_pressed=False):
+        # Only needed by BeamCapture, so only imported when it's used
+        import rp2pio
+        import adafruit_pioasm
+        from .capture import CaptureKeys, capture_program, PIO_FREQUENCY
+        program = adafruit_pioasm.Program(capture_program(len(pins)))
+        sm = rp2pio.StateMachine(program.assembled, frequency=PIO_FREQUENCY, first_in_pin=pins[0], in_pin_count=len(pins),
+                                 pull_in_pin_up=0 if value_when_pressed else (1 << len(pins)) - 1, in_shift_right=False, **program.pio_kwargs)
+        return CaptureKeys(sm, len(pins), value_when_pressed=value_when_pressed, ticks_ms=self.ticks_ms)
+
+    def event(self):
+        return self._keypad.Event()
+
+    def output_pin(self, pin):
+        dio = self._digitalio.DigitalInOut(pin)
+        dio.direction = self._digitalio.Direction.OUTPUT
+        return dio
+
+    def input_pin(self, pin):
+        dio = self._digitalio.DigitalInOut(pin)
+        dio.direction = self._digitalio.Direction.INPUT
+        dio.pull = self._digitalio.Pull.UP
+        return dio
+
+    def pin(self, name):
+        import board # Only needed by compiled instruments, so only imported when it's used
+        if not hasattr(board, name):
+            raise Exception("This board has no pin named {}.".format(name))
+        return getattr(board, name)
+
+    def analog_input(self, pin):
+        import analogio # Only needed by AnalogStrings, so only imported when it's used
+        return analogio.AnalogIn(pin)
+
+    def midi_port(self):
+        return self._usb_midi.ports[1]
+
+    def midi_in_port(self):
+        return self._usb_midi.ports[0]
+
+    def telemetry_port(self):
+        import usb_cdc # Only needed for telemetry, so only imported when it's used
+        if usb_cdc.data is None:
+            raise Exception("Telemetry needs the usb_cdc data port. Add usb_cdc.enable(console=True, data=True) to boot.py and reset the Pico.")
+        return usb_cdc.data
+
+    def sleep(self, seconds):
+        self._time.sleep(seconds)
+
+    def light_sleep(self, seconds, wake_pins=()):
+        import alarm # Only needed by the idle policy, so only imported when it's used
+        alarms = [alarm.time.TimeAlarm(monotonic_time=self._time.monotonic() + seconds)]
+        alarms += [alarm.pin.PinAlarm(pin, value=False, edge=True, pull=True) for pin in wake_pins] # Wake on a new press, not on a button already held
+        woken_by = alarm.light_sleep_until_alarms(*alarms)
+        return isinstance(woken_by, alarm.pin.PinAlarm)
+
+    async def async_sleep(self, seconds):
+        if self._asyncio is None:
+            import asyncio # Only needed by run_async(), so only imported once it's used, and only the first time
+            self._asyncio = asyncio
+        await self._asyncio.sleep(seconds)
+
+_default_backend = None
+
+def default_backend():
+    """ Returns the shared CircuitPythonBackend, creating it on first use """
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = CircuitPythonBackend()
+    return _default_backend
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+health.py: Stuck beam detection for LightInstruments
+
+A misaligned laser or a covered sensor leaves its string "pressed" for good. Its release, whenever it finally comes,
+would time a pluck of minutes and play it. A StringHealth watches how long every string has been pressed, and:
+* Quarantines a string that has been pressed for longer than stuck_ms: its press is forgotten, so it can't play,
+  and it is left out of the idle policy's checks for broken beams (see power.py)
+* Recovers the string as soon as its release is handled; its next pluck plays normally, even before the next check
+
+The strings are checked every check_ms (not on every loop pass), with one pass over the packed press timestamps,
+so the check costs the same whether or not any strings are stuck. A stuck string sends no events of its own,
+so it costs the instrument loop nothing either: a degraded instrument runs its loop just as fast.
+
+Counters (see report()) give the strings in quarantine right now, how often each string has been quarantined,
+the total quarantines and recoveries, and the longest press seen, e.g. for telemetry.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+from .stats import ticks_diff
+from .state import NOT_PRESSED, STUCK
+
+class StringHealth:
+    """ Quarantines strings whose beams stay broken, and recovers them when the beam comes back """
+
+    def __init__(self, backend, state, stuck_ms=5000, check_ms=200, debug=False):
+        self.backend = backend # Provides ticks_ms()
+        self.state = state # The instrument's InstrumentState, with each string's press timestamp
+        self.stuck_ms = stuck_ms # A press longer than this is a stuck beam; far longer than the slowest pluck that changes velocity
+        self.check_ms = check_ms # Time between checks
+        self.debug = debug
+        self.stuck = bytearray(state.num_strings) # 1 while a string is quarantined
+        self.stuck_counts = array("H", [0] * state.num_strings) # Times each string has been quarantined
+        self.num_stuck = 0
+        self.last_check_ms = backend.ticks_ms()
+        self.reset()
+
+    def reset(self):
+        """ Zero the counters (strings in quarantine stay there) """
+        for ix in range(len(self.stuck_counts)):
+            self.stuck_counts[ix] = 0
+        self.quarantines = 0 # Times any string was quarantined
+        self.recoveries = 0 # Times any string recovered
+        self.max_press_ms = 0 # Longest time any string was seen pressed
+
+    def check(self):
+        """ Call regularly from the instrument loop; every check_ms, quarantines stuck strings and recovers released ones """
+        now = self.backend.ticks_ms()
+        if ticks_diff(now, self.last_check_ms) < self.check_ms:
+            return
+        self.last_check_ms = now
+
+        pressed_ticks_ms = self.state.pressed_ticks_ms
+        stuck = self.stuck
+        for ix in range(len(stuck)):
+            pressed = pressed_ticks_ms[ix]
+            if stuck[ix]:
+                # A string recovers as soon as its release is handled (see recover()), so a string still in quarantine
+                # hasn't been released: a press can only be a new scanner (e.g. after sleeping) reporting it again
+                if pressed == NOT_PRESSED:
+                    self.recover(ix)
+                elif pressed != STUCK:
+                    pressed_ticks_ms[ix] = STUCK
+            elif pressed != NOT_PRESSED:
+                press_ms = ticks_diff(now, pressed)
+                if press_ms > self.max_press_ms:
+                    self.max_press_ms = press_ms
+                if press_ms > self.stuck_ms:
+                    self.quarantine(ix)
+
+    def quarantine(self, ix):
+        """ Forget string ix's press, so its release can't play, until its beam is intact again """
+        self.state.pressed_ticks_ms[ix] = STUCK
+        self.state.pressed_ticks_us[ix] = NOT_PRESSED
+        self.stuck[ix] = 1
+        self.stuck_counts[ix] += 1
+        self.num_stuck += 1
+        self.quarantines += 1
+        if self.debug:
+            print("String #{} has been blocked for over {} ms; ignoring it until it's clear.".format(ix, self.stuck_ms))
+
+    def recover(self, ix):
+        """ Take string ix out of quarantine; called by the string when its stuck beam is released """
+        if not self.stuck[ix]:
+            return
+        self.stuck[ix] = 0
+        self.num_stuck -= 1
+        self.recoveries += 1
+        if self.debug:
+            print("String #{} has recovered.".format(ix))
+
+    def report(self):
+        """ Returns a dictionary of the health counters """
+        return {
+            "stuck": [ix for ix in range(len(self.stuck)) if self.stuck[ix]],
+            "stuck_counts": list(self.stuck_counts),
+            "quarantines": self.quarantines,
+            "recoveries": self.recoveries,
+            "max_press_ms": self.max_press_ms,
+        }
+
+if __name__ == "__main__":
+    pass
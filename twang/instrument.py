@@ -17,16 +17,14 @@ For use with the Pi Pico and CircuitPython.
 Created by Scott Feister June 28, 2024.
 """
 
-from time import sleep
-import ulab.numpy as np
-import board
-import keypad
-from digitalio import DigitalInOut, Direction, Pull
-import usb_midi
-import adafruit_midi
-from adafruit_midi.note_off import NoteOff
-from adafruit_midi.note_on import NoteOn
-from adafruit_midi.program_change import ProgramChange
+from array import array
+from .hardware import default_backend
+from .midiout import MidiOutput
+from .stats import LoopStats, ticks_diff
+from .velocity import VelocityCurve, default_curve
+from .voices import VoiceTable
+from .state import InstrumentState, NOT_PRESSED, STUCK, NOTE_OFF, PLAY, RELEASE
+from .chords import ChordTable, button_mask, check_notes, SMALL_INT_BUTTONS
 
 class LightInstrument:
     """
@@ -36,46 +34,172 @@ class LightInstrument:
     Example: A laser harp, an LED-based piano, or a laser guitar.
     """
 
-    def __init__(self, strings, open_chord=None, chord_btns=None, beam_pin=None, midi_program=None, midi_channel=0, debug=False):
-        """ If open_chord is specified, overrides the string values """
+    def __init__(self, strings, open_chord=None, chord_btns=None, beam_pin=None, midi_program=None, midi_channel=0, debug=False, backend=None, stats=False, velocity_curve="log", sensitivity=1.0, chord_combos=None, zero_alloc=False, idle_s=None, stuck_s=5, telemetry=False, sustain_ms=None, release_ms=0, max_polyphony=None, chord_table=None, fretboard=None, midi_in=False, velocity_curves=None, strum_detector=None):
+        """ strings is a list of LightStrings, a StringBank for large instruments read through shift registers,
+        a BeamCapture for microsecond pluck timing (see capture.py), or AnalogStrings for analog sensing (see analog.py).
+        If open_chord is specified, overrides the string values.
+        chord_btns is a list of ChordButtons, or a ChordMatrix for large banks of chord buttons.
+        chord_combos is an optional dictionary of {tuple of ChordButtons (or their indices) held together: notes}, e.g. {(C_btn, MINOR_btn): Cm_notes}.
+        velocity_curve and sensitivity set how pluck speed maps to loudness (see velocity.py); velocity_curve may also be a VelocityCurve.
+        With a BeamCapture, a named velocity_curve is compiled at the capture's resolution.
+        The backend defaults to the Pico's CircuitPython hardware; pass a sim.SimBackend to run without hardware.
+        If stats is True, loop timing and pluck-to-MIDI latency are counted in self.stats (see stats.py).
+        If zero_alloc is True, garbage collection is put off while the instrument is being played, and allocations are counted in self.gc_policy (see memory.py).
+        zero_alloc can't be used with analog sensing, a strum detector, telemetry or run_async(), which allocate in the instrument loop.
+        If idle_s is set, the instrument goes into a low-power sleep after idle_s seconds without being played (see power.py).
+        A string whose beam stays broken for longer than stuck_s seconds is ignored until it's clear, with counters in self.health (see health.py); None turns this off.
+        If telemetry is True, events, plucks, chord changes and loop stats are streamed as binary frames to the usb_cdc data port (see telemetry.py).
+        This costs microseconds per frame, where debug printing costs milliseconds per line.
+        sustain_ms and release_ms are the default sustain and release times for strings that don't set their own (see LightString).
+        Notes are only turned off once no string is sounding them; with max_polyphony set, the oldest note is turned off
+        to make room when more would sound at once (see voices.py).
+        chord_table is an already compiled ChordTable (e.g. from a compiled instrument, see load()); if set, chord_btns' notes and chord_combos are not used.
+        fretboard is the Fretboard the chords were made from, if any; set_capo() and set_transpose() regenerate every chord from it (see fretboard.py).
+        If midi_in is True, the USB MIDI input is read on every loop pass, for program changes, transposition, capo and velocity curve changes,
+        and uploads of compiled instruments, while the instrument is being played (see midiin.py).
+        velocity_curves is a list of velocity curves (names or VelocityCurves) to pick from with select_velocity_curve(), e.g. over MIDI.
+        strum_detector is a StrumDetector, which holds released strings back for a short window and plays them as one strum,
+        with even or shaped velocities, when they were strummed; True uses one with the default settings (see strum.py). """
 
+        if debug and zero_alloc:
+            raise Exception("Debug printing allocates memory in the instrument loop, so debug and zero_alloc can't both be turned on.")
+        if zero_alloc and strum_detector:
+            raise Exception("A strum detector allocates memory in the instrument loop, so it can't be used with zero_alloc.")
+        if zero_alloc and telemetry:
+            raise Exception("Telemetry allocates memory in the instrument loop as it writes, so it can't be used with zero_alloc.")
         self.debug = debug
+        self.backend = backend if backend is not None else default_backend() # Provides pins, keypad scanners, MIDI port and clock
+        self.string_bank = strings if isinstance(strings, StringBank) else None # Set if the strings are read through shift registers
+        if self.string_bank:
+            strings = self.string_bank.strings
+        source = getattr(strings, "source", None) # Recognizes a BeamCapture or AnalogStrings, without importing either
+        self.capture = strings if source == "capture" else None # Set if the strings are timed by a PIO state machine
+        if self.capture:
+            strings = self.capture.strings
+        self.analog = strings if source == "analog" else None # Set if the strings are read through the ADC
+        if self.analog:
+            if zero_alloc:
+                raise Exception("Analog sensing allocates memory in the instrument loop, so it can't be used with zero_alloc.")
+            strings = self.analog.strings
         self.num_strings = len(strings) # Count the number of strings
         self.strings = strings # A list of LightString objects
-        self.chord_btns = chord_btns # A list of ChordButton objects; if None, assume this is a harp-like instrument (no chord changes)
+        self.chord_matrix = chord_btns if isinstance(chord_btns, ChordMatrix) else None # Set if the chord buttons are wired as a matrix or shift registers
+        if self.chord_matrix:
+            chord_btns = self.chord_matrix.buttons
+        if zero_alloc and chord_btns is not None and len(chord_btns) > SMALL_INT_BUTTONS:
+            raise Exception("Chord button bitmasks past {} buttons allocate memory, so zero_alloc can't be turned on with {} chord buttons.".format(SMALL_INT_BUTTONS, len(chord_btns)))
+        self.chord_btns = chord_btns # A list of ChordButton objects (or a ChordMatrix); if None, assume this is a harp-like instrument (no chord changes)
+        self.fretboard = fretboard # "Fretboard" of chord shapes, for changing the capo or key while playing
+        if fretboard is not None and open_chord is None:
+            open_chord = fretboard.open_chord
         self.beam_pin = beam_pin # The GPIO output pin that controls the light source for the strings (e.g. the pin that controls the lasers)
                     
+        self.telemetry = None # Binary frames, written without blocking
+        if telemetry:
+            from .telemetry import Telemetry # Only needed for telemetry, so only imported when it's used
+            self.telemetry = Telemetry(self.backend, self.backend.telemetry_port())
+        
         # Set up the light source pin as an output
         if self.beam_pin:
-            self.beam = DigitalInOut(self.beam_pin)
-            self.beam.direction = Direction.OUTPUT
+            self.beam = self.backend.output_pin(self.beam_pin)
         else:
             self.beam = None
         
-        self.midi = adafruit_midi.MIDI(midi_out=usb_midi.ports[1], out_channel=midi_channel)
+        # All strings queue their notes into one shared output stage, which is flushed once per loop pass
+        self.midi = MidiOutput(self.backend.midi_port(), channel=midi_channel)
+        
+        # Which notes are sounding, shared by all strings, so that only the note-offs that are needed get sent
+        self.voices = VoiceTable(self.midi, max_polyphony=max_polyphony)
+        
+        # Deferred note-offs, strums and arpeggios, serviced on every loop pass; built by timer_wheel() once anything is deferred
+        self.scheduler = None
         
         if midi_program is not None: # if unset, leave the midi program selection alone
-            self.midi.send(ProgramChange(midi_program, channel=midi_channel))
+            self.midi.program_change(midi_program)
+        
+        # Compile the velocity curves once; all strings share the lookup table of the one in use
+        self.velocity_curve = self.compile_curve(velocity_curve, sensitivity)
+        self.velocity_curves = [self.compile_curve(curve, sensitivity) for curve in velocity_curves] if velocity_curves else [self.velocity_curve]
+        
+        # Every string's note, last note and press timestamp are packed into one shared state, indexed by string number
+        self.state = InstrumentState(self.num_strings)
+        for ix in range(self.num_strings):
+            strings[ix].bind(self.state, ix)
+        
+        self.health = None # Stuck beam quarantine, with counters read out by self.health.report()
+        if stuck_s is not None:
+            from .health import StringHealth # Only needed for stuck beam detection, so only imported when it's used
+            self.health = StringHealth(self.backend, self.state, stuck_ms=int(stuck_s * 1000), debug=debug)
         
         for string in strings:
+            string.velocities = self.velocity_curve.table
+            string.tick_us = self.velocity_curve.tick_us
             if not string.midi:
                 string.midi = self.midi
             if self.debug and not string.debug:
                 string.debug = True # enable string debugging if instrument is being debugged
+            string.telemetry = self.telemetry
+            string.voices = self.voices
+            string.health = self.health
+            if string.sustain_ms is None:
+                string.sustain_ms = sustain_ms
+            if string.release_ms is None:
+                string.release_ms = release_ms
+            if string.sustain_ms or string.release_ms:
+                self.timer_wheel() # Shared with every string
+        
+        # A single keypad scanner covers every string's phototransistor, so there is one event queue for the whole instrument.
+        # Each event's key_number is the index of the string it belongs to.
+        # The queue holds a press and a release for every string, so a full strum can't overflow it between loop passes.
+        self.keys = self.string_scanner()
+        # Reused for every event drained from the queue, so that polling doesn't allocate
+        if self.capture:
+            from .capture import CaptureEvent, ticks_diff_us # Already imported along with the BeamCapture
+            self.event = CaptureEvent()
+            for string in strings:
+                string.ticks_diff_us = ticks_diff_us
+        elif self.analog:
+            from .analog import AnalogEvent # Already imported along with the AnalogStrings
+            self.event = AnalogEvent()
+        else:
+            self.event = self.backend.event()
+        
+        self.midi_in = None # Live reconfiguration, with counters read out by self.midi_in.report()
+        if midi_in:
+            from .midiin import MidiInput # Only needed for live reconfiguration, so only imported when it's used
+            self.midi_in = MidiInput(self.backend.midi_in_port(), channel=midi_channel, debug=debug)
+        self.stats = LoopStats(self.backend, max_pending=self.num_strings) if stats else None # Timing counters, read out with self.stats.report()
+        self.gc_policy = None # Idle-time garbage collection and allocation counters, read out with self.gc_policy.report()
+        if zero_alloc:
+            from .memory import GCPolicy # Only needed for zero_alloc, so only imported when it's used
+            self.gc_policy = GCPolicy(self.backend)
+        self.last_event_ms = self.backend.ticks_ms() # Timestamp of the latest string or chord event
+        self.idle_policy = None # Low-power sleep, with counters read out by self.idle_policy.report()
+        if idle_s is not None:
+            from .power import IdlePolicy # Only needed for low-power sleep, so only imported when it's used
+            self.idle_policy = IdlePolicy(self.backend, idle_s=idle_s)
+        if strum_detector is True:
+            from .strum import StrumDetector # Only needed for strum detection, so only imported when it's used
+            strum_detector = StrumDetector()
+        self.strum_detector = strum_detector # Strums played as chords, with counters read out by self.strum_detector.report()
+        if self.strum_detector:
+            self.strum_detector.attach(self)
+            for string in strings:
+                string.strum_detector = self.strum_detector
         
         # Do a little blinky show
         if self.beam:
             for i in range(4):
                 self.beam.value = True # Turn on/off light source for the strings (e.g. turn on/off the lasers)
-                sleep(0.1)
+                self.backend.sleep(0.1)
                 self.beam.value = False
-                sleep(0.1)
+                self.backend.sleep(0.1)
 
         # Initialize notes on the strings with an open chord
         if open_chord is None:
-            self.open_chord = [string.note for string in strings] # The default chord is pulled from the strings as configured right now
+            self.open_chord = array("h", self.state.notes) # The default chord is pulled from the strings as configured right now
         else:
-            self.open_chord = open_chord
+            self.open_chord = array("h", open_chord)
         
         self.update_notes(self.open_chord)
         
@@ -85,146 +209,724 @@ class LightInstrument:
                 raise Exception("Number of notes in the open_chord does not match the number of LightStrings in the LightInstrument!")
             else:
                 for chord_btn in chord_btns:
-                    if len(chord_btn.notes) != len(strings):
+                    if chord_btn.notes is not None and len(chord_btn.notes) != len(strings):
                         raise Exception("Number of notes in ChordButton's chord does not match the number of LightStrings in the LightInstrument!")                
 
-            # Initialize chord activation array to all False (nothing pressed)
-            self.chord_status = np.array([False for btn in self.chord_btns]) # A True/False list of whether chord buttons are pressed
+            # Chord combinations are keyed on the bitmask of the buttons in them
+            combos = {}
+            if chord_combos:
+                for buttons, notes in chord_combos.items():
+                    check_notes(notes)
+                    if len(notes) != len(strings):
+                        raise Exception("Number of notes in a chord combination does not match the number of LightStrings in the LightInstrument!")
+                    combos[button_mask([btn if isinstance(btn, int) else chord_btns.index(btn) for btn in buttons])] = notes
+
+            # Precompile every chord voicing into a table indexed by the bitmask of pressed buttons
+            if chord_table is not None:
+                self.chord_table = chord_table
+            else:
+                self.chord_table = ChordTable(self.open_chord, [btn.notes for btn in chord_btns], combos)
+            
+            # The chord buttons are scanned in the background by keypad, like the strings; key_number is the index of the button
+            self.chord_keys = self.chord_scanner()
+            self.chord_event = self.backend.event() # Reused for every chord button event
+        else:
+            self.chord_table = None
+            self.chord_keys = None
+        
+        self.chord_mask = 0 # Bitmask of pressed chord buttons (bit i is set while chord_btns[i] is held); all released to start
+        self.chord_voicing = 0 # Index of the chord being played, in self.chord_table.voicings (0 is the open chord)
         
+    @classmethod
+    def load(cls, path, backend=None, **options):
+        """ Create the instrument described by a compiled instrument file (see config.py), without compiling anything at boot.
+        Other options (e.g. stats=True, idle_s=60) are passed on to LightInstrument. """
+        from .config import read_compiled # Only needed for compiled instruments, so only imported when it's used
+        backend = backend if backend is not None else default_backend()
+        with open(path, "rb") as file:
+            compiled = read_compiled(file.read())
+        strings = [LightString(pin=backend.pin(pin), note=compiled.open_chord[ix]) for ix, pin in enumerate(compiled.string_pins)]
+        chord_btns = None
+        if compiled.chord_table is not None:
+            table = compiled.chord_table
+            chord_btns = [ChordButton(pin=backend.pin(pin), notes=None if table.modifier_mask & (1 << ix) else table.voicings[ix + 1])
+                          for ix, pin in enumerate(compiled.button_pins)]
+        return cls(strings, chord_btns=chord_btns, chord_table=compiled.chord_table,
+                   beam_pin=backend.pin(compiled.beam_pin) if compiled.beam_pin else None,
+                   midi_program=compiled.midi_program, midi_channel=compiled.midi_channel,
+                   velocity_curve=VelocityCurve(compiled.velocity_table, tick_us=compiled.tick_us), backend=backend, **options)
+    
+    def use_midi(self, midi):
+        """ Queue notes on another MIDI output from now on, e.g. a MidiChannel of an Ensemble's shared output (see ensemble.py) """
+        for string in self.strings:
+            if string.midi is self.midi:
+                string.midi = midi
+        self.voices.midi = midi
+        self.midi = midi
+    
+    def compile_curve(self, curve, sensitivity=1.0):
+        """ A VelocityCurve for a curve shape (see velocity.py), or curve itself if it's already a VelocityCurve """
+        if isinstance(curve, VelocityCurve):
+            return curve
+        if self.capture:
+            return VelocityCurve(curve, sensitivity=sensitivity, min_ms=self.capture.min_ms, tick_us=self.capture.resolution_us)
+        return VelocityCurve(curve, sensitivity=sensitivity)
+    
+    def string_scanner(self):
+        """ Create a keypad scanner for the strings """
+        if self.string_bank:
+            return self.string_bank.scanner(self.backend)
+        if self.capture:
+            return self.capture.scanner(self.backend)
+        if self.analog:
+            return self.analog.scanner(self.backend)
+        return self.backend.keys([string.pin for string in self.strings], value_when_pressed=False, pull=True, interval=0.01, max_events=max(64, 2 * self.num_strings))
+    
+    def chord_scanner(self):
+        """ Create a keypad scanner for the chord buttons """
+        if self.chord_matrix:
+            return self.chord_matrix.scanner(self.backend)
+        return self.backend.keys([btn.pin for btn in self.chord_btns], value_when_pressed=False, pull=True, interval=0.01)
+    
+    def release_scanners(self):
+        """ Stop the keypad scanners, freeing their pins (e.g. for use as wake alarms) """
+        self.keys.deinit()
+        if self.chord_keys is not None:
+            self.chord_keys.deinit()
+    
+    def make_scanners(self):
+        """ Restart the keypad scanners after release_scanners() """
+        self.keys = self.string_scanner()
+        if self.chord_btns is not None:
+            self.chord_keys = self.chord_scanner()
+            # The new scanner starts with every button released, and reports buttons that are held down as new presses
+            self.chord_mask = 0
+            for btn in self.chord_btns:
+                btn.pressed = False
+    
+    def wake_pins(self, strings=True):
+        """ Pins that can wake the instrument from sleep: chord buttons, and (if strings is True) strings, when wired straight to pins """
+        pins = []
+        if self.chord_btns is not None and not self.chord_matrix:
+            pins += [btn.pin for btn in self.chord_btns]
+        if strings and not self.string_bank and not self.analog:
+            pins += [string.pin for string in self.strings]
+        return pins
+    
     def run(self):
         """ Begins endless loop of the instrument """           
+        self.start()
+        while True:
+            self.step()
+    
+    def start(self, beam=True):
+        """ Play an intro and turn on the light source (unless beam is False), ready for step() to be called in a loop """
         # Play an intro diddy
         self.strings[0].play()
+        self.midi.flush()
 
         print("Instrument starting, ready to play!")
-        if self.beam:
+        if self.beam and beam:
             self.beam.value = True # Turn on light source for the strings (e.g. turn on the lasers)
-            
+        
+        if self.stats:
+            self.stats.reset() # Don't count the setup and intro as a loop stall
+        if self.gc_policy:
+            self.last_event_ms = self.backend.ticks_ms()
+            self.gc_policy.start(self.last_event_ms)
+    
+    def step(self):
+        """ A single pass of the instrument loop """
+        if self.gc_policy:
+            self.gc_policy.begin()
+        if self.stats:
+            self.stats.loop()
+        
+        # Check for chord changes, and if so,
+        #     update strings' notes
+        self.check_for_chord_change()
+        
+        # Check if any strings have been plucked,
+        #      and if so, queue midi messages
+        self.check_strings()
+        if self.stats and not self.stats.events_overflowed and self.keys.events.overflowed:
+            self.stats.events_overflowed = True # e.g. a BeamCapture's ring was written over before the loop came around
+        
+        # Play the strings held back for a strum, once its window has closed
+        if self.strum_detector:
+            self.strum_detector.check()
+        
+        # Queue any deferred notes that are due
+        if self.scheduler and self.scheduler.pending:
+            self.scheduler.service()
+        
+        # Send all notes from this pass to the synthesizer in one burst
+        notes_sent = self.midi.length
+        self.midi.flush()
+        if self.stats and not self.midi.deferred: # A deferred channel's notes are written later, by its owner (e.g. an Ensemble), which records this then
+            self.stats.flushed()
+        if self.health:
+            self.health.check()
+        if self.telemetry:
+            if self.stats:
+                self.telemetry.stats(self.stats)
+            self.telemetry.flush()
+        
+        # Apply any reconfiguration that has arrived over MIDI, ready for the next pass
+        if self.midi_in:
+            self.midi_in.service(self)
+        if self.gc_policy:
+            self.gc_policy.end(self.last_event_ms)
+        
+        # Sleep if no one has played for a while
+        if self.idle_policy:
+            if notes_sent:
+                self.idle_policy.noted()
+            self.idle_policy.check(self)
+    
+    async def run_async(self, poll_ms=1):
+        """
+        Run the instrument as a set of asyncio tasks, so that other tasks (status LEDs, a display, ...) can run on the Pico too.
+        Requires the CircuitPython "asyncio" library. Use it like this:
+            asyncio.run(myinstrument.run_async())
+        or gather it with your own tasks.
+        
+        Tasks:
+        * Strings: every poll_ms, drains the string events (if any), checks for stuck beams, and wakes the MIDI task
+        * Chords: every poll_ms, applies chord button changes (if any), and reconfiguration over MIDI (if midi_in is True)
+        * MIDI: sleeps until the strings task has queued notes, then flushes them in one write
+        * Beam: turns on the light source once the intro has played, and puts the instrument to sleep when idle (if idle_s is set)
+        
+        keypad only reports changes once per scan interval (10 ms), and the strings task picks them up
+        within poll_ms, so the pluck-to-MIDI latency is at most poll_ms (1 ms) plus one round of the tasks
+        after keypad reports the release. The run() loop's bound is one loop pass, so poll_ms=0 matches it exactly,
+        while poll_ms=1 frees the processor between polls. benchmarks/bench_async.py checks this with the simulated backend.
+        
+        asyncio itself allocates memory as tasks sleep and wake, so run_async() can't be used with zero_alloc.
+        """
+        if self.gc_policy:
+            raise Exception("asyncio allocates memory as tasks sleep and wake, so run_async() can't be used with zero_alloc.")
+        import asyncio
+        self.start(beam=False)
+        self.midi_ready = asyncio.Event() # Set by the strings task when notes are waiting to be flushed
+        poll_s = poll_ms / 1000
+        await asyncio.gather(self._scan_strings_task(poll_s), self._scan_chords_task(poll_s), self._flush_midi_task(), self._beam_task())
+    
+    async def _scan_strings_task(self, poll_s):
+        sleep = self.backend.async_sleep
+        while True:
+            if self.stats:
+                self.stats.loop()
+            if self.keys.events: # Not cached, since the scanner is replaced after sleeping
+                self.check_strings()
+            if self.stats and not self.stats.events_overflowed and self.keys.events.overflowed:
+                self.stats.events_overflowed = True
+            if self.strum_detector:
+                self.strum_detector.check()
+            if self.scheduler and self.scheduler.pending:
+                self.scheduler.service()
+            if self.midi.length:
+                self.midi_ready.set()
+            if self.health:
+                self.health.check()
+            if self.telemetry:
+                if self.stats:
+                    self.telemetry.stats(self.stats)
+                self.telemetry.flush()
+            await sleep(poll_s)
+    
+    async def _scan_chords_task(self, poll_s):
+        sleep = self.backend.async_sleep
         while True:
-            # Check for chord changes, and if so,
-            #     update strings' notes
             self.check_for_chord_change()
-            
-            # Check if any strings have been plucked,
-            #      and if so, send midi messages
+            if self.midi_in:
+                self.midi_in.service(self)
+            await sleep(poll_s)
+    
+    async def _flush_midi_task(self):
+        while True:
+            await self.midi_ready.wait()
+            self.midi_ready.clear()
+            self.midi.flush()
+            if self.stats:
+                self.stats.flushed()
+            if self.idle_policy:
+                self.idle_policy.noted()
+    
+    async def _beam_task(self):
+        if self.beam:
+            self.beam.value = True # Turn on light source for the strings (e.g. turn on the lasers)
+        while self.idle_policy:
+            await self.backend.async_sleep(0.1)
+            self.idle_policy.check(self) # Light sleep pauses every task until the instrument is played again
+    
+    def fire(self, kind, arg, value):
+        """ Carry out a scheduled event (see scheduler.py) """
+        if kind == NOTE_OFF: # The end of a string's sustain; the string has nothing left to stop
+            self.voices.stop(arg, self.state.last_epochs[value])
+            self.state.pending_offs[value] = -1
+            self.state.last_notes[value] = -1
+        elif kind == RELEASE:
+            self.voices.stop(arg, value)
+        elif kind == PLAY:
+            self.strings[arg].play(velocity=value)
+    
+    def timer_wheel(self):
+        """ The TimerWheel shared by the instrument and its strings, built the first time anything needs to be deferred.
+        With zero_alloc, call it before playing if strum() or arpeggio() will be used, so that the wheel isn't allocated mid-song. """
+        if self.scheduler is None:
+            from .scheduler import TimerWheel # Only needed for sustain and release times, strums and arpeggios, so only imported when it's used
+            self.scheduler = TimerWheel(self.backend, self.fire)
             for string in self.strings:
-                string.check_and_play()
+                string.scheduler = self.scheduler
+        return self.scheduler
+    
+    def strum(self, spread_ms=15, velocity=100, down=True):
+        """ Play every string at its current note, one after another spread_ms apart (from the first string if down, else from the last) """
+        scheduler = self.timer_wheel()
+        for ix in range(self.num_strings):
+            scheduler.schedule(ix * spread_ms, PLAY, ix if down else self.num_strings - 1 - ix, velocity)
+    
+    def arpeggio(self, pattern, step_ms=120, velocity=90, repeats=1):
+        """ Play the strings listed in pattern (string indices, e.g. [0, 2, 4, 2]) in turn, step_ms apart, repeats times.
+        Each string plays whatever its note is when its turn comes, so an arpeggio follows chord changes. """
+        scheduler = self.timer_wheel()
+        for repeat in range(repeats):
+            for ix in range(len(pattern)):
+                scheduler.schedule((repeat * len(pattern) + ix) * step_ms, PLAY, pattern[ix], velocity)
+    
+    def check_strings(self):
+        """ Drain the shared string event queue in one pass, handing each event to the string it belongs to """
+        if self.capture:
+            while self.keys.events.get_into(self.event):
+                self.last_event_ms = self.event.timestamp
+                if self.strings[self.event.key_number].check_and_play_us(self.event) and self.stats:
+                    self.stats.queued(self.event.timestamp)
+            return
+        if self.analog:
+            while self.keys.events.get_into(self.event): # Each check sweeps the ADC, if a sweep is due
+                self.last_event_ms = self.event.timestamp
+                if self.strings[self.event.key_number].check_and_play(self.event, self.event.scale) and self.stats:
+                    self.stats.queued(self.event.timestamp)
+            return
+        while self.keys.events.get_into(self.event): # get_into returns False once the queue is empty
+            self.last_event_ms = self.event.timestamp
+            if self.strings[self.event.key_number].check_and_play(self.event) and self.stats:
+                self.stats.queued(self.event.timestamp)
     
     def update_notes(self, notes):
         """ Update the instrument's notes, e.g. when shifting chords """           
-        for note, string in zip(notes, self.strings):
-            string.change_note(note)
+        self.state.apply(notes) # A single copy when notes is a chord voicing
+    
+    def set_voicings(self, voicings):
+        """ Rewrite the notes of every chord in place, in the order of the chord table (voicings[0] is the open chord),
+        and switch the strings to the new notes of the chord being held. Voicings past the end of the list are left as they are. """
+        self.open_chord[:] = array("h", voicings[0])
+        if self.chord_table is not None:
+            table = self.chord_table.voicings
+            for ix in range(min(len(voicings), len(table))):
+                if table[ix] is not None:
+                    table[ix][:] = array("h", voicings[ix])
+            self.update_notes(table[self.chord_voicing])
+        else:
+            self.update_notes(self.open_chord)
+    
+    def set_velocity_curve(self, curve):
+        """ Switch every string to a compiled VelocityCurve """
+        self.velocity_curve = curve
+        for string in self.strings:
+            string.velocities = curve.table
+            string.tick_us = curve.tick_us
+    
+    def select_velocity_curve(self, ix):
+        """ Switch to velocity curve number ix of the velocity_curves the instrument was created with """
+        if not 0 <= ix < len(self.velocity_curves):
+            raise Exception("There is no velocity curve #{}; the instrument has {}.".format(ix, len(self.velocity_curves)))
+        self.set_velocity_curve(self.velocity_curves[ix])
+    
+    def apply_compiled(self, compiled):
+        """ Switch to the chords, velocity curve and MIDI program of a compiled instrument (see config.py), e.g. uploaded over MIDI.
+        It must have the same number of strings and chord buttons; its pins are not used. """
+        num_buttons = len(self.chord_btns) if self.chord_btns is not None else 0
+        if len(compiled.string_pins) != self.num_strings or len(compiled.button_pins) != num_buttons:
+            raise Exception("A compiled instrument with {} strings and {} chord buttons doesn't fit this instrument, which has {} and {}.".format(
+                len(compiled.string_pins), len(compiled.button_pins), self.num_strings, num_buttons))
+        # Everything is ready before anything is switched, so the next pass sees all of the new instrument
+        self.open_chord = compiled.open_chord
+        if compiled.chord_table is not None:
+            table = compiled.chord_table
+            for ix in range(num_buttons):
+                self.chord_btns[ix].notes = None if table.modifier_mask & (1 << ix) else table.voicings[ix + 1]
+            self.chord_table = table
+            self.chord_voicing = table.lookup(self.chord_mask)
+            self.update_notes(table.voicings[self.chord_voicing])
+        else:
+            self.update_notes(self.open_chord)
+        self.fretboard = None # The chords no longer come from it
+        self.set_velocity_curve(VelocityCurve(compiled.velocity_table, tick_us=compiled.tick_us))
+        if compiled.midi_program is not None:
+            self.midi.program_change(compiled.midi_program)
+    
+    def set_capo(self, fret):
+        """ Move the fretboard's capo to fret (0 for none), regenerating every chord (see fretboard.py) """
+        if self.fretboard is None:
+            raise Exception("This instrument has no Fretboard to put a capo on.")
+        self.fretboard.update(capo=fret)
+        self.set_voicings(self.fretboard.voicings)
+    
+    def set_transpose(self, half_steps):
+        """ Transpose every chord of the fretboard by half_steps (0 for none), e.g. to change key (see fretboard.py) """
+        if self.fretboard is None:
+            raise Exception("This instrument has no Fretboard to transpose.")
+        self.fretboard.update(transpose=half_steps)
+        self.set_voicings(self.fretboard.voicings)
                                 
     def check_for_chord_change(self):
-        """ Update the currently implemented chord, only if new button has been pressed """
-        if self.chord_btns is not None:
-            chord_status = np.array([btn.is_pressed() for btn in self.chord_btns]) # List of True/False on whether buttons are pressed
-            if np.sum((chord_status - self.chord_status)**2) > 0:
-                # Update the chord array for future comparison
-                self.chord_status = chord_status
-    
-                # Find the new chord notes
-                if not np.any(chord_status):
-                    notes = self.open_chord # No buttons pressed; use the open chord nontes
-                    if self.debug:
-                        print("Changing to open chord.")
-                else:
-                    ix = np.argmax(chord_status) # Index of the depressed chord (first occurrence), if applicable
-                    notes = self.chord_btns[ix].notes
-                    if self.debug:
-                        print("Changing to chord #{}.".format(ix))
-
-                # Apply the new chord notes to the strings
-                self.update_notes(notes)
+        """ Update the currently implemented chord, only if a chord button has been pressed or released """
+        if self.chord_keys is None or not self.chord_keys.events:
+            return # Nothing has changed, so there is nothing to do
+        
+        # Fold the button events into the bitmask of pressed buttons
+        mask = self.chord_mask
+        while self.chord_keys.events.get_into(self.chord_event):
+            ix = self.chord_event.key_number
+            self.last_event_ms = self.chord_event.timestamp
+            if self.chord_event.pressed:
+                mask |= 1 << ix
+            else:
+                mask &= ~(1 << ix)
+            self.chord_btns[ix].pressed = self.chord_event.pressed
+        if mask == self.chord_mask:
+            return # e.g. a button was pressed and released between passes
+        
+        if self.stats:
+            start_ns = self.backend.monotonic_ns()
+        self.chord_mask = mask
+        
+        # Find the new chord notes
+        ix = self.chord_table.lookup(mask) # 0 for the open chord, 1 + the index of a chord button, or past those for a chord combination
+        if ix == self.chord_voicing:
+            return # e.g. a modifier button was pressed on its own
+        self.chord_voicing = ix
+        if self.debug:
+            if ix == 0:
+                print("Changing to open chord.")
+            elif ix <= len(self.chord_btns):
+                print("Changing to chord #{}.".format(ix - 1))
+            else:
+                print("Changing to chord combination #{}.".format(ix - 1 - len(self.chord_btns)))
+        
+        # Apply the new chord notes to the strings
+        self.update_notes(self.chord_table.voicings[ix])
+        if self.telemetry:
+            self.telemetry.chord(ix, mask)
+        if self.stats:
+            self.stats.chord_changed(start_ns)
                                 
 class ChordButton:
     """
     A single chord and the button that activates it.
-    Optional for LightInstruments.
+    Optional for LightInstruments. The button's pin is scanned by the LightInstrument.
     
     Midi note values less than -1 are ignored in Twang.
+    
+    A ChordButton with notes=None is a modifier (e.g. "minor" or "7th"): it has no chord of its own,
+    and only changes the chord when held together with other buttons (see chord_combos in LightInstrument).
     """
-    def __init__(self, pin, notes, debug=False):
+    def __init__(self, pin, notes=None, debug=False):
         self.debug = debug
+        self.pressed = False # Updated by the LightInstrument, which scans the button's pin
         
         self.notes = notes # A list of midi notes in this chord. E.g. notes = [12, 18, 19, 30, 41]. Should match number of strings. 
 
-        notes_set = set([x for x in notes if x > -1]) # Exclude negative numbers, as these are assumed to be unusable later in the code
-            
-        if not notes_set.issubset(set(range(128))): # Check that notes list contains only valid midi notes
-            raise Exception("Invalid notes. All midi notes must be integers the range of 0 to 127.")
+        if notes is not None:
+            check_notes(notes)
 
-        self.pin = pin # BCM pin number
-        
-        self.dio = DigitalInOut(self.pin)
-        self.dio.direction = Direction.INPUT
-        self.dio.pull = Pull.UP
+        self.pin = pin # "board" pin number for the button
         
     def is_pressed(self):
-        return not self.dio.value
+        return self.pressed
+        
+
+class ChordMatrix:
+    """
+    A large bank of chord buttons, scanned by keypad in the background.
+    Optional for LightInstruments, in place of a list of ChordButtons.
+    
+    The buttons are either wired as a key matrix (row_pins and column_pins, using keypad.KeyMatrix),
+    or read through a chain of 74HC165 shift registers (clock, data and latch pins, using keypad.ShiftRegisterKeys).
+    A 4x8 matrix takes 12 pins for 32 chords; a shift register chain takes 3 pins for any number of chords.
+    
+    chords lists the notes for each button in keypad key_number order (for a matrix, row by row).
+    An entry of None makes that button a modifier, like ChordButton(pin) with no notes.
+    Each button is available as a ChordButton (with no pin) in self.buttons, e.g. for chord_combos.
+    
+    Pressed buttons are tracked as a bitmask, which only stays allocation-free up to 30 buttons (see chords.py);
+    a bigger bank works, but can't be used with zero_alloc.
+    """
+    def __init__(self, chords, row_pins=None, column_pins=None, columns_to_anodes=True,
+                 clock=None, data=None, latch=None, value_to_latch=True, value_when_pressed=False, interval=0.01, debug=False):
+        self.debug = debug
+        self.buttons = [ChordButton(pin=None, notes=notes, debug=debug) for notes in chords] # Checks the notes, just like ChordButtons do
+        
+        if row_pins is not None and column_pins is not None:
+            if len(row_pins) * len(column_pins) != len(chords):
+                raise Exception("A ChordMatrix with {} rows and {} columns needs exactly {} chords.".format(len(row_pins), len(column_pins), len(row_pins) * len(column_pins)))
+        elif clock is None or data is None or latch is None:
+            raise Exception("A ChordMatrix needs either row_pins and column_pins, or clock, data and latch pins.")
+        
+        self.row_pins = row_pins
+        self.column_pins = column_pins
+        self.columns_to_anodes = columns_to_anodes # Diode direction in the matrix
+        self.clock = clock
+        self.data = data
+        self.latch = latch
+        self.value_to_latch = value_to_latch
+        self.value_when_pressed = value_when_pressed
+        self.interval = interval
+        
+    def scanner(self, backend):
+        """ Create the keypad scanner for these buttons, using the LightInstrument's hardware backend """
+        max_events = max(64, 2 * len(self.buttons))
+        if self.row_pins is not None:
+            return backend.key_matrix(self.row_pins, self.column_pins, columns_to_anodes=self.columns_to_anodes, interval=self.interval, max_events=max_events)
+        return backend.shift_register_keys(clock=self.clock, data=self.data, latch=self.latch, key_count=len(self.buttons),
+                                           value_to_latch=self.value_to_latch, value_when_pressed=self.value_when_pressed, interval=self.interval, max_events=max_events)
+    
+    def __len__(self):
+        return len(self.buttons)
+    
+    def __getitem__(self, ix):
+        return self.buttons[ix]
+
+class StringBank:
+    """
+    A large set of strings whose phototransistors are read through a chain of 74HC165 shift registers.
+    Use in place of a list of LightStrings, e.g. for a 48-string harp or an 88-key optical keyboard.
+    
+    The shift registers are read by keypad.ShiftRegisterKeys in the background, just like keypad.Keys reads
+    the pins of individual LightStrings. Events carry the same millisecond timestamps, so pluck timing and
+    velocity work exactly as they do for LightStrings wired straight to pins.
+    
+    Each string is available as a LightString (with no pin) in self.strings, in shift register order
+    (the first bit shifted out is string 0).
+    
+    Worst-case scan period: keypad reads every bit once per interval (0.01 s by default), and clocking in
+    one bit takes roughly SHIFT_REGISTER_BIT_US microseconds. A string change is reported at most one
+    interval plus one full read after it happens:
+    *  48 strings (6 registers):  10 ms + ~0.1 ms
+    *  88 strings (11 registers): 10 ms + ~0.2 ms
+    worst_case_scan_ms gives the estimate for this bank.
+    """
+    SHIFT_REGISTER_BIT_US = 2 # Conservative time for keypad to clock in and read one bit
+    
+    def __init__(self, notes, clock, data, latch, value_to_latch=True, value_when_pressed=False, interval=0.01, debug=False):
+        self.debug = debug
+        self.strings = [LightString(pin=None, note=note, debug=debug) for note in notes] # One logical string per shift register bit
+        self.clock = clock # "board" pin for the shift register clock
+        self.data = data # "board" pin for the serial data out of the last register in the chain
+        self.latch = latch # "board" pin for the shift register latch (parallel load)
+        self.value_to_latch = value_to_latch
+        self.value_when_pressed = value_when_pressed # Pin value while a beam is broken
+        self.interval = interval # Seconds between scans
         
+    @property
+    def worst_case_scan_ms(self):
+        """ Longest time from a beam changing to keypad noticing it, in milliseconds """
+        return self.interval * 1000 + len(self.strings) * self.SHIFT_REGISTER_BIT_US / 1000
+        
+    def scanner(self, backend):
+        """ Create the keypad scanner for these strings, using the LightInstrument's hardware backend """
+        return backend.shift_register_keys(clock=self.clock, data=self.data, latch=self.latch, key_count=len(self.strings),
+                                           value_to_latch=self.value_to_latch, value_when_pressed=self.value_when_pressed,
+                                           interval=self.interval, max_events=max(64, 2 * len(self.strings)))
+    
+    def __len__(self):
+        return len(self.strings)
+    
+    def __getitem__(self, ix):
+        return self.strings[ix]
 
 class LightString:
     """
     A single string in the LightInstrument
     
-    Includes the beam of light, photodetector, and its assigned midi note
+    Includes the beam of light, photodetector, and its assigned midi note.
+    The photodetector pin is scanned by the LightInstrument, which passes this string its keypad events.
+    
+    The string's note, last played note and press timestamp live in an InstrumentState (see state.py),
+    shared by all strings of the LightInstrument; the LightString is a view of its own entry.
     """
     
-    def __init__(self, pin, note=72, midi=None, debug=False):
+    def __init__(self, pin, note=72, midi=None, debug=False, sustain_ms=None, release_ms=None):
+        """ sustain_ms: if set, each note is turned off this long after it starts, instead of ringing until the string plays again.
+        release_ms: when the string plays a new note, its old note keeps ringing this much longer, instead of stopping at once.
+        Both default to the LightInstrument's. """
         self.debug = debug
         self.pin = pin # "board" pin number for phototransistor
-        self.midi = midi # "adafruit_midi" MIDI instance (if left as None, nothing will play)
-        self.note = note # MIDI note
-        self.last_note = self.note
-        self.pressed_ticks_ms = None
-        self.keys = keypad.Keys((self.pin,), value_when_pressed=False, pull=True, interval=0.01)
+        self.midi = midi # "MidiOutput" instance, usually shared with the LightInstrument (if left as None, nothing will play)
+        self.state = InstrumentState(1, [note]) # Holds this string's note until the LightInstrument binds it to the shared state
+        self.index = 0 # This string's index in self.state
+        self.velocities = default_curve().table # Velocity lookup table, indexed by pluck duration in ticks; replaced by the LightInstrument's
+        self.tick_us = default_curve().tick_us # Pluck duration of each velocity table entry, in microseconds
+        self.telemetry = None # "Telemetry" instance shared with the LightInstrument, if it streams telemetry
+        self.scheduler = None # "TimerWheel" shared with the LightInstrument, for sustain and release times
+        self.voices = None # "VoiceTable" shared with the LightInstrument; if None, notes go straight to midi
+        self.strum_detector = None # "StrumDetector" shared with the LightInstrument, if plucks are held back to detect strums
+        self.health = None # "StringHealth" shared with the LightInstrument, told when this string's stuck beam is released
+        self.ticks_diff_us = None # Microsecond tick difference, set by the LightInstrument for strings timed by a BeamCapture
+        self.sustain_ms = sustain_ms
+        self.release_ms = release_ms
         
-        self.xp = np.logspace(np.log10(10), np.log10(200), num=20) # for interpolating pluck duration
-        self.yp = np.linspace(127, 30, num=20)
+    def bind(self, state, index):
+        """ Move this string's note, last note and press timestamp into entry index of a shared InstrumentState """
+        state.notes[index] = self.note
+        state.last_notes[index] = self.last_note
+        state.pressed_ticks_ms[index] = self.state.pressed_ticks_ms[self.index]
+        state.pressed_ticks_us[index] = self.state.pressed_ticks_us[self.index]
+        state.pending_offs[index] = self.state.pending_offs[self.index]
+        state.last_epochs[index] = self.state.last_epochs[self.index]
+        self.state = state
+        self.index = index
+        
+    @property
+    def note(self):
+        """ MIDI note for the next pluck """
+        return self.state.notes[self.index]
+    
+    @note.setter
+    def note(self, note):
+        self.state.notes[self.index] = note
+        
+    @property
+    def last_note(self):
+        """ MIDI note most recently played """
+        return self.state.last_notes[self.index]
+    
+    @last_note.setter
+    def last_note(self, note):
+        self.state.last_notes[self.index] = note
+        
+    @property
+    def pressed_ticks_ms(self):
+        """ Timestamp, in milliseconds, of the press of the string (None if it isn't pressed, or is stuck) """
+        ticks = self.state.pressed_ticks_ms[self.index]
+        return None if ticks in (NOT_PRESSED, STUCK) else ticks
         
     def change_note(self, note):
         """Update the note for the next pluck """
-        self.note = note # Update the midi note without affecting currently-playing sounds
+        self.state.notes[self.index] = note # Update the midi note without affecting currently-playing sounds
 
     def play(self, velocity=127):
-        """ Play sound using the midi output"""
+        """ Queue sound on the midi output (it is sent when the output is flushed). Returns True if a note was queued. """
         if not self.midi:
             raise Exception("MIDI not initialized properly for this string, so we can't play anything.")
-            
-        if self.note > -1: # Exclude case of -9999, which we are using to represent an unpluckable string
-            msg_note_off = NoteOff(self.last_note) # Stop playing old sound
-            msg_note_on = NoteOn(self.note, velocity=velocity) # Play new sound
-            self.midi.send([msg_note_off, msg_note_on])
+        
+        state, ix = self.state, self.index
+        note = state.notes[ix]
+        if note > -1: # Exclude case of -9999, which we are using to represent an unpluckable string
+            last_note = state.last_notes[ix]
+            scheduler, voices = self.scheduler, self.voices
+            if state.pending_offs[ix] >= 0: # The old sound's sustain hasn't run out; its note-off is handled here instead
+                scheduler.cancel(state.pending_offs[ix])
+                state.pending_offs[ix] = -1
+            if last_note > -1:
+                if self.release_ms and scheduler and last_note != note:
+                    scheduler.schedule(self.release_ms, RELEASE, last_note, state.last_epochs[ix]) # Let the old sound ring on a little
+                elif voices:
+                    voices.stop(last_note, state.last_epochs[ix]) # Stop playing old sound, unless another string is sounding it too
+                else:
+                    self.midi.note_off(last_note) # Stop playing old sound
+            if voices:
+                state.last_epochs[ix] = voices.start(note, velocity) # Play new sound
+            else:
+                self.midi.note_on(note, velocity=velocity) # Play new sound
+            if self.sustain_ms and scheduler:
+                state.pending_offs[ix] = scheduler.schedule(self.sustain_ms, NOTE_OFF, note, ix)
 
-            self.last_note = self.note # Update the last_note variable
+            state.last_notes[ix] = note # Update the last_note variable
+            return True
+        return False
             
-    def check_and_play(self):
-        event = self.keys.events.get() # event will be None if nothing has happened
+    def check_and_play(self, event, scale=128):
+        """ Handle a keypad event for this string, playing the note when the string is released. Returns True if a note was queued.
+        The velocity is multiplied by scale / 128 (e.g. from the depth of an analog beam break). """
         if event: # a string has either been pressed or released
+            if self.telemetry:
+                self.telemetry.event(self.index, event.pressed, event.timestamp)
+            pressed_ticks_ms = self.state.pressed_ticks_ms
             if event.pressed:
                 # When string is pressed, mark down a timestamp and remain silent
-                self.pressed_ticks_ms = event.timestamp  # timestamp, in milliseconds, for the press of the string
+                pressed_ticks_ms[self.index] = event.timestamp  # timestamp, in milliseconds, for the press of the string
             if event.released:
                 # When string is released, sound the note at a volume proportional to the time elapsed between press and release
-                self.keys.events.clear()
-                
-                if not self.pressed_ticks_ms: # string wasn't yet plucked
-                    return # abort early since string wasn't actually plucked
+                pressed_ms = pressed_ticks_ms[self.index]
+                pressed_ticks_ms[self.index] = NOT_PRESSED # The beam is intact again
+                if self.health and self.health.stuck[self.index]:
+                    self.health.recover(self.index) # Out of quarantine at once, so the next press counts (see health.py)
+                    return False # The press was the stuck beam, not a pluck
+                if pressed_ms < 0: # string wasn't yet plucked (NOT_PRESSED or STUCK; a press at 0 ms, after a wraparound, still counts)
+                    return False # abort early since string wasn't actually plucked
 
                 released_ticks_ms = event.timestamp # timestamp, in milliseconds, for the release of the string
                                 
-                pluck_ms = released_ticks_ms - self.pressed_ticks_ms # The duration of the pluck is the millisecond difference between the press and release of the string
-                # Note: unhandled overflow can occur here (empirically seen infrequently)
+                pluck_ms = ticks_diff(released_ticks_ms, pressed_ms) # The duration of the pluck is the millisecond difference between the press and release of the string, even across a wraparound of ticks_ms
                 
-                # Scale the MIDI note velocity by the duration of the pluck. Plucking faster will make a louder sound.
-                velocity = int(np.interp([pluck_ms], self.xp, self.yp)[0]) # Scale the velocity (arbitrary units of 0-127) to the pluck duration (milliseconds) using an interpolation function
-                
-                self.play(velocity=velocity) # play the sound by sending a MIDI message
+                played = self.play_pluck(pluck_ms * 1000 // self.tick_us, scale, released_ticks_ms) # play the sound by queueing a MIDI message
                 if self.debug:
-                    print("Pluck detected!")
                     print("Pluck duration (ms): {}".format(pluck_ms))
-                    print("Pluck velocity (0-127): {}".format(velocity))
+                return played
+        return False
+    
+    def check_and_play_us(self, event):
+        """ Handle a BeamCapture event for this string, like check_and_play(), but timing the pluck to the microsecond """
+        state, ix = self.state, self.index
+        if self.telemetry:
+            self.telemetry.event(ix, event.pressed, event.timestamp, event.timestamp_us)
+        if event.pressed:
+            state.pressed_ticks_us[ix] = event.timestamp_us
+            state.pressed_ticks_ms[ix] = event.timestamp # Watched for stuck beams (see health.py)
+            return False
+        pressed_us = state.pressed_ticks_us[ix]
+        state.pressed_ticks_us[ix] = NOT_PRESSED
+        state.pressed_ticks_ms[ix] = NOT_PRESSED
+        if self.health and self.health.stuck[ix]:
+            self.health.recover(ix) # Out of quarantine at once, so the next press counts (see health.py)
+            return False # The press was the stuck beam, not a pluck
+        if pressed_us == NOT_PRESSED: # string wasn't yet plucked
+            return False
+        
+        pluck_us = self.ticks_diff_us(event.timestamp_us, pressed_us)
+        played = self.play_pluck(pluck_us // self.tick_us, released_ms=event.timestamp, released_us=event.timestamp_us)
+        if self.debug:
+            print("Pluck duration (us): {}".format(pluck_us))
+        return played
+    
+    def play_pluck(self, pluck_ticks, scale=128, released_ms=0, released_us=0):
+        """ Play the note at the velocity for a pluck lasting pluck_ticks ticks of the velocity table, times scale / 128. Returns True if a note was queued.
+        With a strum detector, the note is held back instead, with the time the string was released at (released_ms,
+        and released_us from a BeamCapture), and False is returned. """
+        # Scale the MIDI note velocity by the duration of the pluck. Plucking faster will make a louder sound.
+        velocities = self.velocities # Velocity (arbitrary units of 0-127) for each pluck duration (ticks)
+        if pluck_ticks >= len(velocities):
+            velocity = velocities[-1] # Slower than the table covers; softest velocity
+        elif pluck_ticks < 0:
+            velocity = velocities[0]
+        else:
+            velocity = velocities[pluck_ticks]
+        if scale != 128:
+            velocity = max(1, velocity * scale >> 7) # A velocity of 0 would be a note off
+        
+        if self.strum_detector:
+            played = self.strum_detector.collect(self.index, released_ms, velocity, released_us) # Played when the strum window closes
+        else:
+            played = self.play(velocity=velocity)
+        if self.telemetry:
+            self.telemetry.pluck(self.index, velocity, pluck_ticks * self.tick_us)
+        if self.debug:
+            print("Pluck detected!")
+            print("Pluck velocity (0-127): {}".format(velocity))
+        return played
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
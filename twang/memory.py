@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+memory.py: Garbage collection policy for an allocation-free LightInstrument loop
+
+When CircuitPython's garbage collector runs in the middle of a strum, the notes stutter.
+With LightInstrument(zero_alloc=True), the loop allocates no memory while playing, and a GCPolicy:
+* Turns off automatic garbage collection as soon as the strings or chord buttons are played
+* Once nothing has happened for idle_ms, runs gc.collect() and turns automatic collection back on
+* Keeps running gc.collect() every idle_ms for as long as the instrument stays idle, so playing starts with a clear heap
+* Counts the bytes allocated by every loop pass, so the zero-allocation promise can be checked on the Pico
+
+While automatic collection is off, a full heap raises MemoryError instead of collecting, so it is only off while playing.
+Anything that allocates on every loop pass (asyncio, analog sensing, strum detection, telemetry) can't be used with zero_alloc.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+import gc
+from .stats import ticks_diff
+
+class GCPolicy:
+    """ Postpones garbage collection while the instrument is played, and counts allocations per loop pass """
+
+    def __init__(self, backend, idle_ms=250):
+        self.backend = backend # Provides ticks_ms() and mem_alloc()
+        self.idle_ms = idle_ms # Quiet time before garbage is collected; longer than the slowest pluck that changes velocity
+        self.collections = 0 # Number of idle-time garbage collections
+        self.playing = False # True while automatic collection is off
+        self.seen_event_ms = None
+        self.collected_ms = 0 # Timestamp of the latest idle-time collection
+        self.loop_start = 0
+        self.reset()
+
+    def reset(self):
+        """ Zero the allocation counters """
+        self.last_loop_bytes = 0 # Bytes allocated by the most recent loop pass
+        self.max_loop_bytes = 0 # Most bytes allocated by any loop pass
+        self.allocating_loops = 0 # Number of loop passes that allocated anything
+
+    def start(self, last_event_ms):
+        """ Collect once, leaving automatic collection on until the instrument is played """
+        gc.collect()
+        gc.enable()
+        self.playing = False
+        self.seen_event_ms = last_event_ms
+        self.collected_ms = self.backend.ticks_ms()
+
+    def stop(self):
+        """ Go back to automatic garbage collection """
+        gc.enable()
+
+    def begin(self):
+        """ Call at the start of a loop pass """
+        self.loop_start = self.backend.mem_alloc()
+
+    def end(self, last_event_ms):
+        """ Call at the end of a loop pass, with the timestamp of the latest string or chord event """
+        allocated = self.backend.mem_alloc() - self.loop_start
+        if allocated > 0:
+            self.allocating_loops += 1
+            if allocated > self.max_loop_bytes:
+                self.max_loop_bytes = allocated
+        self.last_loop_bytes = allocated
+
+        if last_event_ms != self.seen_event_ms:
+            self.seen_event_ms = last_event_ms # Something happened, so the instrument is being played
+            if not self.playing:
+                gc.disable()
+                self.playing = True
+            return
+        now = self.backend.ticks_ms()
+        if ticks_diff(now, last_event_ms) < self.idle_ms:
+            return
+        if self.playing or ticks_diff(now, self.collected_ms) >= self.idle_ms: # Collect on every idle interval, not just once per gap
+            gc.collect()
+            gc.enable() # Back to automatic collection while idle
+            self.playing = False
+            self.collected_ms = now
+            self.collections += 1
+
+    def report(self):
+        """ Returns a dictionary of the allocation and collection counters """
+        return {
+            "last_loop_bytes": self.last_loop_bytes,
+            "max_loop_bytes": self.max_loop_bytes,
+            "allocating_loops": self.allocating_loops,
+            "collections": self.collections,
+        }
+
+if __name__ == "__main__":
+    pass
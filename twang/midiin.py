@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+midiin.py: MIDI input, for reconfiguring a LightInstrument while it's being played
+
+With LightInstrument(midi_in=True), the instrument reads the USB MIDI input port (usb_midi.ports[0]) once per loop pass,
+taking at most max_bytes bytes each time, so a burst of incoming MIDI never holds up scanning for more than a few bytes' work.
+Nothing waits for input: if nothing has arrived, a pass costs one empty read. Messages on the instrument's MIDI channel do this:
+* ProgramChange: passed on to the synthesizer, e.g. to pick a new sound from a show controller
+* Control change TRANSPOSE_CC (20): transpose by value - 64 half-steps (64 is no transposition), for instruments with a Fretboard
+* Control change CAPO_CC (21): put the capo at fret value, for instruments with a Fretboard (see fretboard.py)
+* Control change VELOCITY_CC (22): switch to velocity curve number value, from LightInstrument(velocity_curves=[...])
+* SysEx F0 7D 54 01 ... F7: a compiled instrument (see config.py) with the same number of strings and chord buttons:
+  its chord table, velocity curve and MIDI program replace the instrument's own
+
+Every change is applied whole, between two passes of the instrument loop: a pluck is played with either the old notes
+or the new ones, never a mix, and beam events that arrive meanwhile wait in the keypad queue, so none are dropped.
+An upload that doesn't fit in max_sysex bytes, or doesn't match the instrument, is rejected and counted; the instrument
+carries on as it was.
+
+SysEx can only carry 7-bit bytes, so compiled instruments are packed 7 bytes to 8 (each group of up to 7 bytes is sent as
+a byte of their top bits, then their low 7 bits). On the computer:
+    python -m twang.midiin guitar.twang guitar.syx
+then send guitar.syx to the Pico (e.g. amidi -p hw:1 -s guitar.syx), or use to_sysex(data) from Python.
+
+Counters (see report()) give the bytes and messages read, the changes applied and rejected, and the most bytes read in a pass.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+SYSEX_ID = 0x7D # Non-commercial manufacturer ID
+SYSEX_TWANG = 0x54 # "T"
+SYSEX_UPLOAD = 0x01 # A compiled instrument follows
+SYSEX_HEADER = bytes((SYSEX_ID, SYSEX_TWANG, SYSEX_UPLOAD))
+
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+
+TRANSPOSE_CC = 20 # General purpose controllers, which synthesizers leave alone
+CAPO_CC = 21
+VELOCITY_CC = 22
+
+class MidiInput:
+    """ Non-blocking MIDI input parser, which reconfigures a LightInstrument between loop passes """
+
+    def __init__(self, port, channel=0, max_bytes=64, max_sysex=2048, debug=False):
+        self.port = port # Input port, e.g. usb_midi.ports[0]; anything with readinto(buffer, nbytes)
+        self.channel = channel # Only channel messages on this MIDI channel (0-15) are handled
+        self.max_bytes = max_bytes # Most bytes read in one loop pass
+        self.debug = debug
+        self.buf = bytearray(max_bytes)
+        self.sysex = bytearray(max_sysex) # SysEx message being received, after the F0
+        self.sysex_length = 0
+        self.in_sysex = False
+        self.sysex_overflow = False
+        self.status = 0 # Running status, or 0 while ignoring data bytes
+        self.data1 = -1 # First data byte of a two-byte message, or -1 if it hasn't arrived
+        self.reset()
+
+    def reset(self):
+        """ Zero the counters """
+        self.bytes_read = 0
+        self.messages = 0 # Complete messages on any channel
+        self.applied = 0 # Changes made to the instrument
+        self.rejected = 0 # Changes that couldn't be made (e.g. a transpose out of range, or an upload that didn't fit)
+        self.max_pass_bytes = 0 # Most bytes read in one pass
+
+    def service(self, instrument):
+        """ Read whatever has arrived, up to max_bytes, and apply any complete messages to the instrument """
+        count = self.port.readinto(self.buf, self.max_bytes)
+        if not count:
+            return
+        self.bytes_read += count
+        if count > self.max_pass_bytes:
+            self.max_pass_bytes = count
+        buf = self.buf
+        for ix in range(count):
+            byte = buf[ix]
+            if byte >= 0xF8:
+                continue # Real-time messages (clock, active sensing, ...) can turn up anywhere, even inside SysEx
+            if byte == SYSEX_START:
+                self.in_sysex = True
+                self.sysex_length = 0
+                self.sysex_overflow = False
+                self.status = 0
+            elif byte == SYSEX_END:
+                if self.in_sysex:
+                    self.in_sysex = False
+                    self.messages += 1
+                    self.sysex_message(instrument)
+            elif byte & 0x80:
+                self.in_sysex = False # Any other status byte ends a SysEx message early
+                self.status = byte if byte < 0xF0 else 0 # Only channel messages are handled
+                self.data1 = -1
+            elif self.in_sysex:
+                if self.sysex_length < len(self.sysex):
+                    self.sysex[self.sysex_length] = byte
+                    self.sysex_length += 1
+                else:
+                    self.sysex_overflow = True
+            elif self.status:
+                kind = self.status & 0xF0
+                if kind == PROGRAM_CHANGE or kind == 0xD0: # One data byte
+                    self.messages += 1
+                    self.channel_message(instrument, kind, self.status & 0x0F, byte, 0)
+                elif self.data1 < 0:
+                    self.data1 = byte
+                else:
+                    self.messages += 1
+                    data1 = self.data1
+                    self.data1 = -1 # Running status: the next data byte starts another message
+                    self.channel_message(instrument, kind, self.status & 0x0F, data1, byte)
+
+    def channel_message(self, instrument, kind, channel, data1, data2):
+        """ Apply a ProgramChange or a mapped control change """
+        if channel != self.channel:
+            return
+        try:
+            if kind == PROGRAM_CHANGE:
+                instrument.midi.program_change(data1)
+            elif kind == CONTROL_CHANGE and data1 == TRANSPOSE_CC:
+                instrument.set_transpose(data2 - 64)
+            elif kind == CONTROL_CHANGE and data1 == CAPO_CC:
+                instrument.set_capo(data2)
+            elif kind == CONTROL_CHANGE and data1 == VELOCITY_CC:
+                instrument.select_velocity_curve(data2)
+            else:
+                return # Not for us (e.g. notes from a keyboard)
+        except Exception as err:
+            self.rejected += 1
+            if self.debug:
+                print("MIDI input: {}".format(err))
+            return
+        self.applied += 1
+
+    def sysex_message(self, instrument):
+        """ Apply an uploaded compiled instrument """
+        sysex = self.sysex
+        if self.sysex_length < len(SYSEX_HEADER) or sysex[0] != SYSEX_ID or sysex[1] != SYSEX_TWANG:
+            return # Someone else's SysEx
+        if sysex[2] != SYSEX_UPLOAD or self.sysex_overflow:
+            self.rejected += 1
+            if self.debug:
+                print("MIDI input: SysEx upload is too long or not understood; max_sysex is {} bytes.".format(len(sysex)))
+            return
+        from .config import read_compiled # Only needed for uploads, so only imported when it's used
+        length = unpack_7bit(sysex, len(SYSEX_HEADER), self.sysex_length)
+        try:
+            instrument.apply_compiled(read_compiled(bytes(sysex[:length])))
+        except Exception as err:
+            self.rejected += 1
+            if self.debug:
+                print("MIDI input: {}".format(err))
+            return
+        self.applied += 1
+
+    def report(self):
+        """ Returns a dictionary of the MIDI input counters """
+        return {
+            "bytes_read": self.bytes_read,
+            "messages": self.messages,
+            "applied": self.applied,
+            "rejected": self.rejected,
+            "max_pass_bytes": self.max_pass_bytes,
+        }
+
+def unpack_7bit(buf, start, end):
+    """ Unpack the 7-bit groups in buf[start:end] into 8-bit bytes, in place from the start of buf; returns the unpacked length """
+    length = 0
+    ix = start
+    while ix < end:
+        top_bits = buf[ix]
+        ix += 1
+        for bit in range(7):
+            if ix >= end:
+                break
+            buf[length] = buf[ix] | (0x80 if top_bits & (1 << bit) else 0)
+            length += 1
+            ix += 1
+    return length
+
+### Packing, on the computer
+
+def pack_7bit(data):
+    """ Pack 8-bit bytes into 7-bit groups: a byte of the top bits of up to 7 bytes, then their low 7 bits """
+    out = bytearray()
+    for start in range(0, len(data), 7):
+        group = data[start:start + 7]
+        out.append(sum(1 << bit for bit in range(len(group)) if group[bit] & 0x80))
+        out.extend(byte & 0x7F for byte in group)
+    return bytes(out)
+
+def to_sysex(data):
+    """ A complete SysEx message uploading a compiled instrument (the bytes of a .twang file) """
+    return bytes((SYSEX_START,)) + SYSEX_HEADER + pack_7bit(data) + bytes((SYSEX_END,))
+
+if __name__ == "__main__":
+    # Turn a compiled instrument into a SysEx file
+    import sys
+    if len(sys.argv) != 3:
+        print("Usage: python -m twang.midiin <compiled.twang> <upload.syx>")
+        sys.exit(1)
+    with open(sys.argv[1], "rb") as file:
+        message = to_sysex(file.read())
+    with open(sys.argv[2], "wb") as file:
+        file.write(message)
+    print("Wrote {} bytes of SysEx to {}".format(len(message), sys.argv[2]))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+midiout.py: Batched MIDI output for LightInstruments
+
+Note messages from one pass of the instrument loop are encoded into a single preallocated bytearray,
+using MIDI running status, and written to the USB MIDI port all at once with flush().
+A strum across several strings then reaches the synthesizer as one burst instead of one USB write per string.
+
+Note-off messages are encoded as note-on messages with a velocity of zero (allowed by the MIDI spec),
+so that a whole strum shares one status byte.
+
+Several instruments can share one MidiOutput (and one USB write per burst), each through a MidiChannel of its own (see ensemble.py).
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+
+class MidiOutput:
+    """
+    Collects MIDI messages into a preallocated buffer and writes them to a port in one go.
+
+    The port can be any object with a write(buffer) method, e.g. usb_midi.ports[1].
+    """
+
+    def __init__(self, port, channel=0, size=96):
+        self.port = port # Output port, e.g. usb_midi.ports[1]
+        self.channel = channel # MIDI channel (0-15)
+        self.buf = bytearray(size) # Preallocated message buffer
+        self.views = [memoryview(self.buf)[:n] for n in range(size + 1)] # A ready-made view for every message length, so flushing doesn't allocate
+        self.length = 0 # Number of bytes waiting in the buffer
+        self.status = 0 # Running status: the last status byte written into the buffer (0 if none yet)
+        self.deferred = False # Always False: flush() writes right away (see MidiChannel)
+
+    def _message(self, status, data1, data2):
+        """ Append a three-byte channel message to the buffer, leaving out the status byte if it matches the running status """
+        if self.length + 3 > len(self.buf):
+            self.flush() # Out of room; send what we have so far
+        if status != self.status:
+            self.buf[self.length] = status
+            self.length += 1
+            self.status = status
+        self.buf[self.length] = data1 & 0x7F
+        self.buf[self.length + 1] = data2 & 0x7F
+        self.length += 2
+
+    def note_on(self, note, velocity=127):
+        """ Queue a NoteOn message """
+        self._message(NOTE_ON | self.channel, note, velocity)
+
+    def note_off(self, note):
+        """ Queue a NoteOff message (sent as a NoteOn with zero velocity, to keep the running status) """
+        self._message(NOTE_ON | self.channel, note, 0)
+
+    def program_change(self, program, channel=None):
+        """ Send a ProgramChange message right away (on channel, if given, instead of self.channel) """
+        self.flush()
+        self.buf[0] = PROGRAM_CHANGE | (self.channel if channel is None else channel)
+        self.buf[1] = program & 0x7F
+        self.length = 2
+        self.flush()
+
+    def flush(self):
+        """ Write all queued messages to the port in a single write, then empty the buffer """
+        if self.length:
+            self.port.write(self.views[self.length])
+            self.length = 0
+        self.status = 0 # Every burst starts with a full status byte
+
+class MidiChannel:
+    """
+    One MIDI channel of a shared MidiOutput, used by an instrument in place of an output of its own.
+    
+    Notes from every channel go into the shared buffer, and running status still applies between messages on the same channel.
+    """
+
+    def __init__(self, output, channel=0):
+        self.output = output # The shared "MidiOutput"
+        self.channel = channel # MIDI channel (0-15) of this instrument's messages
+        self.deferred = False # If True, flush() leaves the shared output alone, for its owner (e.g. an Ensemble) to flush once for every channel
+
+    @property
+    def length(self):
+        """ Number of bytes waiting in the shared buffer """
+        return self.output.length
+
+    def note_on(self, note, velocity=127):
+        """ Queue a NoteOn message """
+        self.output._message(NOTE_ON | self.channel, note, velocity)
+
+    def note_off(self, note):
+        """ Queue a NoteOff message (sent as a NoteOn with zero velocity) """
+        self.output._message(NOTE_ON | self.channel, note, 0)
+
+    def program_change(self, program):
+        """ Send a ProgramChange message on this channel right away """
+        self.output.program_change(program, channel=self.channel)
+
+    def flush(self):
+        """ Write everything queued on the shared output, from every channel (unless deferred) """
+        if not self.deferred:
+            self.output.flush()
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+power.py: Low-power idle mode for battery-powered LightInstruments
+
+With LightInstrument(idle_s=...), once nothing has happened on the strings or chord buttons for idle_s seconds,
+an IdlePolicy puts the instrument to sleep until someone plays it again:
+* The keypad scanners are stopped, and the Pico goes into light sleep (alarm.light_sleep_until_alarms)
+* Pressing a chord button wakes it straight away (an alarm.pin.PinAlarm on every chord button pin)
+* The light source is switched off while sleeping. Every sleep_ms, the Pico wakes, turns on the light source
+  for probe_ms, and checks whether any beam is broken. This drops the beam duty cycle to
+  probe_ms / (sleep_ms + probe_ms), about 20% with the defaults.
+* With beam_in_sleep=True, the light source stays on instead, and the string pins are wake sources too,
+  so a pluck wakes the Pico straight away (saves less power, but wakes faster).
+
+Wake latency, from the first touch to full-speed scanning:
+* Chord button, or string with beam_in_sleep=True: leaving light sleep (about 1 ms) plus one keypad scan (10 ms)
+* String with the light source off: at most sleep_ms + probe_ms (130 ms with the defaults), for a beam that is held
+  broken until a probe sees it. A quick pluck can fall between probes and be missed, so wake the instrument by
+  resting a finger in a beam or pressing a chord button.
+The pluck that wakes the instrument may sound a little louder than usual, since the start of the pluck happens while asleep.
+
+Pin wake sources only work for strings and chord buttons wired straight to digital pins; a StringBank, AnalogStrings or ChordMatrix
+is only checked by probing.
+
+Counters (see report()) give the time spent awake, asleep and with the light source on, so that average current can be
+estimated with average_current_ma(), and the time from waking to the first note sent.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from .stats import ticks_diff
+
+class IdlePolicy:
+    """ Puts an idle LightInstrument into light sleep, and wakes it when it's played """
+
+    def __init__(self, backend, idle_s=60, sleep_ms=100, probe_ms=30, settle_ms=5, beam_in_sleep=False):
+        self.backend = backend # Provides ticks_ms(), sleep() and light_sleep()
+        self.idle_ms = int(idle_s * 1000) # Time with no events before going to sleep
+        self.sleep_ms = sleep_ms # Light sleep between probes
+        self.probe_ms = probe_ms # Time the light source is on while checking for broken beams; longer than two keypad scans
+        self.settle_ms = settle_ms # Time for the light source and phototransistors to settle before scanning
+        self.beam_in_sleep = beam_in_sleep # Keep the light source on while asleep, and wake on string pins too
+        self.woke_ms = None # When the instrument last woke, until its first note is sent
+        self.reset()
+
+    def reset(self):
+        """ Zero all counters """
+        self.sleeps = 0 # Number of times the instrument went to sleep
+        self.asleep_ms = 0 # Total time spent sleeping (including probes)
+        self.idle_beam_ms = 0 # Time the light source was on while sleeping
+        self.started_ms = self.backend.ticks_ms()
+        self.last_wake_to_note_ms = 0 # Time from the latest wake to the first note sent
+        self.max_wake_to_note_ms = 0
+
+    def check(self, instrument):
+        """ Call regularly from the instrument loop; sleeps if the instrument has been idle for long enough """
+        if instrument.scheduler and instrument.scheduler.pending:
+            return # Don't sleep through deferred notes (e.g. a note-off at the end of a sustain)
+        if ticks_diff(self.backend.ticks_ms(), instrument.last_event_ms) >= self.idle_ms:
+            self.sleep(instrument)
+
+    def noted(self):
+        """ Call when notes have been sent, to time the first note after waking """
+        if self.woke_ms is not None:
+            elapsed = ticks_diff(self.backend.ticks_ms(), self.woke_ms)
+            self.last_wake_to_note_ms = elapsed
+            if elapsed > self.max_wake_to_note_ms:
+                self.max_wake_to_note_ms = elapsed
+            self.woke_ms = None
+
+    def sleep(self, instrument):
+        """ Sleep until a chord button is pressed or a beam is broken; returns with the instrument scanning at full speed """
+        backend = self.backend
+        beam = instrument.beam
+        start_ms = backend.ticks_ms()
+        self.sleeps += 1
+        if instrument.debug:
+            print("No one is playing; going to sleep.")
+
+        instrument.release_scanners() # Frees the pins for pin alarms
+        wake_pins = instrument.wake_pins(strings=self.beam_in_sleep)
+        while True:
+            if beam:
+                beam.value = self.beam_in_sleep
+            if backend.light_sleep(self.sleep_ms / 1000, wake_pins):
+                break # Woken by a pin
+            if not self.beam_in_sleep and self.probe(instrument):
+                break # A beam is broken
+
+        if beam:
+            beam.value = True
+        instrument.make_scanners()
+        now = backend.ticks_ms()
+        asleep = ticks_diff(now, start_ms)
+        self.asleep_ms += asleep
+        if self.beam_in_sleep:
+            self.idle_beam_ms += asleep
+        instrument.last_event_ms = now # Start a new idle period
+        self.woke_ms = now
+        if instrument.debug:
+            print("Waking up after {} ms.".format(asleep))
+
+    def probe(self, instrument):
+        """ Turn on the light source briefly; returns True if any beam is broken """
+        backend = self.backend
+        beam = instrument.beam
+        start_ms = backend.ticks_ms()
+        if beam:
+            beam.value = True
+        backend.sleep(self.settle_ms / 1000)
+        keys = instrument.string_scanner() # keypad reports a press for every broken beam on its first scans
+        backend.sleep((self.probe_ms - self.settle_ms) / 1000)
+        broken = False
+        event = instrument.event
+        health = instrument.health
+        while keys.events.get_into(event):
+            if event.pressed and not (health and health.stuck[event.key_number]): # A stuck beam isn't someone playing
+                broken = True
+        keys.deinit()
+        if beam:
+            beam.value = False
+            self.idle_beam_ms += ticks_diff(backend.ticks_ms(), start_ms)
+        return broken
+
+    def report(self):
+        """ Returns a dictionary of the idle counters """
+        return {
+            "sleeps": self.sleeps,
+            "total_ms": ticks_diff(self.backend.ticks_ms(), self.started_ms),
+            "asleep_ms": self.asleep_ms,
+            "idle_beam_ms": self.idle_beam_ms,
+            "last_wake_to_note_ms": self.last_wake_to_note_ms,
+            "max_wake_to_note_ms": self.max_wake_to_note_ms,
+        }
+
+    def average_current_ma(self, awake_ma, asleep_ma, beam_ma):
+        """ Estimated average current since the last reset, from the current drawn awake, asleep, and by the light source """
+        total_ms = ticks_diff(self.backend.ticks_ms(), self.started_ms)
+        if total_ms <= 0:
+            return awake_ma + beam_ma
+        awake_ms = total_ms - self.asleep_ms
+        beam_on_ms = awake_ms + self.idle_beam_ms # The light source is always on while awake
+        return (awake_ma * awake_ms + asleep_ma * self.asleep_ms + beam_ma * beam_on_ms) / total_ms
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scheduler.py: Timer wheel for deferred MIDI events
+
+A TimerWheel holds events to happen later: turning off a note once its sustain time is up, letting an old note ring
+for a string's release time after the string plays a new one, or playing the strings of a timed strum or an arpeggio.
+The instrument loop services it on every pass, and it never sleeps.
+
+The wheel has one slot per slot_ms milliseconds, for slots * slot_ms milliseconds (256 ms with the defaults);
+an event further ahead than that waits in its slot for as many turns of the wheel as it needs. Each slot is a linked list
+of events, threaded through preallocated arrays, so scheduling and cancelling cost the same however many events are
+pending, nothing is allocated, and a pass only looks at the slots whose time has come: hundreds of pending events
+don't slow down scanning.
+
+Event kinds:
+* NOTE_OFF: the end of a string's sustain; turn off note arg, played by string value, which forgets the note once it's off
+* RELEASE: the end of a note's release time; turn off note arg, which started in epoch value (see voices.py)
+* PLAY: play string arg (at its note at that time) with velocity value
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+from .stats import ticks_diff
+from .state import NOTE_OFF, PLAY, RELEASE
+
+NONE = 0 # A cancelled event, freed when its slot comes up
+
+class TimerWheel:
+    """ Hashed timer wheel of deferred events, each handed to fire(kind, arg, value) when it's due """
+
+    def __init__(self, backend, fire, slots=64, slot_ms=4, max_events=256):
+        self.backend = backend # Provides ticks_ms()
+        self.fire = fire # Called with (kind, arg, value) for every event that comes due
+        self.slots = slots
+        self.slot_ms = slot_ms
+        self.kinds = bytearray(max_events)
+        self.args = array("h", [0] * max_events)
+        self.values = array("h", [0] * max_events)
+        self.due_ms = array("l", [0] * max_events)
+        self.links = array("h", [ix + 1 for ix in range(max_events)]) # Next event in the same slot, or in the free list
+        self.links[max_events - 1] = -1
+        self.heads = array("h", [-1] * slots) # First event in each slot
+        self.free = 0 # First unused event
+        self.pending = 0 # Events scheduled and not yet fired or freed
+        self.tick = backend.ticks_ms() // slot_ms # Latest slot time serviced
+        self.reset()
+
+    def reset(self):
+        """ Zero the counters """
+        self.fired = 0 # Events fired
+        self.max_pending = 0 # Most events pending at once
+        self.overflows = 0 # Events that couldn't be scheduled because every event was in use
+
+    def schedule(self, delay_ms, kind, arg, value=0):
+        """ Schedule an event delay_ms from now; returns its id (for cancel()), or -1 if there's no room """
+        ev = self.free
+        if ev < 0:
+            self.overflows += 1
+            return -1
+        self.free = self.links[ev]
+        due = self.backend.ticks_ms() + delay_ms
+        self.kinds[ev] = kind
+        self.args[ev] = arg
+        self.values[ev] = value
+        self.due_ms[ev] = due
+        slot = (due // self.slot_ms) % self.slots
+        self.links[ev] = self.heads[slot]
+        self.heads[slot] = ev
+        self.pending += 1
+        if self.pending > self.max_pending:
+            self.max_pending = self.pending
+        return ev
+
+    def cancel(self, ev):
+        """ Cancel a pending event, by its id from schedule() (once an event has fired, its id is reused) """
+        self.kinds[ev] = NONE
+
+    def service(self):
+        """ Fire every event that is due; call on every pass of the instrument loop """
+        now = self.backend.ticks_ms()
+        now_tick = now // self.slot_ms
+        ticks = now_tick - self.tick
+        if ticks < 0 or ticks >= self.slots:
+            ticks = self.slots - 1 # ticks_ms wrapped around, or the loop stalled for a whole turn: look at every slot once
+        # Look at each slot from the last one serviced (which may have later events in it) up to now,
+        # moving due events onto a list of their own, so that firing them can safely schedule more
+        first = last = -1
+        for tick in range(now_tick - ticks, now_tick + 1):
+            slot = tick % self.slots
+            prev = -1
+            ev = self.heads[slot]
+            while ev >= 0:
+                after = self.links[ev]
+                if self.kinds[ev] == NONE or ticks_diff(now, self.due_ms[ev]) >= 0:
+                    if prev < 0:
+                        self.heads[slot] = after
+                    else:
+                        self.links[prev] = after
+                    self.links[ev] = -1
+                    if last < 0:
+                        first = ev
+                    else:
+                        self.links[last] = ev
+                    last = ev
+                else:
+                    prev = ev # Not due yet (e.g. a later turn of the wheel)
+                ev = after
+        self.tick = now_tick
+
+        # Fire the due events in the order they were found, returning each to the free list
+        ev = first
+        while ev >= 0:
+            after = self.links[ev]
+            kind = self.kinds[ev]
+            self.links[ev] = self.free
+            self.free = ev
+            self.pending -= 1
+            if kind != NONE:
+                self.fired += 1
+                self.fire(kind, self.args[ev], self.values[ev])
+            ev = after
+
+    def report(self):
+        """ Returns a dictionary of the scheduler counters """
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "fired": self.fired,
+            "overflows": self.overflows,
+        }
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sim.py: Simulated hardware backend for running LightInstruments on a regular computer
+
+The SimBackend stands in for the Pi Pico (see hardware.py). It has:
+* A virtual millisecond clock, which only moves when you advance it
+* A script of beam breaks and button presses, played back as the clock advances
+* A MIDI sink that captures every byte the instrument writes
+
+A BeamCapture (see capture.py) is simulated by a SimCaptureMachine, which times beam changes to the microsecond,
+so scripted plucks can last fractions of a millisecond.
+
+For LightInstrument.run_async(), run sim.run_clock() as another task: every round of the tasks is one virtual millisecond,
+and async_sleep() waits in virtual time.
+
+monotonic_ns() uses this computer's real clock, so that code timings (e.g. in LoopStats) measure real work.
+mem_alloc() counts allocated memory blocks rather than bytes, and regular Python allocates in places CircuitPython doesn't,
+so allocation counts from the simulation are only a rough guide; check the zero-allocation loop on the Pico.
+
+Example:
+    sim = SimBackend()
+    strings = [LightString(pin="GP16", note=40), LightString(pin="GP17", note=45)]
+    guitar = LightInstrument(strings, backend=sim)
+    sim.pluck("GP16", at_ms=sim.ticks_ms() + 10, duration_ms=20)
+    sim.advance(50)
+    guitar.step()
+    print(sim.midi.data) # bytes sent to the synthesizer
+
+Created for the Twang library.
+"""
+
+import asyncio
+import sys
+from collections import deque
+from time import perf_counter_ns
+from .capture import CaptureKeys, COUNTER_MASK
+from .telemetry import decode
+
+class VirtualClock:
+    """ A millisecond clock that only moves when advanced """
+
+    def __init__(self, start_ms=0):
+        self.now_ms = start_ms
+
+    def ticks_ms(self):
+        return self.now_ms
+
+    def advance(self, ms):
+        self.now_ms += ms
+
+class SimEvent:
+    """ Stand-in for keypad.Event """
+
+    def __init__(self, key_number=0, pressed=True, timestamp=0):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+
+    @property
+    def released(self):
+        return not self.pressed
+
+    def __repr__(self):
+        return "<SimEvent: key_number {} {} at {} ms>".format(self.key_number, "pressed" if self.pressed else "released", self.timestamp)
+
+class SimEventQueue:
+    """ Stand-in for keypad.EventQueue """
+
+    def __init__(self, max_events=64):
+        self.max_events = max_events
+        self.queue = deque()
+        self.overflowed = False
+
+    def put(self, key_number, pressed, timestamp):
+        if len(self.queue) >= self.max_events:
+            self.overflowed = True
+            return
+        self.queue.append((key_number, pressed, timestamp))
+
+    def get(self):
+        if not self.queue:
+            return None
+        key_number, pressed, timestamp = self.queue.popleft()
+        return SimEvent(key_number, pressed, timestamp)
+
+    def get_into(self, event):
+        if not self.queue:
+            return False
+        event.key_number, event.pressed, event.timestamp = self.queue.popleft()
+        return True
+
+    def clear(self):
+        self.queue.clear()
+        self.overflowed = False
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __bool__(self):
+        return len(self.queue) > 0
+
+class SimKeys:
+    """ Stand-in for keypad.Keys; the SimBackend puts events into its queue as the script plays """
+
+    def __init__(self, pins, value_when_pressed=False, pull=True, interval=0.01, max_events=64, backend=None):
+        self.pins = tuple(pins)
+        self.key_numbers = {pin: ix for ix, pin in enumerate(self.pins)} # Key number of each pin, for set_pin()
+        self.key_count = len(self.pins)
+        self.interval = interval
+        self.events = SimEventQueue(max_events)
+        self.pressed = [False] * self.key_count
+        self.backend = backend
+        self.deinited = False
+        self.reset()
+
+    def set_pressed(self, key_number, pressed, timestamp):
+        if self.pressed[key_number] != pressed:
+            self.pressed[key_number] = pressed
+            self.events.put(key_number, pressed, int(timestamp)) # keypad timestamps are whole milliseconds
+
+    def reset(self):
+        """ Like keypad: assume every key is released, so keys that are held down report a new press """
+        self.pressed = [False] * self.key_count
+        if self.backend is not None:
+            for ix, pin in enumerate(self.pins):
+                if self.backend.levels.get(pin):
+                    self.set_pressed(ix, True, self.backend.ticks_ms())
+
+    def deinit(self):
+        self.deinited = True
+        if self.backend is not None and self in self.backend.scanners:
+            self.backend.scanners.remove(self)
+
+class SimCaptureMachine:
+    """ Stand-in for the rp2pio.StateMachine of a BeamCapture: pushes a (counter, sample) pair for every pin change,
+    copied into the background_read() ring as soon as it's pushed, like the real DMA """
+
+    FIFO_WORDS = 4 # Size of the real state machine's receive FIFO
+
+    def __init__(self, pins, value_when_pressed=False, backend=None):
+        self.pins = tuple(pins)
+        self.key_numbers = {pin: ix for ix, pin in enumerate(self.pins)} # Key number of each pin, for set_pin()
+        self.value_when_pressed = value_when_pressed
+        self.fifo = [] # Words pushed before background_read() starts
+        self.ring = None # The background_read() loop buffer
+        self.write_ix = 0 # Next word of the ring the "DMA" writes
+        self.rxstall = False # Set if the FIFO would have filled up, stalling the real state machine
+        self.deinited = False
+        self.backend = backend
+        self.sample = 0
+        for ix, pin in enumerate(self.pins):
+            pressed = backend.levels.get(pin, False) if backend is not None else False
+            self.sample |= (pressed == value_when_pressed) << ix
+        self.push(backend.ticks_ms() if backend is not None else 0) # Like the real program, report the first sample
+
+    def push(self, timestamp):
+        """ Push the counter (counting down once per microsecond) and the current sample """
+        ticks_us = int(round(timestamp * 1000)) & COUNTER_MASK
+        self.fifo += [COUNTER_MASK - ticks_us, self.sample]
+        if self.ring is not None:
+            self.drain()
+        elif len(self.fifo) > self.FIFO_WORDS:
+            self.rxstall = True
+
+    def drain(self):
+        """ Copy the FIFO into the ring, wrapping around at its end """
+        for word in self.fifo:
+            self.ring[self.write_ix] = word
+            self.write_ix = (self.write_ix + 1) % len(self.ring)
+        self.fifo.clear()
+
+    def background_read(self, loop):
+        self.ring = loop
+        self.write_ix = 0
+        self.drain()
+
+    def set_pressed(self, key_number, pressed, timestamp):
+        if pressed == self.value_when_pressed:
+            sample = self.sample | (1 << key_number)
+        else:
+            sample = self.sample & ~(1 << key_number)
+        if sample != self.sample:
+            self.sample = sample
+            self.push(timestamp)
+
+    def clear_rxfifo(self):
+        self.fifo.clear()
+        self.rxstall = False
+
+    def deinit(self):
+        self.deinited = True
+        if self.backend is not None and self in self.backend.scanners:
+            self.backend.scanners.remove(self)
+
+class SimPin:
+    """ Stand-in for a digitalio.DigitalInOut input """
+
+    def __init__(self, pin, value=True):
+        self.pin = pin
+        self.value = value
+
+    def deinit(self):
+        pass
+
+class SimAnalogPin:
+    """ Stand-in for an analogio.AnalogIn, reading the backend's light level for its pin """
+
+    def __init__(self, pin, backend):
+        self.pin = pin
+        self.backend = backend
+
+    @property
+    def value(self):
+        return self.backend.analog_level(self.pin)
+
+    def deinit(self):
+        pass
+
+class SimOutputPin:
+    """ Stand-in for a digitalio.DigitalInOut output, remembering when its value was changed """
+
+    def __init__(self, pin, clock):
+        self.pin = pin
+        self.clock = clock
+        self.history = [] # (ticks_ms, value) for every time the pin was set
+        self._value = False
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self.history.append((self.clock.ticks_ms(), value))
+
+    def deinit(self):
+        pass
+
+class MidiSink:
+    """ Stand-in for usb_midi.ports[1], capturing every byte written to it """
+
+    def __init__(self):
+        self.data = bytearray() # Every byte written so far
+        self.writes = 0 # Number of write() calls
+
+    def write(self, buf):
+        self.data.extend(buf)
+        self.writes += 1
+        return len(buf)
+
+    def clear(self):
+        self.data = bytearray()
+        self.writes = 0
+
+    def messages(self):
+        """ Decode the captured bytes into a list of (status, data1, data2) tuples, expanding running status """
+        messages = []
+        status = 0
+        ix = 0
+        data = self.data
+        while ix < len(data):
+            if data[ix] & 0x80:
+                status = data[ix]
+                ix += 1
+                if status >= 0xF0: # System messages are not used by Twang; skip their status byte
+                    continue
+            if status & 0xF0 in (0xC0, 0xD0): # One data byte
+                messages.append((status, data[ix], None))
+                ix += 1
+            else:
+                messages.append((status, data[ix], data[ix + 1]))
+                ix += 2
+        return messages
+
+class MidiSource:
+    """ Stand-in for usb_midi.ports[0]: bytes sent with send() are read back by readinto(), as they would arrive over USB """
+
+    def __init__(self):
+        self.data = bytearray() # Bytes sent and not yet read
+
+    def send(self, data):
+        self.data.extend(data)
+
+    def readinto(self, buf, nbytes=None):
+        count = min(len(self.data), len(buf) if nbytes is None else nbytes)
+        buf[:count] = self.data[:count]
+        del self.data[:count]
+        return count
+
+class SerialSink:
+    """ Stand-in for usb_cdc.data, capturing every byte written to it; with a capacity, takes at most that many bytes per write """
+
+    def __init__(self, capacity=None):
+        self.data = bytearray()
+        self.capacity = capacity
+        self.write_timeout = None
+
+    def write(self, buf):
+        n = len(buf) if self.capacity is None else min(len(buf), self.capacity)
+        self.data.extend(buf[:n])
+        return n
+
+    def frames(self):
+        """ Decode the captured telemetry frames (see telemetry.py) """
+        return decode(self.data)
+
+class SimBackend:
+    """ Simulated hardware backend: virtual clock, scripted beam breaks and button presses, and a MIDI sink """
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else VirtualClock()
+        self.midi = MidiSink()
+        self.midi_source = MidiSource() # MIDI input, for MidiInput
+        self.serial = SerialSink() # Telemetry frames
+        self.scanners = [] # SimKeys and SimCaptureMachines created by the instrument
+        self.inputs = {} # Input pins by pin name
+        self.outputs = {} # Output pins by pin name
+        self.script = [] # (ticks_ms, pin, pressed) entries, sorted by time
+        self.levels = {} # Whether each pin is pressed (beam broken) right now
+        self.light_sleeps = 0 # Number of calls to light_sleep()
+        self.analog_levels = {} # Analog readings set with set_analog(), by pin name
+        self.light_level = 50000 # Analog reading of an intact beam, unless set with set_analog()
+        self.dark_level = 5000 # Analog reading of a broken beam, unless set with set_analog()
+
+    ### Backend interface (see hardware.py)
+    def keys(self, pins, value_when_pressed=False, pull=True, interval=0.01, max_events=64):
+        keys = SimKeys(pins, value_when_pressed=value_when_pressed, pull=pull, interval=interval, max_events=max_events, backend=self)
+        self.scanners.append(keys)
+        return keys
+
+    def key_matrix(self, row_pins, column_pins, columns_to_anodes=True, interval=0.01, max_events=64):
+        """ Each key's "pin" is its (row pin, column pin) pair; key_number = row * number of columns + column, as in keypad.KeyMatrix """
+        return self.keys([(row, column) for row in row_pins for column in column_pins], interval=interval, max_events=max_events)
+
+    def shift_register_keys(self, clock, data, latch, key_count, value_to_latch=True, value_when_pressed=False, interval=0.01, max_events=64):
+        """ Each key's "pin" is a (data pin, key_number) pair """
+        return self.keys([(data, ix) for ix in range(key_count)], interval=interval, max_events=max_events)
+
+    def beam_capture(self, pins, value_when_pressed=False):
+        """ Scripted changes may be at fractional milliseconds (e.g. sim.pluck(pin, at_ms=100, duration_ms=2.5)), and are timed to the microsecond """
+        machine = SimCaptureMachine(pins, value_when_pressed=value_when_pressed, backend=self)
+        self.scanners.append(machine)
+        return CaptureKeys(machine, len(machine.pins), value_when_pressed=value_when_pressed, ticks_ms=self.ticks_ms)
+
+    def event(self):
+        return SimEvent()
+
+    def output_pin(self, pin):
+        dio = SimOutputPin(pin, self.clock)
+        self.outputs[pin] = dio
+        return dio
+
+    def input_pin(self, pin):
+        dio = SimPin(pin, value=True) # Pulled up; reads False while pressed
+        self.inputs[pin] = dio
+        return dio
+
+    def pin(self, name):
+        return name # Simulated pins are known by their names
+
+    def analog_input(self, pin):
+        return SimAnalogPin(pin, self)
+
+    def midi_port(self):
+        return self.midi
+
+    def midi_in_port(self):
+        return self.midi_source
+
+    def telemetry_port(self):
+        return self.serial
+
+    def ticks_ms(self):
+        return self.clock.ticks_ms()
+
+    def monotonic_ns(self):
+        return perf_counter_ns()
+
+    def mem_alloc(self):
+        return sys.getallocatedblocks()
+
+    def light_sleep(self, seconds, wake_pins=()):
+        """ Advance the clock by seconds, or until the next scripted press of one of wake_pins (returning True) """
+        self.light_sleeps += 1
+        now = self.clock.ticks_ms()
+        end_ms = now + int(seconds * 1000)
+        for at_ms, pin, pressed in self.script:
+            if at_ms > end_ms:
+                break
+            if pressed and pin in wake_pins:
+                self.advance(at_ms - now)
+                return True
+        self.advance(end_ms - now)
+        return False
+
+    async def async_sleep(self, seconds):
+        wake_ms = self.clock.ticks_ms() + int(seconds * 1000)
+        while True:
+            await asyncio.sleep(0)
+            if self.clock.ticks_ms() >= wake_ms:
+                break
+
+    async def run_clock(self, duration_ms):
+        """ Advance the virtual clock by one millisecond per round of asyncio tasks, for duration_ms milliseconds """
+        for ms in range(duration_ms):
+            await asyncio.sleep(0)
+            await asyncio.sleep(0) # A second yield lets tasks woken by an asyncio.Event run within the same millisecond, as on the Pico
+            self.advance(1)
+
+    def sleep(self, seconds):
+        self.advance(int(seconds * 1000))
+
+    ### Scripting
+    def schedule(self, at_ms, pin, pressed):
+        """ At time at_ms, press (break the beam of) or release the given pin """
+        self.script.append((at_ms, pin, pressed))
+        self.script.sort(key=lambda entry: entry[0])
+
+    def pluck(self, pin, at_ms, duration_ms=20):
+        """ Break the beam on pin at at_ms and restore it duration_ms later """
+        self.schedule(at_ms, pin, True)
+        self.schedule(at_ms + duration_ms, pin, False)
+
+    def strum(self, pins, at_ms, spacing_ms=5, duration_ms=20):
+        """ Pluck the given pins one after another, spacing_ms apart """
+        for ix, pin in enumerate(pins):
+            self.pluck(pin, at_ms + ix * spacing_ms, duration_ms=duration_ms)
+
+    def press(self, pin, at_ms, duration_ms=None):
+        """ Hold down a button (or break a beam) at at_ms, optionally letting go duration_ms later """
+        self.schedule(at_ms, pin, True)
+        if duration_ms is not None:
+            self.schedule(at_ms + duration_ms, pin, False)
+
+    def set_analog(self, pin, value):
+        """ Set the analog reading of pin (e.g. for a partly broken beam, or drifting light); None goes back to following its beam """
+        if value is None:
+            self.analog_levels.pop(pin, None)
+        else:
+            self.analog_levels[pin] = value
+
+    def analog_level(self, pin):
+        """ Analog reading of pin: dark_level while its beam is broken, otherwise light_level """
+        if pin in self.analog_levels:
+            return self.analog_levels[pin]
+        return self.dark_level if self.levels.get(pin) else self.light_level
+
+    def set_pin(self, pin, pressed, timestamp):
+        """ Apply a pin change immediately, wherever that pin is wired """
+        self.levels[pin] = pressed
+        for keys in self.scanners:
+            key_number = keys.key_numbers.get(pin)
+            if key_number is not None and not keys.deinited:
+                keys.set_pressed(key_number, pressed, timestamp)
+        if pin in self.inputs:
+            self.inputs[pin].value = not pressed
+
+    def advance(self, ms=1):
+        """ Move the virtual clock forward, applying every scripted change that comes due """
+        end_ms = self.clock.ticks_ms() + ms
+        while self.script and self.script[0][0] <= end_ms:
+            at_ms, pin, pressed = self.script.pop(0)
+            self.set_pin(pin, pressed, at_ms)
+        self.clock.now_ms = end_ms
+
+    def pending(self):
+        """ Number of scripted changes that haven't happened yet """
+        return len(self.script)
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+state.py: Packed per-string state for a LightInstrument
+
+Instead of every LightString carrying its own note, last note and press timestamp, an InstrumentState keeps
+each of these in one packed integer array, indexed by string number. LightStrings are thin views into it.
+
+Applying a chord copies a whole voicing into the notes array in one slice assignment,
+and whole-instrument operations (e.g. transposing) work on a single array.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+
+NOT_PRESSED = -1 # Press timestamp of a string whose beam isn't broken (keypad timestamps are never negative)
+STUCK = -2 # Press timestamp of a string quarantined with its beam stuck broken (see health.py)
+MUTED = -9999 # Note number of an unpluckable string
+
+# Kinds of deferred event, kept here so that strings can schedule them without importing the TimerWheel (see scheduler.py)
+NOTE_OFF = 1
+PLAY = 2
+RELEASE = 3
+
+class InstrumentState:
+    """ Current notes, last played notes and press timestamps for every string, in packed arrays """
+
+    def __init__(self, num_strings, notes=None):
+        self.num_strings = num_strings
+        self.notes = array("h", notes if notes is not None else [MUTED] * num_strings) # Note to play on the next pluck of each string
+        self.last_notes = array("h", [-1] * num_strings) # Note most recently played by each string (to stop when it's plucked again), or -1
+        self.pressed_ticks_ms = array("l", [NOT_PRESSED] * num_strings) # When each string's beam was broken, in ticks_ms
+        self.pressed_ticks_us = array("l", [NOT_PRESSED] * num_strings) # The same, in microseconds, for strings timed by a BeamCapture
+        self.pending_offs = array("h", [-1] * num_strings) # Scheduled note-off ending each string's sustain, or -1 (see scheduler.py)
+        self.last_epochs = bytearray(num_strings) # Epoch each string's last note started in (see voices.py)
+
+    def apply(self, notes):
+        """ Set the notes of every string at once, e.g. when changing chords """
+        if isinstance(notes, array) and len(notes) == self.num_strings:
+            self.notes[:] = notes # One copy for the whole instrument
+        else:
+            for ix in range(min(len(notes), self.num_strings)):
+                self.notes[ix] = notes[ix]
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+stats.py: Low-cost timing counters for the LightInstrument loop
+
+LoopStats keeps:
+* Loop iterations per second (measured over one-second windows) and the total iteration count
+* The longest stall between two loop passes, in milliseconds
+* A histogram of pluck-to-MIDI latency: the time from a string's keypad release timestamp to the MIDI write carrying its note
+* A histogram of how long chord changes take to handle, in microseconds
+* Whether the string event queue (or a BeamCapture's ring buffer) has overflowed, losing events or their timing
+
+Everything lives in fixed-size integer arrays that are allocated once, so recording a sample never allocates.
+Call report() whenever you want to read the numbers out.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+
+TICKS_PERIOD = 1 << 29 # supervisor.ticks_ms() wraps around after this many milliseconds
+TICKS_HALFPERIOD = TICKS_PERIOD >> 1
+
+def ticks_diff(end, start):
+    """ Millisecond difference end - start, correct across a wraparound of supervisor.ticks_ms() """
+    diff = (end - start) & (TICKS_PERIOD - 1)
+    if diff >= TICKS_HALFPERIOD:
+        diff -= TICKS_PERIOD # end is before start
+    return diff
+
+class LoopStats:
+    """ Counters for loop rate, loop stalls, pluck-to-MIDI latency and chord-change time """
+
+    def __init__(self, backend, max_pending=16, latency_bins=32, chord_bins=32, chord_bin_us=100):
+        self.backend = backend # Provides ticks_ms() and monotonic_ns()
+        self.chord_bin_us = chord_bin_us # Width of each chord-change histogram bin, in microseconds
+
+        self.latency_hist = array("L", [0] * latency_bins) # Bin i counts plucks that took i ms to reach MIDI; the last bin also counts anything slower
+        self.chord_hist = array("L", [0] * chord_bins) # Bin i counts chord changes that took i * chord_bin_us microseconds to handle
+        self.pending = array("l", [0] * max_pending) # Release timestamps of notes queued but not yet written
+        self.num_pending = 0
+        self.reset()
+
+    def reset(self):
+        """ Zero all counters """
+        for ix in range(len(self.latency_hist)):
+            self.latency_hist[ix] = 0
+        for ix in range(len(self.chord_hist)):
+            self.chord_hist[ix] = 0
+        self.num_pending = 0
+        self.iterations = 0 # Loop passes since the last reset
+        self.loops_per_second = 0 # Loop passes in the last complete one-second window
+        self.max_stall_ms = 0 # Longest time between two loop passes
+        self.max_latency_ms = 0 # Longest pluck-to-MIDI latency
+        self.max_chord_us = 0 # Longest chord change
+        self.events_overflowed = False # Set by the LightInstrument once its string event queue reports an overflow
+        self.window_iterations = 0
+        self.last_loop_ms = self.window_start_ms = self.backend.ticks_ms()
+
+    def loop(self):
+        """ Record one pass of the instrument loop """
+        now = self.backend.ticks_ms()
+        stall = ticks_diff(now, self.last_loop_ms)
+        if stall > self.max_stall_ms:
+            self.max_stall_ms = stall
+        self.last_loop_ms = now
+        self.iterations += 1
+        self.window_iterations += 1
+        elapsed = ticks_diff(now, self.window_start_ms)
+        if elapsed >= 1000:
+            self.loops_per_second = self.window_iterations * 1000 // elapsed
+            self.window_iterations = 0
+            self.window_start_ms = now
+
+    def queued(self, event_ms):
+        """ Record that a note was queued for a string event that happened at event_ms """
+        if self.num_pending < len(self.pending):
+            self.pending[self.num_pending] = event_ms
+            self.num_pending += 1
+
+    def flushed(self):
+        """ Record that all queued notes were just written to MIDI """
+        if not self.num_pending:
+            return
+        now = self.backend.ticks_ms()
+        last_bin = len(self.latency_hist) - 1
+        for ix in range(self.num_pending):
+            latency = ticks_diff(now, self.pending[ix])
+            if latency > self.max_latency_ms:
+                self.max_latency_ms = latency
+            self.latency_hist[min(max(latency, 0), last_bin)] += 1
+        self.num_pending = 0
+
+    def chord_changed(self, start_ns):
+        """ Record a chord change whose handling started at start_ns (from backend.monotonic_ns()) """
+        elapsed_us = (self.backend.monotonic_ns() - start_ns) // 1000
+        if elapsed_us > self.max_chord_us:
+            self.max_chord_us = elapsed_us
+        self.chord_hist[min(elapsed_us // self.chord_bin_us, len(self.chord_hist) - 1)] += 1
+
+    def report(self):
+        """ Returns a dictionary of the current counters """
+        return {
+            "iterations": self.iterations,
+            "loops_per_second": self.loops_per_second,
+            "max_stall_ms": self.max_stall_ms,
+            "max_latency_ms": self.max_latency_ms,
+            "latency_hist": list(self.latency_hist),
+            "max_chord_us": self.max_chord_us,
+            "chord_bin_us": self.chord_bin_us,
+            "chord_hist": list(self.chord_hist),
+            "events_overflowed": self.events_overflowed,
+        }
+
+    def __str__(self):
+        return "LoopStats: {} loops/s, max stall {} ms, max pluck latency {} ms, max chord change {} us, latency histogram (ms) {}{}".format(
+            self.loops_per_second, self.max_stall_ms, self.max_latency_ms, self.max_chord_us, list(self.latency_hist),
+            ", events overflowed" if self.events_overflowed else "")
+
+if __name__ == "__main__":
+    pass
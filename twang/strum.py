@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+strum.py: Strum gesture detection
+
+On its own, every LightString plays as soon as its beam is restored, at a velocity from its own pluck duration, so a strum
+comes out as several unrelated plucks: each string as loud as the hand happened to cross its beam. With a StrumDetector,
+LightInstrument(strum_detector=StrumDetector(...)) holds released strings back for one window instead:
+* The window opens at the first release, and closes window_ms later (or as soon as every string has been released, or a
+  string is released a second time)
+* If min_strings or more strings were released, and they are all next to one another, it's a strum: its direction
+  (down, from the first string, or up, from the last) and speed come from the release timestamps of the whole window,
+  in one vectorized pass with ulab, so a six-string strum costs about the same as a single pluck. With a BeamCapture
+  (see capture.py), these are the microsecond capture timestamps, kept to UNIT_US_CAPTURE; otherwise keypad's milliseconds
+* A strum's strings play, in the order they were strummed, at velocities set by shape:
+  "even" (all at the mean velocity of the strum's plucks), "accent" (the first string accent louder than the mean,
+  falling to accent softer for the last), or "pluck" (each string at the velocity of its own pluck)
+* Otherwise, each string plays on its own, at the velocity of its own pluck
+
+A strum plays as one chord, in one burst of MIDI. With spread_ms set, its strings are spaced out again instead, at the
+strum's own pace but at most spread_ms apart, and with humanize_ms set, each string after the first is also held back by a
+random 0 to humanize_ms milliseconds, through the instrument's TimerWheel (see scheduler.py).
+
+Holding releases back adds up to window_ms of latency to every pluck (20 ms by default), strummed or not: a shorter
+window responds faster but splits slow strums into plucks. A keypad scan takes 10 ms, so shorter windows than that
+hardly ever see more than one string.
+
+Counters (see report()) give the windows closed, strums played in each direction, plucks played on their own,
+and the speed (in strings per second) and direction of the latest strum.
+
+The window math makes small ulab arrays, so a strum detector doesn't fit with LightInstrument(zero_alloc=True).
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+from ._compat import numpy
+from .state import PLAY
+from .stats import ticks_diff
+
+SHAPES = ("even", "accent", "pluck")
+UNIT_US_CAPTURE = 10 # Resolution of release offsets from a BeamCapture's microsecond timestamps; a 20 ms window is 2000 units
+UNIT_US_KEYPAD = 1000 # Resolution of release offsets from keypad's millisecond timestamps
+MAX_OFFSET = 32767 # Release offsets are int16
+
+class StrumDetector:
+    """ Holds string releases back for one window, then plays them as a strum (if they were one) or as plucks """
+
+    def __init__(self, window_ms=20, min_strings=3, shape="even", accent=0.25, spread_ms=0, humanize_ms=0):
+        if shape not in SHAPES:
+            raise Exception("{} is not a strum velocity shape; choose from {}.".format(shape, ", ".join(SHAPES)))
+        if min_strings < 2:
+            raise Exception("A strum needs min_strings of at least 2.")
+        self.window_ms = window_ms # How long releases are held back, from the first release of a window
+        self.min_strings = min_strings # Fewest adjacent strings released in one window that make a strum
+        self.shape = shape # How the velocities of a strum's strings are set
+        self.accent = accent # With shape "accent": how much louder the first string is than the mean (0.25 is 25%)
+        self.spread_ms = spread_ms # If set, a strum's strings are spaced at its own pace, but at most this far apart
+        self.humanize_ms = humanize_ms # If set, each string after the first is held back a random 0 to humanize_ms more
+        if humanize_ms:
+            from random import randint # Only needed for humanized timing, so only imported when it's used
+            self.randint = randint
+        self.np = numpy()
+        self.instrument = None # "LightInstrument" the strings belong to, set by attach()
+        self.count = 0 # Releases in the open window
+        self.reset()
+
+    def attach(self, instrument):
+        """ Allocate the window for the instrument's strings, which are then played from close() """
+        n = instrument.num_strings
+        self.instrument = instrument
+        self.event_strings = array("h", [0] * n) # String of each release in the window, in the order they arrived
+        self.event_offsets = array("h", [0] * n) # Time from the start of the window to each release, in units of unit_us
+        self.event_velocities = bytearray(n) # Velocity of each release's own pluck
+        self.string_velocities = bytearray(n) # The same velocities, by string
+        self.string_offsets = array("h", [0] * n) # The same offsets, by string
+        self.in_window = bytearray(n) # 1 for every string released in the window
+        self.start_ms = 0 # Timestamp of the first release in the window
+        self.start_us = 0 # Its capture timestamp, with a BeamCapture
+        self.unit_us = UNIT_US_CAPTURE if instrument.capture else UNIT_US_KEYPAD
+        if instrument.capture:
+            from .capture import ticks_diff_us # Only needed with a BeamCapture, which has already imported it
+            self.ticks_diff_us = ticks_diff_us
+        if self.spread_ms or self.humanize_ms:
+            instrument.timer_wheel() # Spread or humanized strings are played through the instrument's TimerWheel
+        self.count = 0
+
+    def reset(self):
+        """ Zero the counters """
+        self.windows = 0 # Windows closed
+        self.down_strums = 0 # Strums from the first string towards the last
+        self.up_strums = 0 # Strums from the last string towards the first
+        self.plucks = 0 # Strings played on their own
+        self.strings_per_s = 0 # Speed of the latest strum (0 if all its strings were released in the same scan)
+        self.down = True # Direction of the latest strum
+
+    def collect(self, ix, released_ms, velocity, released_us=0):
+        """ Hold back the release of string ix at released_ms (and released_us, its capture timestamp with a BeamCapture),
+        with the velocity of its own pluck. Returns False, since nothing is queued yet. """
+        if self.count and self.in_window[ix]:
+            self.close() # Released again: the window can't be a single strum any more
+        if not self.count:
+            self.start_ms = released_ms
+            self.start_us = released_us
+        n = self.count
+        if self.unit_us == UNIT_US_KEYPAD:
+            offset = ticks_diff(released_ms, self.start_ms)
+        else:
+            offset = min(self.ticks_diff_us(released_us, self.start_us) // self.unit_us, MAX_OFFSET)
+        self.event_strings[n] = ix
+        self.event_offsets[n] = offset
+        self.event_velocities[n] = velocity
+        self.string_velocities[ix] = velocity
+        self.string_offsets[ix] = offset
+        self.in_window[ix] = 1
+        self.count = n + 1
+        if self.count == len(self.in_window):
+            self.close() # Every string is in
+        return False
+
+    def check(self):
+        """ Close the window if it has been open for window_ms """
+        if self.count and ticks_diff(self.instrument.backend.ticks_ms(), self.start_ms) >= self.window_ms:
+            self.close()
+
+    def close(self):
+        """ Play the releases in the window, as a strum or as plucks, and open a new window """
+        np, n = self.np, self.count
+        strings = np.frombuffer(self.event_strings, dtype=np.int16, count=n)
+        first, last = int(np.min(strings)), int(np.max(strings))
+        if n >= self.min_strings and last - first + 1 == n: # Every string of a run, each released once
+            offsets = np.frombuffer(self.event_offsets, dtype=np.int16, count=n)
+            velocities = np.frombuffer(self.event_velocities, dtype=np.uint8, count=n)
+            # A down strum reaches the low string numbers first, so string number and release time rise together
+            trend = np.sum((strings - np.mean(strings)) * (offsets - np.mean(offsets)))
+            span_us = int(np.max(offsets) - np.min(offsets)) * self.unit_us
+            self.play_strum(first, last, bool(trend >= 0), span_us, float(np.mean(velocities)))
+        else:
+            self.play_plucks()
+        self.windows += 1
+        for k in range(n):
+            self.in_window[self.event_strings[k]] = 0
+        self.count = 0
+
+    def play_strum(self, first, last, down, span_us, level):
+        """ Play strings first to last (or last to first, if not down) as one strum, whose strings were released over span_us """
+        n = last - first + 1
+        self.down = down
+        self.strings_per_s = (n - 1) * 1000000 // span_us if span_us else 0
+        if down:
+            self.down_strums += 1
+        else:
+            self.up_strums += 1
+        spacing_ms = min(span_us // 1000 // (n - 1), self.spread_ms)
+        top = level * (1 + self.accent) # With shape "accent": velocity of the first string, falling by step for each string after it
+        step = 2 * self.accent * level / (n - 1)
+        for k in range(n):
+            ix = first + k if down else last - k
+            if self.shape == "even":
+                velocity = int(level + 0.5)
+            elif self.shape == "accent":
+                velocity = int(top - k * step + 0.5)
+            else:
+                velocity = self.string_velocities[ix]
+            velocity = min(max(velocity, 1), 127) # A velocity of 0 would be a note off
+            delay_ms = k * spacing_ms
+            if self.humanize_ms and k:
+                delay_ms += self.randint(0, self.humanize_ms)
+            self.play(ix, velocity, delay_ms)
+
+    def play_plucks(self):
+        """ Play every release in the window on its own, in the order they arrived """
+        for k in range(self.count):
+            ix = self.event_strings[k]
+            self.play(ix, self.string_velocities[ix], 0)
+            self.plucks += 1
+
+    def play(self, ix, velocity, delay_ms):
+        """ Play string ix now, or delay_ms from now """
+        instrument = self.instrument
+        if delay_ms:
+            instrument.scheduler.schedule(delay_ms, PLAY, ix, velocity)
+        elif instrument.strings[ix].play(velocity=velocity) and instrument.stats:
+            instrument.stats.queued(self.start_ms + self.string_offsets[ix] * self.unit_us // 1000)
+
+    def report(self):
+        """ Returns a dictionary of the strum counters """
+        return {
+            "windows": self.windows,
+            "down_strums": self.down_strums,
+            "up_strums": self.up_strums,
+            "plucks": self.plucks,
+            "strings_per_s": self.strings_per_s,
+            "down": self.down,
+        }
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+telemetry.py: Binary telemetry stream for LightInstruments, and a decoder for the computer end
+
+print() in the middle of the instrument loop blocks on the serial console for milliseconds, which distorts the very
+timing you're trying to watch. With LightInstrument(telemetry=True), the loop instead records fixed-size binary frames
+into a preallocated ring buffer (a few microseconds each), and once per loop pass writes as many frames as the USB serial port
+will take without waiting, to the second USB serial port, usb_cdc.data. If the computer isn't reading, frames are dropped
+(and counted), never waited for. A frame the port only took part of is finished on the next write, so the stream stays framed.
+Every write sends a slice of the ring buffer, which allocates a small memoryview, so telemetry doesn't fit with
+LightInstrument(zero_alloc=True).
+
+usb_cdc.data is turned off by default. To turn it on, add this to CIRCUITPY/boot.py, and reset the Pico:
+    import usb_cdc
+    usb_cdc.enable(console=True, data=True)
+
+Every frame is FRAME_SIZE (12) bytes, little-endian:
+    byte 0:     FRAME_START (0xA5), to find the frame boundaries
+    byte 1:     frame type
+    bytes 2-3:  a, b (unsigned bytes)
+    bytes 4-7:  timestamp, in ticks_ms (unsigned)
+    bytes 8-11: value (signed)
+
+Frame types:
+* EVENT:   a string's beam broke (b=1) or came back (b=0); a is the string, value is timestamp_us for a BeamCapture (else 0)
+* PLUCK:   a string played; a is the string, b the velocity, value the pluck duration in microseconds
+* CHORD:   the chord changed; a is the chord voicing (0 for the open chord), value is the bitmask of pressed buttons
+* STATS:   once a second, with LightInstrument(stats=True); a is the longest loop stall (ms), b the longest pluck-to-MIDI latency (ms),
+           value is loops per second
+* DROPPED: value frames were dropped because the ring buffer was full
+* OVERFLOW: with LightInstrument(stats=True), sent once when the string event queue (or a BeamCapture's ring buffer) overflows
+
+On the computer, decode a saved stream (or read the port directly) with:
+    python -m twang.telemetry /dev/ttyACM1 > telemetry.csv
+or, from Python, decode(data) for a list of frames, to_csv(frames, file), or to_numpy(frames) for a numpy structured array.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from .stats import ticks_diff
+
+FRAME_SIZE = 12
+FRAME_START = 0xA5
+
+EVENT = 1
+PLUCK = 2
+CHORD = 3
+STATS = 4
+DROPPED = 5
+OVERFLOW = 6
+FRAME_TYPES = {EVENT: "event", PLUCK: "pluck", CHORD: "chord", STATS: "stats", DROPPED: "dropped", OVERFLOW: "overflow"}
+
+STATS_INTERVAL_MS = 1000
+
+class Telemetry:
+    """ Ring buffer of binary frames, written to a serial port without blocking """
+
+    def __init__(self, backend, port, frames=256):
+        self.backend = backend # Provides ticks_ms()
+        self.port = port # e.g. usb_cdc.data; None to count frames without sending them anywhere
+        if port is not None and hasattr(port, "write_timeout"):
+            port.write_timeout = 0 # write() sends what fits and returns right away
+        self.buf = bytearray(frames * FRAME_SIZE)
+        self.view = memoryview(self.buf) # Sliced to send each contiguous run of waiting frames in one write
+        self.num_frames = frames
+        self.head = 0 # Next frame to write into
+        self.count = 0 # Frames waiting to be sent
+        self.partial = 0 # Bytes of the oldest waiting frame already sent
+        self.frames_sent = 0
+        self.dropped = 0 # Frames dropped since the last DROPPED frame
+        self.total_dropped = 0
+        self.overflow_sent = False # True once an OVERFLOW frame has been recorded
+        self.last_stats_ms = backend.ticks_ms()
+
+    def frame(self, kind, a, b, timestamp, value):
+        """ Record one frame; drops it (and counts it) if the ring buffer is full """
+        if self.count >= self.num_frames:
+            self.dropped += 1
+            self.total_dropped += 1
+            return
+        buf = self.buf
+        ix = self.head * FRAME_SIZE
+        buf[ix] = FRAME_START
+        buf[ix + 1] = kind
+        buf[ix + 2] = a & 0xFF
+        buf[ix + 3] = b & 0xFF
+        buf[ix + 4] = timestamp & 0xFF
+        buf[ix + 5] = (timestamp >> 8) & 0xFF
+        buf[ix + 6] = (timestamp >> 16) & 0xFF
+        buf[ix + 7] = (timestamp >> 24) & 0xFF
+        buf[ix + 8] = value & 0xFF
+        buf[ix + 9] = (value >> 8) & 0xFF
+        buf[ix + 10] = (value >> 16) & 0xFF
+        buf[ix + 11] = (value >> 24) & 0xFF
+        self.head += 1
+        if self.head == self.num_frames:
+            self.head = 0
+        self.count += 1
+
+    def event(self, string, pressed, timestamp, timestamp_us=0):
+        self.frame(EVENT, string, 1 if pressed else 0, timestamp, timestamp_us)
+
+    def pluck(self, string, velocity, duration_us):
+        self.frame(PLUCK, string, velocity, self.backend.ticks_ms(), duration_us)
+
+    def chord(self, voicing, mask):
+        self.frame(CHORD, voicing, 0, self.backend.ticks_ms(), mask)
+
+    def stats(self, stats):
+        """ Record a STATS frame from a LoopStats, once every STATS_INTERVAL_MS, and an OVERFLOW frame once its events overflow """
+        now = self.backend.ticks_ms()
+        if stats.events_overflowed and not self.overflow_sent:
+            self.overflow_sent = True
+            self.frame(OVERFLOW, 0, 0, now, 0)
+        if ticks_diff(now, self.last_stats_ms) >= STATS_INTERVAL_MS:
+            self.last_stats_ms = now
+            self.frame(STATS, min(stats.max_stall_ms, 255), min(stats.max_latency_ms, 255), now, stats.loops_per_second)
+
+    def flush(self):
+        """ Send as many waiting frames as the port will take right now, without waiting for it.
+        The waiting frames are at most two runs of the ring buffer (the second when they wrap around), each sent with one write. """
+        if self.dropped and self.count < self.num_frames:
+            dropped = self.dropped
+            self.dropped = 0
+            self.frame(DROPPED, 0, 0, self.backend.ticks_ms(), dropped)
+        if self.port is None:
+            return
+        while self.count:
+            tail = self.head - self.count # Oldest waiting frame
+            if tail < 0:
+                tail += self.num_frames
+            run = min(self.count, self.num_frames - tail) # Waiting frames up to the end of the buffer; the rest (if any) wrap around to the start
+            start = tail * FRAME_SIZE + self.partial # Resume partway into a frame the port only took part of
+            length = run * FRAME_SIZE - self.partial
+            written = self.port.write(self.view[start:start + length])
+            if written is None:
+                written = length # Ports that don't report how much they wrote write everything
+            if not written:
+                return # The port is full (or nothing is listening); try again next pass
+            # A partly sent frame stays waiting (so it isn't overwritten), and its rest is sent next time
+            written += self.partial
+            sent = written // FRAME_SIZE
+            self.partial = written % FRAME_SIZE
+            self.count -= sent
+            self.frames_sent += sent
+            if sent < run:
+                return
+
+    def report(self):
+        """ Returns a dictionary of the telemetry counters """
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_waiting": self.count,
+            "frames_dropped": self.total_dropped,
+        }
+
+### Decoding, on the computer
+
+def decode(data):
+    """ Decode a telemetry stream into a list of (type name, a, b, timestamp, value) tuples, skipping anything damaged """
+    frames = []
+    ix = 0
+    end = len(data) - FRAME_SIZE
+    while ix <= end:
+        if data[ix] != FRAME_START or data[ix + 1] not in FRAME_TYPES:
+            ix += 1 # Not at a frame boundary (e.g. after a partly sent frame); look for the next one
+            continue
+        timestamp = int.from_bytes(data[ix + 4:ix + 8], "little")
+        value = int.from_bytes(data[ix + 8:ix + 12], "little", signed=True)
+        frames.append((FRAME_TYPES[data[ix + 1]], data[ix + 2], data[ix + 3], timestamp, value))
+        ix += FRAME_SIZE
+    return frames
+
+def to_csv(frames, file):
+    """ Write decoded frames to an open text file as CSV """
+    file.write("type,a,b,timestamp,value\n")
+    for frame in frames:
+        file.write("{},{},{},{},{}\n".format(*frame))
+
+def to_numpy(frames):
+    """ Decoded frames as a numpy structured array, with fields type, a, b, timestamp and value """
+    import numpy as np # Only on the computer
+    dtype = [("type", "U8"), ("a", "u1"), ("b", "u1"), ("timestamp", "u4"), ("value", "i4")]
+    return np.array(frames, dtype=dtype)
+
+if __name__ == "__main__":
+    # Decode a saved stream, or read a serial port until Ctrl-C, and print CSV
+    import sys
+    if len(sys.argv) != 2:
+        print("Usage: python -m twang.telemetry <saved stream or serial port>")
+        sys.exit(1)
+    data = bytearray()
+    try:
+        with open(sys.argv[1], "rb", buffering=0) as stream:
+            while True:
+                chunk = stream.read(4096)
+                if not chunk:
+                    break
+                data.extend(chunk)
+    except KeyboardInterrupt:
+        pass
+    to_csv(decode(data), sys.stdout)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+velocity.py: Velocity curves, mapping pluck duration to MIDI velocity
+
+A quick pluck (the beam is broken only briefly) is loud, and a slow pluck is soft.
+A VelocityCurve is compiled once, at boot, into a lookup table with one byte per tick of pluck duration.
+A tick is tick_us microseconds: one millisecond for keypad-scanned strings, and less for a BeamCapture (see capture.py).
+Strings look up their velocity in this table, so playing a note needs no floating-point math.
+
+Curve shapes:
+* "log": velocity falls off with the logarithm of the pluck duration (the default)
+* "linear": velocity falls off in proportion to the pluck duration
+* "exponential": velocity falls off quickly for short plucks, then levels out
+* A function: shape(pluck_ms) returns the velocity (0-127) for a pluck duration in milliseconds
+* A list of (pluck_ms, velocity) points, interpolated linearly between points
+* A bytes or bytearray: an already compiled table, one velocity per tick (e.g. loaded from a compiled instrument, see config.py)
+
+Sensitivity scales how hard you need to pluck: with sensitivity=2, a 40 ms pluck sounds like a 20 ms pluck would at sensitivity=1.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from math import log, exp
+
+EXPONENTIAL_RATE = 4 # Steepness of the "exponential" curve
+
+class VelocityCurve:
+    """ Lookup table from pluck duration (in ticks of tick_us microseconds) to MIDI velocity """
+
+    def __init__(self, shape="log", sensitivity=1.0, min_ms=10, max_ms=200, loud=127, soft=30, tick_us=1000):
+        if sensitivity <= 0:
+            raise Exception("Velocity sensitivity must be greater than zero.")
+        if tick_us < 1:
+            raise Exception("Velocity table ticks must be at least 1 microsecond.")
+        self.shape = shape
+        self.sensitivity = sensitivity
+        self.min_ms = min_ms # Plucks this quick, or quicker, are played at the "loud" velocity
+        self.max_ms = max_ms # Plucks this slow, or slower, are played at the "soft" velocity
+        self.loud = loud
+        self.soft = soft
+        self.tick_us = tick_us # Pluck duration covered by each table entry
+
+        if isinstance(shape, (bytes, bytearray)):
+            self.table = bytearray(shape) # Nothing to compile
+            return
+        if callable(shape):
+            curve = shape
+        elif isinstance(shape, (list, tuple)):
+            curve = self._interpolate(shape)
+        elif shape in ("log", "linear", "exponential"):
+            curve = self._named_curve(shape)
+        else:
+            raise Exception("Unknown velocity curve shape '{}'. Use 'log', 'linear', 'exponential', a function, a list of (pluck_ms, velocity) points, or a compiled table.".format(shape))
+
+        # One entry per tick, up to the slowest pluck that still changes the velocity
+        ticks_per_ms = 1000 / tick_us
+        length = int(max_ms * sensitivity * ticks_per_ms) + 1
+        if isinstance(shape, (list, tuple)):
+            length = int(max(point[0] for point in shape) * sensitivity * ticks_per_ms) + 1
+        self.table = bytearray(length)
+        for tick in range(length):
+            velocity = int(curve(tick / ticks_per_ms / sensitivity))
+            self.table[tick] = min(max(velocity, 0), 127)
+
+    def _named_curve(self, shape):
+        """ Returns a function of pluck duration for one of the built-in shapes """
+        min_ms, max_ms, loud, soft = self.min_ms, self.max_ms, self.loud, self.soft
+
+        def curve(ms):
+            ms = min(max(ms, min_ms), max_ms)
+            if shape == "log":
+                fraction = log(ms / min_ms) / log(max_ms / min_ms)
+            elif shape == "linear":
+                fraction = (ms - min_ms) / (max_ms - min_ms)
+            else:
+                fraction = (1 - exp(-EXPONENTIAL_RATE * (ms - min_ms) / (max_ms - min_ms))) / (1 - exp(-EXPONENTIAL_RATE))
+            return loud - (loud - soft) * fraction
+        return curve
+
+    @staticmethod
+    def _interpolate(points):
+        """ Returns a function that interpolates linearly between (pluck_ms, velocity) points """
+        points = sorted(points)
+
+        def curve(ms):
+            if ms <= points[0][0]:
+                return points[0][1]
+            for (x0, y0), (x1, y1) in zip(points, points[1:]):
+                if ms <= x1:
+                    return y0 + (y1 - y0) * (ms - x0) / (x1 - x0)
+            return points[-1][1]
+        return curve
+
+    def velocity(self, pluck_ms):
+        """ MIDI velocity for a pluck lasting pluck_ms milliseconds """
+        table = self.table
+        tick = int(pluck_ms * 1000 // self.tick_us)
+        if tick >= len(table):
+            return table[-1]
+        if tick < 0:
+            return table[0]
+        return table[tick]
+
+_default_curve = None
+
+def default_curve():
+    """ Returns the shared default VelocityCurve, creating it on first use """
+    global _default_curve
+    if _default_curve is None:
+        _default_curve = VelocityCurve()
+    return _default_curve
+
+if __name__ == "__main__":
+    pass
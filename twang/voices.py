@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+voices.py: Instrument-wide table of sounding notes
+
+On its own, a LightString turns off its last note whenever it plays, whether or not that note is still sounding,
+and even when another string is sounding the same pitch (cutting that string off too). A VoiceTable, shared by all
+strings of a LightInstrument, keeps count of how many strings hold each MIDI note, and:
+* Only sends a note-off once the last string holding a note lets go of it, so shared notes ring on
+* Doesn't send a note-off for a note that has already stopped (e.g. stolen, see below)
+* With max_polyphony set, keeps at most that many notes sounding: starting one more first turns off the oldest
+  ("voice stealing"), so the synthesizer never has more voices to mix than that
+
+The sounding notes are kept in the order they started as a doubly linked list threaded through the note numbers,
+so starting, stopping and stealing a note each cost the same however many notes are sounding.
+
+Each note has an epoch, which changes when the note is stolen. A string remembers the epoch its note started in,
+so when it lets go of a note that was stolen (and maybe started again by another string since), nothing is cut off.
+
+Counters (see report()) give the note-offs sent and skipped, the notes stolen, and the most notes sounding at once.
+
+Created for the Twang library, for use with the Pi Pico and CircuitPython.
+"""
+
+from array import array
+
+NUM_NOTES = 128
+NO_NOTE = -1 # End of the age order
+
+class VoiceTable:
+    """ Which MIDI notes are sounding, how many strings hold each one, and in what order they started """
+
+    def __init__(self, midi, max_polyphony=None):
+        if max_polyphony is not None and max_polyphony < 1:
+            raise Exception("max_polyphony must be at least 1.")
+        self.midi = midi # "MidiOutput" the notes are queued on
+        self.max_polyphony = max_polyphony if max_polyphony is not None else NUM_NOTES
+        self.holders = bytearray(NUM_NOTES) # Number of strings holding each note
+        self.epochs = bytearray(NUM_NOTES) # Changes every time a note is stolen
+        self.older = array("b", [NO_NOTE] * NUM_NOTES) # The note that started just before each sounding note
+        self.newer = array("b", [NO_NOTE] * NUM_NOTES) # The note that started just after it
+        self.oldest = NO_NOTE
+        self.newest = NO_NOTE
+        self.active = 0 # Number of notes sounding
+        self.reset()
+
+    def reset(self):
+        """ Zero the counters """
+        self.offs_sent = 0 # Note-offs sent
+        self.offs_skipped = 0 # Note-offs not sent, since the note was shared or had already stopped
+        self.steals = 0 # Notes turned off to make room for a new one
+        self.max_active = self.active # Most notes sounding at once
+
+    def _append(self, note):
+        """ Put note at the end of the age order, as the newest """
+        self.older[note] = self.newest
+        self.newer[note] = NO_NOTE
+        if self.newest == NO_NOTE:
+            self.oldest = note
+        else:
+            self.newer[self.newest] = note
+        self.newest = note
+        self.active += 1
+
+    def _remove(self, note):
+        """ Take note out of the age order """
+        older = self.older[note]
+        newer = self.newer[note]
+        if older == NO_NOTE:
+            self.oldest = newer
+        else:
+            self.newer[older] = newer
+        if newer == NO_NOTE:
+            self.newest = older
+        else:
+            self.older[newer] = older
+        self.active -= 1
+
+    def start(self, note, velocity):
+        """ Queue a note-on for one more holder of note; returns the note's epoch, for stop() """
+        if self.holders[note]:
+            self._remove(note) # Already sounding; it becomes the newest note again
+        elif self.active >= self.max_polyphony:
+            self.steal()
+        self._append(note)
+        if self.active > self.max_active:
+            self.max_active = self.active
+        if self.holders[note] < 255:
+            self.holders[note] += 1
+        self.midi.note_on(note, velocity=velocity)
+        return self.epochs[note]
+
+    def stop(self, note, epoch):
+        """ A holder lets go of note, which it started in epoch; the note-off is only queued once nothing else holds it """
+        if not self.holders[note] or self.epochs[note] != epoch:
+            self.offs_skipped += 1 # Already stopped (e.g. stolen)
+            return
+        self.holders[note] -= 1
+        if self.holders[note]:
+            self.offs_skipped += 1 # Another string is still sounding it
+            return
+        self._remove(note)
+        self.midi.note_off(note)
+        self.offs_sent += 1
+
+    def steal(self):
+        """ Turn off the oldest sounding note, whoever holds it """
+        note = self.oldest
+        self._remove(note)
+        self.holders[note] = 0
+        self.epochs[note] = (self.epochs[note] + 1) & 0xFF
+        self.midi.note_off(note)
+        self.offs_sent += 1
+        self.steals += 1
+
+    def report(self):
+        """ Returns a dictionary of the voice counters """
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "offs_sent": self.offs_sent,
+            "offs_skipped": self.offs_skipped,
+            "steals": self.steals,
+        }
+
+if __name__ == "__main__":
+    pass